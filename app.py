@@ -1,29 +1,128 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, g, send_from_directory
 from flask_cors import CORS
 from chatbot import WikiChatbot
 from config import Config
+from db_connector import WikiDBConnector
+from index_wiki import fetch_pages, build_index
+from profiling import RequestProfiler
+from serve_web import StaticPage
+from functools import wraps
+import circuit_breaker
+import metrics
+import hmac
+import json
+import threading
+import time
 import traceback
 
 app = Flask(__name__)
 CORS(app)
 
-# Initialize chatbot
-print("Initializing chatbot...")
 chatbot = None
 
-try:
-    chatbot = WikiChatbot()
-    print("Chatbot initialized successfully")
-except Exception as e:
-    print(f"Error initializing chatbot: {e}")
-    traceback.print_exc()
+def init_chatbot(bot: WikiChatbot = None):
+    """Create the chatbot, or install one built elsewhere (e.g. the benchmark stub server)"""
+    global chatbot
+    if bot is not None:
+        chatbot = bot
+        return
+    
+    print("Initializing chatbot...")
+    try:
+        chatbot = WikiChatbot()
+        print("Chatbot initialized successfully")
+    except Exception as e:
+        print(f"Error initializing chatbot: {e}")
+        traceback.print_exc()
+
+if Config.CHATBOT_AUTOINIT:
+    init_chatbot()
+
+# llama.cpp models are not thread-safe: generations take a slot, and requests
+# that can't get one within CHAT_QUEUE_TIMEOUT seconds get 429
+chat_slots = threading.BoundedSemaphore(Config.MAX_CONCURRENT_CHATS)
+
+def busy_response():
+    response = jsonify({
+        'error': 'Too many concurrent requests, try again later'
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, int(Config.CHAT_QUEUE_TIMEOUT)))
+    return response
+
+# On-demand profiles of single chat requests (X-Profile: 1 from an admin, or armed)
+profiler = RequestProfiler(Config.PROFILE_DIR, Config.PROFILE_MAX_PER_MINUTE, Config.PROFILE_SAMPLE_INTERVAL)
+
+HTTP_SECONDS = metrics.registry.histogram(
+    'wikichat_http_request_seconds', 'HTTP request latency by endpoint and status')
+CONTENT_CACHE = metrics.registry.counter(
+    'wikichat_content_cache_lookups_total', 'Page text cache lookups (result=hit|miss)')
+CONTENT_CACHE_SIZE = metrics.registry.gauge(
+    'wikichat_content_cache_entries', 'Decoded page texts in the cache')
+VECTOR_DOCUMENTS = metrics.registry.gauge(
+    'wikichat_vector_index_documents', 'Documents in the active vector index version')
+TITLE_INDEX_PAGES = metrics.registry.gauge(
+    'wikichat_title_index_pages', 'Pages in the in-memory title index')
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    start = getattr(g, 'request_start', None)
+    if start is not None:
+        HTTP_SECONDS.observe(time.perf_counter() - start,
+                             endpoint=request.endpoint or 'unknown',
+                             status=response.status_code)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus metrics endpoint"""
+    if chatbot:
+        # Values kept elsewhere are copied in at scrape time
+        cache = chatbot.db.content.get_stats()
+        CONTENT_CACHE.set_total(cache['hits'], result='hit')
+        CONTENT_CACHE.set_total(cache['misses'], result='miss')
+        CONTENT_CACHE_SIZE.set(cache['size'])
+        TITLE_INDEX_PAGES.set(len(chatbot.titles))
+        if chatbot.vector_store and chatbot.vector_store.collection:
+            try:
+                VECTOR_DOCUMENTS.set(chatbot.vector_store.count())
+            except Exception:
+                pass  # store down or slow: the gauge keeps its last value
+    
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+if Config.SERVE_UI:
+    # UI and API in one process; the page is rendered once and kept in memory
+    ui_page = StaticPage(api_port=Config.FLASK_PORT)
+    
+    @app.route('/', methods=['GET'])
+    @app.route('/index.html', methods=['GET'])
+    def index():
+        """Web interface (gzip, ETag)"""
+        status, headers, body = ui_page.respond(
+            request.headers.get('If-None-Match'),
+            request.headers.get('Accept-Encoding')
+        )
+        return Response(body, status=status, headers=headers)
 
 @app.route('/health', methods=['GET'])
 def health():
-    """Health check endpoint"""
+    """Health check endpoint
+    
+    'degraded' while a dependency's circuit breaker is open: chats are
+    still answered, from whatever retrieval still works.
+    """
+    dependencies = circuit_breaker.status_all()
+    degraded = any(dependency['state'] != 'closed' for dependency in dependencies.values())
     return jsonify({
-        'status': 'ok',
-        'chatbot_ready': chatbot is not None
+        'status': 'degraded' if degraded else 'ok',
+        'chatbot_ready': chatbot is not None,
+        'vector_search': bool(chatbot and chatbot.vector_store and chatbot.vector_ready),
+        'dependencies': dependencies
     })
 
 @app.route('/api/chat', methods=['POST'])
@@ -43,8 +142,36 @@ def chat():
                 'error': 'No question provided'
             }), 400
         
+        # Per-request stage timings on request ({"timings": true} or ?timings=1)
+        include_timings = bool(data.get('timings')) or request.args.get('timings') == '1'
+        
+        # Optional retrieval scope ({"categories": [...], "namespaces": [...]})
+        try:
+            filters = chatbot.make_filters(data.get('categories'), data.get('namespaces'))
+        except (TypeError, ValueError):
+            return jsonify({
+                'error': 'namespaces must be integers'
+            }), 400
+        
+        if not chat_slots.acquire(timeout=Config.CHAT_QUEUE_TIMEOUT):
+            return busy_response()
+        
+        if data.get('stream'):
+            response = Response(stream_chat(question, include_timings, filters), mimetype='application/x-ndjson')
+            # Slot is held until the last token is sent or the client goes away
+            response.call_on_close(chat_slots.release)
+            return response
+        
         # Get response from chatbot
-        response = chatbot.chat(question)
+        try:
+            if wants_profile():
+                response, profile = profiler.run(
+                    lambda: chatbot.chat(question, include_timings=include_timings, filters=filters), name='chat')
+                response['profile'] = profile
+            else:
+                response = chatbot.chat(question, include_timings=include_timings, filters=filters)
+        finally:
+            chat_slots.release()
         
         return jsonify(response)
     
@@ -55,9 +182,137 @@ def chat():
             'error': str(e)
         }), 500
 
+@app.route('/api/chat/batch', methods=['POST'])
+def chat_batch():
+    """Answer a list of questions, streaming one JSON line per answer and a summary"""
+    if not chatbot:
+        return jsonify({
+            'error': 'Chatbot not initialized'
+        }), 500
+    
+    data = request.get_json(silent=True) or {}
+    questions = data.get('questions')
+    if (not isinstance(questions, list) or not questions or
+            not all(isinstance(question, str) and question.strip() for question in questions)):
+        return jsonify({
+            'error': 'questions must be a non-empty list of questions'
+        }), 400
+    if len(questions) > Config.MAX_BATCH_QUESTIONS:
+        return jsonify({
+            'error': f'At most {Config.MAX_BATCH_QUESTIONS} questions per batch'
+        }), 413
+    
+    include_timings = bool(data.get('timings')) or request.args.get('timings') == '1'
+    try:
+        filters = chatbot.make_filters(data.get('categories'), data.get('namespaces'))
+    except (TypeError, ValueError):
+        return jsonify({
+            'error': 'namespaces must be integers'
+        }), 400
+    return Response(stream_batch(questions, include_timings, filters), mimetype='application/x-ndjson')
+
+def stream_batch(questions, include_timings: bool, filters=None):
+    """One JSON line per answer, then the summary
+    
+    A chat slot is taken per answer rather than for the whole batch, so
+    interactive chats get their turn between batch questions. A chunk's
+    retrieval runs in the slot of its first answer.
+    """
+    results = chatbot.chat_batch(questions, include_timings=include_timings, filters=filters)
+    try:
+        while True:
+            chat_slots.acquire()
+            try:
+                result = next(results, None)
+            finally:
+                chat_slots.release()
+            if result is None:
+                break
+            yield json.dumps(result) + '\n'
+    except Exception as e:
+        print(f"Batch chat error: {e}")
+        traceback.print_exc()
+        yield json.dumps({'type': 'error', 'error': str(e)}) + '\n'
+    finally:
+        results.close()
+
+def wants_profile() -> bool:
+    """Profile this request: X-Profile: 1 from an admin, or profiling armed by an admin"""
+    if request.headers.get('X-Profile') == '1' and is_admin():
+        return True
+    return profiler.take_armed()
+
+def stream_chat(question: str, include_timings: bool, filters=None):
+    """One JSON object per line: token events, then the full response"""
+    try:
+        for event in chatbot.chat_stream(question, include_timings=include_timings, filters=filters):
+            yield json.dumps(event) + '\n'
+    except Exception as e:
+        print(f"Chat error: {e}")
+        traceback.print_exc()
+        yield json.dumps({'type': 'error', 'error': str(e)}) + '\n'
+
+# Rows fetched per query when streaming /api/pages and /api/search
+PAGE_LIST_BATCH = 500
+SEARCH_BATCH = 100
+SNIPPET_CHARS = 200
+
+def stream_listing(head: dict, key: str, fetch, cursor, limit: int, batch_size: int):
+    """Stream a JSON object whose `key` list is sent batch by batch
+    
+    fetch(cursor, n) returns up to n (item, cursor) pairs after cursor, or
+    None on a database error. At most `limit` items are sent (0 = all) and
+    the object ends with count and next_cursor (null after the last item),
+    so memory stays constant however many items are listed.
+    """
+    prefix = json.dumps(head)[:-1] + (', ' if head else '')
+    yield prefix + json.dumps(key) + ': ['
+    count = 0
+    more = False
+    error = None
+    try:
+        while True:
+            # One extra row tells whether there is a next page
+            want = batch_size if not limit else min(batch_size, limit - count + 1)
+            rows = fetch(cursor, want)
+            if rows is None:
+                error = 'Database error'
+                break
+            for item, item_cursor in rows:
+                if limit and count == limit:
+                    more = True
+                    break
+                yield (', ' if count else '') + json.dumps(item)
+                count += 1
+                cursor = item_cursor
+            if more or len(rows) < want:
+                break
+    except Exception as e:
+        print(f"Listing error: {e}")
+        traceback.print_exc()
+        error = str(e)
+    
+    tail = {'count': count, 'next_cursor': cursor if more else None}
+    if error:
+        tail['error'] = error
+    yield '], ' + json.dumps(tail)[1:]
+
+def parse_search_cursor(cursor):
+    """'relevance:page_id' -> (relevance, page_id); None stays None"""
+    if not cursor:
+        return None
+    relevance, page_id = cursor.split(':')
+    return int(relevance), int(page_id)
+
+def decode_title(page_title) -> str:
+    """page_title column to display title"""
+    if isinstance(page_title, bytes):
+        page_title = page_title.decode('utf-8', errors='ignore')
+    return page_title.replace('_', ' ')
+
 @app.route('/api/search', methods=['GET'])
 def search():
-    """Search wiki pages endpoint"""
+    """Search wiki pages endpoint (streamed, cursor-paginated)"""
     if not chatbot:
         return jsonify({
             'error': 'Chatbot not initialized'
@@ -66,50 +321,78 @@ def search():
     try:
         query = request.args.get('q', '')
         limit = int(request.args.get('limit', 10))
-        
-        if not query:
-            return jsonify({
-                'error': 'No query provided'
-            }), 400
-        
-        # Search pages
-        results = chatbot.db.search_pages(query, limit=limit)
+        cursor = request.args.get('cursor') or None
+        parse_search_cursor(cursor)
+        # ?category=A&category=B&namespace=0
+        filters = chatbot.make_filters(request.args.getlist('category'), request.args.getlist('namespace')) or {}
+    except ValueError:
+        return jsonify({
+            'error': 'Invalid limit or cursor'
+        }), 400
+    
+    if not query:
+        return jsonify({
+            'error': 'No query provided'
+        }), 400
+    
+    def fetch(cursor, n):
+        results = chatbot.db.search_pages(query, limit=n, after=parse_search_cursor(cursor), **filters)
+        if results is None:
+            return None
         
         # Format results
         formatted_results = []
         for result in results:
-            # Handle bytes from database
-            page_title = result['page_title']
-            if isinstance(page_title, bytes):
-                page_title = page_title.decode('utf-8', errors='ignore')
-            page_title = page_title.replace('_', ' ')
-            
             content = result.get('content', '')
             if isinstance(content, bytes):
                 content = content.decode('utf-8', errors='ignore')
             
-            formatted_results.append({
+            formatted_results.append(({
                 'page_id': result['page_id'],
-                'title': page_title,
-                'snippet': chatbot.clean_wiki_text(content)[:200] + '...'
+                'title': decode_title(result['page_title']),
+                # Only a prefix of the page is converted for the snippet
+                'snippet': chatbot.clean_wiki_text(content, max_chars=SNIPPET_CHARS) + '...'
+            }, f"{result['relevance']}:{result['page_id']}"))
+        return formatted_results
+    
+    return Response(stream_listing({'query': query}, 'results', fetch, cursor, max(0, limit), SEARCH_BATCH),
+                    mimetype='application/json')
+
+@app.route('/api/suggest', methods=['GET'])
+def suggest():
+    """Page title autocompletion endpoint"""
+    if not chatbot:
+        return jsonify({
+            'error': 'Chatbot not initialized'
+        }), 500
+    
+    try:
+        query = request.args.get('q', '')
+        limit = min(int(request.args.get('limit', 10)), 50)
+        
+        suggestions = []
+        for page in chatbot.titles.suggest(query, limit=limit):
+            suggestions.append({
+                'page_id': page['page_id'],
+                'title': page['title'],
+                'url': f"{Config.WIKI_BASE_URL}?title={page['title'].replace(' ', '_')}"
             })
         
         return jsonify({
             'query': query,
-            'results': formatted_results,
-            'count': len(formatted_results)
+            'suggestions': suggestions,
+            'count': len(suggestions)
         })
     
     except Exception as e:
-        print(f"Search error: {e}")
-        traceback.print_exc()
+        print(f"Suggest error: {e}")
         return jsonify({
             'error': str(e)
         }), 500
 
 @app.route('/api/pages', methods=['GET'])
 def list_pages():
-    """List all wiki pages"""
+    """List wiki pages in page_id order (streamed, cursor-paginated; limit=0 lists all)"""
     if not chatbot:
         return jsonify({
             'error': 'Chatbot not initialized'
@@ -117,31 +400,156 @@ def list_pages():
     
     try:
         limit = int(request.args.get('limit', 50))
-        pages = chatbot.db.get_all_pages(limit=limit)
-        
-        formatted_pages = []
-        for page in pages:
-            # Handle bytes from database
-            page_title = page['page_title']
-            if isinstance(page_title, bytes):
-                page_title = page_title.decode('utf-8', errors='ignore')
-            page_title = page_title.replace('_', ' ')
-            
-            formatted_pages.append({
-                'page_id': page['page_id'],
-                'title': page_title
-            })
-        
+        cursor = request.args.get('cursor') or None
+        int(cursor or 0)
+    except ValueError:
         return jsonify({
-            'pages': formatted_pages,
-            'count': len(formatted_pages)
-        })
+            'error': 'Invalid limit or cursor'
+        }), 400
+    
+    def fetch(cursor, n):
+        pages = chatbot.db.get_page_list(after_id=int(cursor or 0), limit=n)
+        if pages is None:
+            return None
+        return [({
+            'page_id': page['page_id'],
+            'title': decode_title(page['page_title'])
+        }, str(page['page_id'])) for page in pages]
     
+    return Response(stream_listing({}, 'pages', fetch, cursor, max(0, limit), PAGE_LIST_BATCH),
+                    mimetype='application/json')
+
+def is_admin() -> bool:
+    """Matching X-Admin-Token (nobody is admin while ADMIN_TOKEN is empty)"""
+    admin_token = Config.ADMIN_TOKEN
+    return bool(admin_token) and hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token)
+
+def require_admin(f):
+    """Allow admin endpoints only for is_admin() requests"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if not is_admin():
+            return jsonify({'error': 'Forbidden'}), 403
+        return f(*args, **kwargs)
+    return decorated
+
+# Background index rebuild state
+reindex_lock = threading.Lock()
+reindex_status = {
+    'running': False,
+    'last_result': None,
+    'last_error': None
+}
+
+def run_reindex():
+    """Build and activate a new index version while the server keeps serving the old one"""
+    db = WikiDBConnector()
+    try:
+        if not db.connect():
+            raise Exception("Database connection failed")
+        pages = fetch_pages(db)
+        if not pages:
+            raise Exception("No pages found in database")
+        result = build_index(chatbot.vector_store, pages, keep_versions=Config.INDEX_KEEP_VERSIONS)
+        chatbot.refresh_vector_index(force=True)
+        reindex_status['last_result'] = result
+        reindex_status['last_error'] = None
     except Exception as e:
-        print(f"List pages error: {e}")
+        print(f"Reindex error: {e}")
+        traceback.print_exc()
+        reindex_status['last_error'] = str(e)
+    finally:
+        db.disconnect()
+        reindex_status['running'] = False
+
+@app.route('/api/admin/index', methods=['GET'])
+@require_admin
+def index_status():
+    """Active index version and rebuild status"""
+    if not chatbot or not chatbot.vector_store:
         return jsonify({
-            'error': str(e)
-        }), 500
+            'error': 'Vector store not available'
+        }), 409
+    
+    return jsonify({
+        'index': chatbot.vector_store.get_stats(),
+        'vector_search_active': chatbot.vector_ready,
+        'rebuild': reindex_status
+    })
+
+@app.route('/api/admin/index/reload', methods=['POST'])
+@require_admin
+def reload_index():
+    """Switch to the newest activated index version now instead of on the next check"""
+    if not chatbot or not chatbot.vector_store:
+        return jsonify({
+            'error': 'Vector store not available'
+        }), 409
+    
+    changed = chatbot.refresh_vector_index(force=True)
+    return jsonify({
+        'changed': changed,
+        'index': chatbot.vector_store.get_stats(),
+        'vector_search_active': chatbot.vector_ready
+    })
+
+@app.route('/api/admin/index/rebuild', methods=['POST'])
+@require_admin
+def rebuild_index():
+    """Rebuild the vector index in the background (blue/green)"""
+    if not chatbot or not chatbot.vector_store:
+        return jsonify({
+            'error': 'Vector store not available'
+        }), 409
+    
+    with reindex_lock:
+        if reindex_status['running']:
+            return jsonify({
+                'error': 'Rebuild already running'
+            }), 409
+        reindex_status['running'] = True
+    
+    threading.Thread(target=run_reindex, daemon=True).start()
+    return jsonify({
+        'status': 'started'
+    }), 202
+
+@app.route('/api/admin/profiling', methods=['GET'])
+@require_admin
+def profiling_status():
+    """Armed request count and saved profiles"""
+    return jsonify({
+        'armed': profiler.armed,
+        'max_per_minute': profiler.max_per_minute,
+        'profiles': profiler.list_profiles()
+    })
+
+@app.route('/api/admin/profiling', methods=['POST'])
+@require_admin
+def arm_profiling():
+    """Profile the next N chat requests ({"requests": N}, 0 disarms)"""
+    data = request.get_json(silent=True) or {}
+    try:
+        requests_to_profile = int(data.get('requests', 1))
+    except (TypeError, ValueError):
+        return jsonify({
+            'error': 'requests must be an integer'
+        }), 400
+    
+    profiler.arm(requests_to_profile)
+    return jsonify({
+        'armed': profiler.armed
+    })
+
+@app.route('/api/admin/profiles/<path:name>', methods=['GET'])
+@require_admin
+def download_profile(name):
+    """Download a saved .pstats or .collapsed file"""
+    if name not in profiler.list_profiles():
+        return jsonify({
+            'error': 'Profile not found'
+        }), 404
+    return send_from_directory(profiler.directory, name, as_attachment=True)
 
 if __name__ == '__main__':
     config = Config()
@@ -0,0 +1,92 @@
+"""
+Helpers shared by the benchmark scripts
+"""
+
+import json
+import math
+import platform
+import re
+import subprocess
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+# Caveat printed with results measured against the synthetic wiki
+SQLITE_NOTE = ("Database is in-process SQLite (no network, no MariaDB server threads or locking): "
+               "database latency under concurrency is not representative")
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    """p-th percentile with linear interpolation (numpy's default method)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize_ms(seconds: Sequence[float]) -> Dict:
+    """Count, mean and p50/p95/p99/max of durations, in milliseconds"""
+    ms = [s * 1000 for s in seconds]
+    return {
+        'count': len(ms),
+        'mean_ms': round(sum(ms) / len(ms), 3) if ms else 0.0,
+        'p50_ms': round(percentile(ms, 50), 3),
+        'p95_ms': round(percentile(ms, 95), 3),
+        'p99_ms': round(percentile(ms, 99), 3),
+        'max_ms': round(max(ms), 3) if ms else 0.0
+    }
+
+
+def run_info() -> Dict:
+    """Commit, Python version and time, so results can be matched to a tree"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'timestamp': datetime.now(timezone.utc).isoformat()
+    }
+
+
+def load_questions(path: str) -> List[str]:
+    """One question per line; blank lines and # comments are skipped"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def _flatten(data, prefix: str = '') -> Dict[str, float]:
+    flat = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            flat.update(_flatten(value, f"{prefix}{key}."))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        flat[prefix[:-1]] = data
+    return flat
+
+
+def compare(baseline_path: str, results: Dict, pattern: str = r'(_ms|per_second|seconds|_mean)$'):
+    """Print the change of every matching numeric result against a baseline JSON file"""
+    with open(baseline_path, 'r') as f:
+        baseline = json.load(f)
+    old = _flatten(baseline)
+    new = _flatten(results)
+    print(f"\nChange vs {baseline_path} (commit {baseline.get('run', {}).get('commit')}):")
+    for key in sorted(new):
+        if key.startswith('run.') or not re.search(pattern, key) or key not in old:
+            continue
+        before, after = old[key], new[key]
+        change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+        print(f"  {key:<50} {before:>12.3f} -> {after:>12.3f}  {change}")
+
+
+def write_json(path: Optional[str], results: Dict):
+    if path:
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {path}")
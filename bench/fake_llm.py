@@ -0,0 +1,94 @@
+"""
+Deterministic stand-in for llama_cpp.Llama
+
+FakeLlama answers with text taken from the first context source in the
+prompt (or the "I don't know" sentence when there is none). It sleeps to
+simulate prefill and decode at configurable token rates, so pipeline
+benchmarks have realistic LLM time without a GGUF model. Rates of 0 skip
+the sleeps and leave only pipeline overhead.
+
+With runaway=True it behaves like a small model that doesn't know when to
+stop: after the answer it repeats itself until max_tokens. Stop strings end
+the output the way llama.cpp does.
+"""
+
+import os
+import re
+import sys
+import time
+import zlib
+from typing import Dict, Iterator, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_model import LlamaModel
+
+_TOKEN = re.compile(r'\w+|[^\w\s]')
+_SOURCE = re.compile(r'\[Source 1: [^\]]*\]\n(.*?)(?:\n\[Source |\n\nINSTRUCTIONS:)', re.DOTALL)
+NO_ANSWER = "I don't know based on the available information."
+
+
+class FakeLlama:
+    """Implements the parts of llama_cpp.Llama that LlamaModel calls"""
+
+    def __init__(self, prefill_tps: float = 400.0, decode_tps: float = 40.0, answer_tokens: int = 48,
+                 runaway: bool = False):
+        self.prefill_tps = prefill_tps
+        self.decode_tps = decode_tps
+        self.answer_tokens = answer_tokens
+        self.runaway = runaway
+
+    def tokenize(self, text: bytes, add_bos: bool = True) -> List[int]:
+        tokens = [zlib.crc32(t.encode('utf-8')) % 32000 for t in _TOKEN.findall(text.decode('utf-8', errors='ignore'))]
+        return ([1] if add_bos else []) + tokens
+
+    def _answer(self, prompt: str, max_tokens: int) -> List[str]:
+        match = _SOURCE.search(prompt)
+        text = match.group(1).strip() if match and match.group(1).strip() else NO_ANSWER
+        pieces = re.findall(r'\S+\s*', text)[:self.answer_tokens]
+        if self.runaway:
+            # Finish the sentence, then keep talking
+            answer = ''.join(pieces).rstrip()
+            answer = answer[:answer.rfind('.') + 1] or answer
+            pieces = []
+            while len(pieces) < max_tokens:
+                pieces += re.findall(r'\S+\s*', f"{answer} ")
+        return pieces[:max_tokens]
+
+    def _stream(self, prompt_tokens: int, pieces: List[str], max_tokens: int, stop: List[str]) -> Iterator[Dict]:
+        if self.prefill_tps:
+            time.sleep(prompt_tokens / self.prefill_tps)
+        text = ''
+        for i, piece in enumerate(pieces):
+            if self.decode_tps:
+                time.sleep(1 / self.decode_tps)
+            hit = min((pos for pos in ((text + piece).find(s) for s in stop) if pos >= 0), default=-1)
+            if hit >= 0:
+                yield {'choices': [{'text': (text + piece)[len(text):hit], 'finish_reason': 'stop'}]}
+                return
+            text += piece
+            finish = None
+            if i == len(pieces) - 1:
+                finish = 'length' if len(pieces) >= max_tokens else 'stop'
+            yield {'choices': [{'text': piece, 'finish_reason': finish}]}
+
+    def __call__(self, prompt: str, max_tokens: int = 128, stream: bool = False, stop: List[str] = None, **kwargs):
+        prompt_tokens = len(self.tokenize(prompt.encode('utf-8')))
+        pieces = self._answer(prompt, max_tokens)
+        chunks = self._stream(prompt_tokens, pieces, max_tokens, stop or [])
+        if stream:
+            return chunks
+        text = ''.join(chunk['choices'][0]['text'] for chunk in chunks)
+        return {
+            'choices': [{'text': text}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': len(pieces)}
+        }
+
+
+def make_fake_llm(prefill_tps: float = 400.0, decode_tps: float = 40.0, answer_tokens: int = 48,
+                  runaway: bool = False) -> LlamaModel:
+    """LlamaModel whose model is a FakeLlama"""
+    llm = LlamaModel()
+    llm.model = FakeLlama(prefill_tps=prefill_tps, decode_tps=decode_tps, answer_tokens=answer_tokens,
+                          runaway=runaway)
+    return llm
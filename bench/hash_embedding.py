@@ -0,0 +1,33 @@
+"""
+Deterministic hashing embeddings for offline benchmarks
+"""
+
+import math
+import re
+import zlib
+from typing import List
+
+from chromadb.api.types import EmbeddingFunction
+
+
+class HashEmbeddingFunction(EmbeddingFunction):
+    """Deterministic bag-of-words hashing embeddings
+
+    Stands in for the sentence-transformers model so vector benchmarks run
+    offline and measure the index and pipeline rather than model speed.
+    Texts that share words get similar vectors.
+    """
+
+    def __init__(self, dimensions: int = 384):
+        self.dimensions = dimensions
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        embeddings = []
+        for text in input:
+            vector = [0.0] * self.dimensions
+            for word in re.findall(r'\w+', text.lower()):
+                h = zlib.crc32(word.encode('utf-8'))
+                vector[h % self.dimensions] += 1.0 if h & 0x80000000 else -1.0
+            norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+            embeddings.append([v / norm for v in vector])
+        return embeddings
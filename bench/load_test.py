@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Concurrent HTTP load generator for app.py (asyncio, standard library only)
+
+Usage:
+    # Against a running server
+    python3 bench/load_test.py --url http://127.0.0.1:5000 --concurrency 8 --duration 60
+
+    # Fully offline: start bench/stub_server.py (synthetic wiki, fake LLM) first
+    python3 bench/load_test.py --start-server --concurrency 16 --rate 4 --duration 30
+
+Request mix (--mix) picks from:
+- chat: POST /api/chat
+- chat_stream: POST /api/chat with "stream": true (time to first token is measured)
+- search: GET /api/search
+- health: GET /health
+
+Without --rate every worker sends its next request as soon as the previous
+one finishes (closed loop). With --rate requests arrive as a Poisson process
+at that rate (open loop). At most --concurrency are in flight, and latency
+is measured from the scheduled arrival, so queueing shows up in the numbers.
+
+Reported per request kind and overall:
+- throughput
+- latency p50/p95/p99
+- error and 429 rates
+- time to first token for streamed chats
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.parse
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from common import SQLITE_NOTE, load_questions, run_info, summarize_ms, write_json
+
+STOP_WORDS = {'what', 'is', 'are', 'the', 'how', 'can', 'do', 'does', 'i', 'a', 'on', 'for', 'of', 'my', 'to'}
+
+
+class Result:
+    """Outcome of one request"""
+
+    __slots__ = ('kind', 'status', 'latency', 'ttft', 'error')
+
+    def __init__(self, kind, status=None, latency=None, ttft=None, error=None):
+        self.kind = kind
+        self.status = status
+        self.latency = latency
+        self.ttft = ttft
+        self.error = error
+
+
+async def http_request(host: str, port: int, method: str, path: str, body=None,
+                       timeout: float = 120.0, token_marker: bytes = None, started: float = None):
+    """Send one request; returns (status, time to first token marker or None)
+
+    One connection per request (Connection: close), so the body ends at EOF
+    whether or not the server uses chunked encoding.
+    """
+    started = started or time.perf_counter()
+
+    async def run():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            payload = json.dumps(body).encode('utf-8') if body is not None else b''
+            head = f"{method} {path} HTTP/1.1\r\nHost: {host}:{port}\r\nConnection: close\r\nAccept: */*\r\n"
+            if body is not None:
+                head += f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+            writer.write(head.encode('ascii') + b"\r\n" + payload)
+            await writer.drain()
+
+            status_line = await reader.readline()
+            if not status_line:
+                raise ConnectionError("connection closed before response")
+            status = int(status_line.split()[1])
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+
+            ttft = None
+            tail = b''
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                if token_marker and ttft is None:
+                    # Keep a little of the previous read in case the marker is split
+                    if token_marker in tail + data:
+                        ttft = time.perf_counter() - started
+                    tail = data[-len(token_marker):]
+            return status, ttft
+        finally:
+            writer.close()
+
+    return await asyncio.wait_for(run(), timeout)
+
+
+def search_terms(question: str) -> str:
+    words = [w.strip('?,.').lower() for w in question.split()]
+    return ' '.join([w for w in words if w and w not in STOP_WORDS][:3])
+
+
+def parse_mix(mix: str):
+    weights = {}
+    for part in mix.split(','):
+        kind, _, weight = part.partition('=')
+        if kind not in ('chat', 'chat_stream', 'search', 'health'):
+            raise SystemExit(f"Unknown request kind in --mix: {kind}")
+        weights[kind] = float(weight or 1)
+    return list(weights), list(weights.values())
+
+
+async def send(kind: str, question: str, args, host: str, port: int, started: float) -> Result:
+    try:
+        if kind == 'health':
+            status, ttft = await http_request(host, port, 'GET', '/health', timeout=args.timeout, started=started)
+        elif kind == 'search':
+            query = urllib.parse.urlencode({'q': search_terms(question), 'limit': 10})
+            status, ttft = await http_request(host, port, 'GET', f"/api/search?{query}",
+                                              timeout=args.timeout, started=started)
+        else:
+            body = {'question': question}
+            marker = None
+            if kind == 'chat_stream':
+                body['stream'] = True
+                marker = b'"token"'
+            status, ttft = await http_request(host, port, 'POST', '/api/chat', body=body, timeout=args.timeout,
+                                              token_marker=marker, started=started)
+        return Result(kind, status=status, latency=time.perf_counter() - started, ttft=ttft)
+    except asyncio.TimeoutError:
+        return Result(kind, latency=time.perf_counter() - started, error='timeout')
+    except Exception as e:
+        return Result(kind, latency=time.perf_counter() - started, error=type(e).__name__)
+
+
+async def run_load(args, host: str, port: int, questions):
+    rng = random.Random(args.seed)
+    kinds, weights = parse_mix(args.mix)
+    results = []
+    deadline = time.perf_counter() + args.duration
+    budget = {'left': args.requests or float('inf')}
+
+    def next_request():
+        if time.perf_counter() >= deadline or budget['left'] <= 0:
+            return None
+        budget['left'] -= 1
+        return rng.choices(kinds, weights)[0], rng.choice(questions)
+
+    if not args.rate:
+        # Closed loop: each worker keeps one request in flight
+        async def worker():
+            while True:
+                request = next_request()
+                if request is None:
+                    return
+                results.append(await send(*request, args, host, port, time.perf_counter()))
+
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        return results
+
+    # Open loop: Poisson arrivals, at most `concurrency` in flight
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def scheduled(request, arrival):
+        async with slots:
+            results.append(await send(*request, args, host, port, arrival))
+
+    tasks = []
+    next_arrival = time.perf_counter()
+    while True:
+        request = next_request()
+        if request is None:
+            break
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(scheduled(request, next_arrival)))
+        next_arrival += rng.expovariate(args.rate)
+    await asyncio.gather(*tasks)
+    return results
+
+
+def summarize(results, elapsed: float):
+    report = {}
+    groups = {}
+    for result in results:
+        groups.setdefault(result.kind, []).append(result)
+    groups['all'] = results
+
+    for kind, group in groups.items():
+        ok = [r for r in group if r.status is not None and 200 <= r.status < 300]
+        throttled = [r for r in group if r.status == 429]
+        failed = len(group) - len(ok) - len(throttled)
+        entry = {
+            'requests': len(group),
+            'ok': len(ok),
+            'throughput_rps': round(len(ok) / elapsed, 3) if elapsed else 0.0,
+            'error_rate': round(failed / len(group), 4) if group else 0.0,
+            'rate_429': round(len(throttled) / len(group), 4) if group else 0.0,
+            'latency': summarize_ms([r.latency for r in ok])
+        }
+        errors = {}
+        for r in group:
+            if r.error or (r.status is not None and r.status >= 300 and r.status != 429):
+                key = r.error or str(r.status)
+                errors[key] = errors.get(key, 0) + 1
+        if errors:
+            entry['errors'] = errors
+        ttfts = [r.ttft for r in ok if r.ttft is not None]
+        if ttfts:
+            entry['ttft'] = summarize_ms(ttfts)
+        report[kind] = entry
+    return report
+
+
+def wait_for_server(url: str, timeout: float, process=None) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            return False
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=2) as response:
+                if json.loads(response.read()).get('chatbot_ready'):
+                    return True
+        except Exception:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test for the chatbot HTTP API")
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help="Server base URL")
+    parser.add_argument('--concurrency', type=int, default=8, help="Maximum requests in flight")
+    parser.add_argument('--rate', type=float, default=0.0, help="Arrivals per second (0 = closed loop)")
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds to generate load")
+    parser.add_argument('--requests', type=int, default=0, help="Stop after this many requests (0 = no limit)")
+    parser.add_argument('--mix', default='chat=0.4,chat_stream=0.2,search=0.3,health=0.1',
+                        help="Request kinds and weights")
+    parser.add_argument('--questions', default=os.path.join(BENCH_DIR, 'questions.txt'))
+    parser.add_argument('--timeout', type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--start-server', action='store_true',
+                        help="Start bench/stub_server.py (synthetic wiki, fake LLM) for the run")
+    parser.add_argument('--server-args', default='',
+                        help="Extra stub server arguments, e.g. \"--decode-tps 20 --max-concurrent-chats 2\"")
+    parser.add_argument('--json', dest='json_path', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    url = urllib.parse.urlparse(args.url)
+    host, port = url.hostname, url.port or 80
+    questions = load_questions(args.questions)
+
+    process = None
+    if args.start_server:
+        command = [sys.executable, os.path.join(BENCH_DIR, 'stub_server.py'),
+                   '--host', host, '--port', str(port)] + args.server_args.split()
+        print(f"Starting stub server: {' '.join(command)}")
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    try:
+        if not wait_for_server(args.url.rstrip('/'), timeout=600 if process else 10, process=process):
+            print(f"❌ Server at {args.url} is not ready")
+            sys.exit(1)
+
+        mode = f"open loop, {args.rate}/s" if args.rate else "closed loop"
+        print(f"Load: {mode}, concurrency {args.concurrency}, {args.duration:.0f}s, mix {args.mix}")
+        start = time.perf_counter()
+        results = asyncio.run(run_load(args, host, port, questions))
+        elapsed = time.perf_counter() - start
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    report = summarize(results, elapsed)
+    print("\n" + "=" * 78)
+    print(f"{'kind':<12} {'reqs':>6} {'rps':>8} {'err%':>6} {'429%':>6} {'p50ms':>9} {'p95ms':>9} {'p99ms':>9}")
+    print("=" * 78)
+    for kind, entry in report.items():
+        latency = entry['latency']
+        print(f"{kind:<12} {entry['requests']:>6} {entry['throughput_rps']:>8.2f} "
+              f"{entry['error_rate'] * 100:>6.1f} {entry['rate_429'] * 100:>6.1f} "
+              f"{latency['p50_ms']:>9.1f} {latency['p95_ms']:>9.1f} {latency['p99_ms']:>9.1f}")
+        if 'ttft' in entry:
+            ttft = entry['ttft']
+            print(f"{'  ttft':<12} {'':>6} {'':>8} {'':>6} {'':>6} "
+                  f"{ttft['p50_ms']:>9.1f} {ttft['p95_ms']:>9.1f} {ttft['p99_ms']:>9.1f}")
+        if 'errors' in entry:
+            print(f"  errors: {entry['errors']}")
+    if process is not None:
+        print(f"\n⚠️  {SQLITE_NOTE}")
+
+    write_json(args.json_path, {
+        'run': run_info(),
+        'config': {k: v for k, v in vars(args).items() if k != 'json_path'},
+        'elapsed_seconds': round(elapsed, 3),
+        'database': 'synthetic SQLite (stub server)' if process is not None else 'server under test',
+        'results': report
+    })
+
+
+if __name__ == "__main__":
+    main()
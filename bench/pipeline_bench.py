@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end benchmark: indexing, retrieval and WikiChatbot.chat
+
+Usage:
+    python3 bench/pipeline_bench.py [--pages 3000] [--repeat 3] [--json out.json]
+                                    [--baseline previous.json]
+
+Everything runs locally:
+- a synthetic MediaWiki 1.43 database (bench/synthetic_wiki.py, SQLite)
+  read through the real WikiDBConnector queries
+- a FakeLlama with fixed token rates instead of a GGUF model
+- a hashing embedding function instead of sentence-transformers, with a
+  throwaway Chroma directory
+
+Measured:
+- indexing: index_wiki.fetch_pages (DB read + wikitext cleanup) and
+  index_wiki.build_index (embed, validate, activate), in pages/s
+- retrieval latency per question:
+  - keyword: LIKE search
+  - vector: raw vector_store.search
+  - hybrid: vector search with title boosting and DB hydration
+  The first pass (cold content cache) and later passes (warm) are
+  reported separately.
+- WikiChatbot.chat latency p50/p95/p99, the mean time per stage, and mean
+  prompt and completion tokens and decode seconds saved per answer
+  (--runaway makes the fake model ramble like a small real one;
+  --fixed-max-tokens turns token budgets and early stopping off to compare)
+- WikiChatbot.chat_batch throughput against the same questions answered
+  one chat() call at a time
+
+Results are JSON; --baseline prints the change against an earlier run.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from config import Config
+from index_wiki import fetch_pages, build_index
+from chatbot import WikiChatbot
+from vector_store import VectorStore
+from common import compare, load_questions, run_info, summarize_ms, write_json
+from fake_llm import make_fake_llm
+from hash_embedding import HashEmbeddingFunction
+from synthetic_wiki import SyntheticWikiDB, create_wiki
+
+
+def time_calls(func, questions, repeat: int):
+    """Durations of func(question) for every question, per pass"""
+    passes = []
+    for _ in range(repeat):
+        durations = []
+        for question in questions:
+            start = time.perf_counter()
+            func(question)
+            durations.append(time.perf_counter() - start)
+        passes.append(durations)
+    return passes
+
+
+def cold_and_warm(passes):
+    result = {'cold': summarize_ms(passes[0])}
+    warm = [d for durations in passes[1:] for d in durations]
+    if warm:
+        result['warm'] = summarize_ms(warm)
+    return result
+
+
+def bench_indexing(db, work_dir: str):
+    """Time fetch_pages and build_index; returns (results, vector store or None)"""
+    start = time.perf_counter()
+    pages = fetch_pages(db, limit=10 ** 7)
+    fetch_seconds = time.perf_counter() - start
+    results = {
+        'pages': len(pages),
+        'fetch_seconds': round(fetch_seconds, 3),
+        'fetch_pages_per_second': round(len(pages) / fetch_seconds, 1)
+    }
+
+    vector_store = VectorStore(persist_directory=os.path.join(work_dir, 'chroma'),
+                               embedding_function=HashEmbeddingFunction())
+    if not vector_store.initialize():
+        results['vector'] = {'skipped': 'vector store initialization failed'}
+        return results, None
+    start = time.perf_counter()
+    index = build_index(vector_store, pages)
+    index_seconds = time.perf_counter() - start
+    results['vector'] = {
+        'index_seconds': round(index_seconds, 3),
+        'index_pages_per_second': round(len(pages) / index_seconds, 1),
+        'documents': index['documents'],
+        'duplicate_clusters': index['duplicate_clusters'],
+        'duplicates_skipped': index['duplicates_skipped']
+    }
+    return results, vector_store
+
+
+def bench_retrieval(bot: WikiChatbot, questions, repeat: int):
+    modes = {'keyword': lambda q: bot._retrieve_context_keyword(q, max_pages=3)}
+    if bot.vector_store:
+        modes['vector'] = lambda q: bot.vector_store.search(q, top_k=3)
+        modes['hybrid'] = lambda q: bot._retrieve_context_vector(q, max_pages=3)
+
+    results = {}
+    for mode, func in modes.items():
+        # Every mode starts with a cold page text cache
+        bot.db.content.cache.clear()
+        results[mode] = cold_and_warm(time_calls(func, questions, repeat))
+    return results
+
+
+def bench_chat(bot: WikiChatbot, questions, repeat: int):
+    durations = []
+    stages = {}
+    answered = 0
+    prompt_tokens = []
+    completion_tokens = []
+    seconds_saved = []
+    stop_reasons = {}
+    for _ in range(repeat):
+        for question in questions:
+            start = time.perf_counter()
+            response = bot.chat(question, include_timings=True)
+            durations.append(time.perf_counter() - start)
+            answered += int(response['context_used'])
+            timings = response['timings']
+            prompt_tokens.append(timings.get('prompt_tokens', 0))
+            completion_tokens.append(timings.get('completion_tokens', 0))
+            seconds_saved.append(timings.get('seconds_saved', 0.0))
+            reason = timings.get('stop_reason', 'unknown')
+            stop_reasons[reason] = stop_reasons.get(reason, 0) + 1
+            for stage, ms in response['timings']['stages_ms'].items():
+                stages.setdefault(stage, []).append(ms)
+
+    results = summarize_ms(durations)
+    results['with_context'] = answered
+    results['prompt_tokens_mean'] = round(sum(prompt_tokens) / len(durations), 1)
+    results['completion_tokens_mean'] = round(sum(completion_tokens) / len(durations), 1)
+    results['seconds_saved_mean'] = round(sum(seconds_saved) / len(durations), 3)
+    results['stop_reasons'] = stop_reasons
+    results['stage_mean_ms'] = {stage: round(sum(ms) / len(durations), 3) for stage, ms in sorted(stages.items())}
+    return results
+
+
+def bench_batch(bot: WikiChatbot, questions, repeat: int):
+    """Questions per second: one chat() per question vs one chat_batch() for all"""
+    questions = questions * repeat
+    start = time.perf_counter()
+    for question in questions:
+        bot.chat(question)
+    sequential_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for result in bot.chat_batch(questions):
+        if result['type'] == 'summary':
+            summary = result
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        'questions': len(questions),
+        'sequential_per_second': round(len(questions) / sequential_seconds, 2),
+        'batch_per_second': round(len(questions) / batch_seconds, 2),
+        'speedup': round(sequential_seconds / batch_seconds, 2),
+        'batch_prepare_stages_ms': summary['prepare_stages_ms']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark (synthetic wiki, fake LLM)")
+    parser.add_argument('--pages', type=int, default=3000, help="Synthetic wiki size")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', help="Reuse or create the synthetic SQLite wiki at this path")
+    parser.add_argument('--questions', default=os.path.join(BENCH_DIR, 'questions.txt'))
+    parser.add_argument('--repeat', type=int, default=3, help="Passes over the questions for retrieval")
+    parser.add_argument('--chat-repeat', type=int, default=1, help="Passes over the questions for chat")
+    parser.add_argument('--prefill-tps', type=float, default=400.0, help="Fake LLM prompt tokens/s (0 = instant)")
+    parser.add_argument('--decode-tps', type=float, default=40.0, help="Fake LLM generated tokens/s (0 = instant)")
+    parser.add_argument('--answer-tokens', type=int, default=48, help="Fake LLM answer length")
+    parser.add_argument('--runaway', action='store_true',
+                        help="Fake LLM keeps writing after the answer (invented Q&A, repeats) until max_tokens")
+    parser.add_argument('--fixed-max-tokens', action='store_true',
+                        help="Disable adaptive token budgets and early stopping (the old behaviour)")
+    parser.add_argument('--compression', action='store_true', help="Enable context compression")
+    parser.add_argument('--json', dest='json_path', help="Write results as JSON to this file")
+    parser.add_argument('--baseline', help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    # The bench wires components itself; no background refresh against MariaDB
+    Config.TITLE_INDEX_REFRESH_INTERVAL = 0
+    Config.USE_VECTOR_SEARCH = False
+    Config.CONTEXT_COMPRESSION = args.compression
+    Config.ADAPTIVE_MAX_TOKENS = Config.EARLY_STOP = not args.fixed_max_tokens
+
+    questions = load_questions(args.questions)
+    work_dir = tempfile.mkdtemp(prefix='wikichat-bench-')
+    db_path = args.db or os.path.join(work_dir, 'wiki.sqlite')
+
+    results = {
+        'run': run_info(),
+        'config': {
+            'pages': args.pages, 'seed': args.seed, 'questions': len(questions), 'repeat': args.repeat,
+            'prefill_tps': args.prefill_tps, 'decode_tps': args.decode_tps,
+            'answer_tokens': args.answer_tokens, 'compression': args.compression,
+            'runaway': args.runaway, 'fixed_max_tokens': args.fixed_max_tokens
+        }
+    }
+
+    if not (args.db and os.path.exists(args.db)):
+        print(f"Creating synthetic wiki ({args.pages} pages)...")
+        start = time.perf_counter()
+        counts = create_wiki(db_path, pages=args.pages, seed=args.seed)
+        counts['seconds'] = round(time.perf_counter() - start, 2)
+        results['corpus'] = counts
+
+    db = SyntheticWikiDB(db_path)
+    if not db.connect():
+        sys.exit(1)
+
+    print("Indexing...")
+    results['indexing'], vector_store = bench_indexing(db, work_dir)
+
+    llm = make_fake_llm(prefill_tps=args.prefill_tps, decode_tps=args.decode_tps,
+                        answer_tokens=args.answer_tokens, runaway=args.runaway)
+    bot = WikiChatbot(db=db, llm=llm, vector_store=vector_store)
+
+    print("Retrieval...")
+    results['retrieval'] = bench_retrieval(bot, questions, args.repeat)
+    print("Chat...")
+    results['chat'] = bench_chat(bot, questions, args.chat_repeat)
+    print("Batch...")
+    results['batch'] = bench_batch(bot, questions, args.chat_repeat)
+
+    print("\n" + "=" * 60)
+    print(f"Pipeline benchmark: {results['indexing']['pages']} pages, {len(questions)} questions")
+    print("=" * 60)
+    indexing = results['indexing']
+    print(f"  fetch_pages      {indexing['fetch_pages_per_second']:>10.1f} pages/s")
+    if 'index_pages_per_second' in indexing['vector']:
+        print(f"  build_index      {indexing['vector']['index_pages_per_second']:>10.1f} pages/s")
+        print(f"  documents        {indexing['vector']['documents']:>10} "
+              f"({indexing['vector']['duplicates_skipped']} near-duplicates in "
+              f"{indexing['vector']['duplicate_clusters']} clusters skipped)")
+    else:
+        print(f"  build_index      skipped ({indexing['vector']['skipped']})")
+    print("\nRetrieval (ms)              p50       p95       p99")
+    for mode, passes in results['retrieval'].items():
+        for name, stats in passes.items():
+            print(f"  {mode + ' ' + name:<22} {stats['p50_ms']:>8.2f}  {stats['p95_ms']:>8.2f}  {stats['p99_ms']:>8.2f}")
+    chat = results['chat']
+    print(f"\nChat (ms)              {chat['p50_ms']:>8.1f}  {chat['p95_ms']:>8.1f}  {chat['p99_ms']:>8.1f}")
+    print(f"  {'prompt tokens':<22} {chat['prompt_tokens_mean']:>8.1f} mean")
+    print(f"  {'completion tokens':<22} {chat['completion_tokens_mean']:>8.1f} mean")
+    print(f"  {'seconds saved':<22} {chat['seconds_saved_mean']:>8.3f} mean   stops: {chat['stop_reasons']}")
+    for stage, ms in chat['stage_mean_ms'].items():
+        print(f"  {stage:<22} {ms:>8.2f} mean")
+    batch = results['batch']
+    print(f"\nBatch ({batch['questions']} questions)  {batch['sequential_per_second']:>8.2f} q/s sequential, "
+          f"{batch['batch_per_second']:.2f} q/s batched ({batch['speedup']:.2f}x)")
+
+    write_json(args.json_path, results)
+    if args.baseline:
+        compare(args.baseline, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+app.py backed by the synthetic wiki and the fake LLM, for offline load tests
+
+Usage:
+    python3 bench/stub_server.py [--port 5055] [--pages 2000] [--decode-tps 40]
+
+Serves the real Flask app (same endpoints, concurrency limit and streaming)
+with a WikiChatbot built from bench/synthetic_wiki.py, bench/fake_llm.py
+and hashing embeddings, so no MariaDB, model or network is needed.
+
+The database is an in-process SQLite file: each concurrent query gets its
+own SQLite connection from the pool, but without network round trips or
+MariaDB's server threads and locking, so database latency under concurrency
+is not representative of a real deployment.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run app.py against a synthetic wiki and a fake LLM")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--pages', type=int, default=2000, help="Synthetic wiki size")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', help="Reuse or create the synthetic SQLite wiki at this path")
+    parser.add_argument('--no-vector', action='store_true', help="Keyword search only")
+    parser.add_argument('--prefill-tps', type=float, default=400.0, help="Fake LLM prompt tokens/s (0 = instant)")
+    parser.add_argument('--decode-tps', type=float, default=40.0, help="Fake LLM generated tokens/s (0 = instant)")
+    parser.add_argument('--answer-tokens', type=int, default=48, help="Fake LLM answer length")
+    parser.add_argument('--max-concurrent-chats', type=int, help="Override MAX_CONCURRENT_CHATS")
+    parser.add_argument('--chat-queue-timeout', type=float, help="Override CHAT_QUEUE_TIMEOUT")
+    args = parser.parse_args()
+
+    # Config is read at import time, so the overrides go into the environment first
+    os.environ['CHATBOT_AUTOINIT'] = 'False'
+    os.environ['TITLE_INDEX_REFRESH_INTERVAL'] = '0'
+    if args.max_concurrent_chats is not None:
+        os.environ['MAX_CONCURRENT_CHATS'] = str(args.max_concurrent_chats)
+    if args.chat_queue_timeout is not None:
+        os.environ['CHAT_QUEUE_TIMEOUT'] = str(args.chat_queue_timeout)
+
+    import app
+    from chatbot import WikiChatbot
+    from index_wiki import fetch_pages, build_index
+    from vector_store import VectorStore
+    from fake_llm import make_fake_llm
+    from hash_embedding import HashEmbeddingFunction
+    from synthetic_wiki import SyntheticWikiDB, create_wiki
+    from common import SQLITE_NOTE
+
+    work_dir = tempfile.mkdtemp(prefix='wikichat-stub-')
+    db_path = args.db or os.path.join(work_dir, 'wiki.sqlite')
+    if not (args.db and os.path.exists(args.db)):
+        print(f"Creating synthetic wiki ({args.pages} pages)...")
+        create_wiki(db_path, pages=args.pages, seed=args.seed)
+
+    db = SyntheticWikiDB(db_path)
+    if not db.connect():
+        sys.exit(1)
+
+    vector_store = None
+    if not args.no_vector:
+        vector_store = VectorStore(persist_directory=os.path.join(work_dir, 'chroma'),
+                                   embedding_function=HashEmbeddingFunction())
+        if not vector_store.initialize():
+            sys.exit(1)
+        build_index(vector_store, fetch_pages(db, limit=10 ** 7))
+
+    llm = make_fake_llm(prefill_tps=args.prefill_tps, decode_tps=args.decode_tps,
+                        answer_tokens=args.answer_tokens)
+    app.init_chatbot(WikiChatbot(db=db, llm=llm, vector_store=vector_store))
+
+    print(f"✓ Stub server ready on http://{args.host}:{args.port}")
+    print(f"⚠️  {SQLITE_NOTE}")
+    app.app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Synthetic MediaWiki 1.43 database for offline benchmarks
+
+Creates the tables the chatbot reads (page, revision, slots, content, text,
+categorylinks, plus slot_roles and content_models) in a SQLite file and
+fills them with a deterministic corpus of product support pages. Pages have
+one to three revisions, about a fifth of the text rows are gzip-compressed
+like $wgCompressRevisions does, and a few pages are redirects. Some pages
+are copy-pasted: older "(EXPIRED)" copies and per-region clones with one
+line added, as near-duplicates for deduplication to find.
+
+SyntheticWikiDB is a WikiDBConnector that runs the connector's own SQL
+against that file, so benchmarks exercise the real queries.
+
+Usage:
+    python3 bench/synthetic_wiki.py wiki.sqlite [--pages 3000] [--seed 42]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_connector import WikiDBConnector
+
+BRANDS = ['Acme', 'Globex', 'Initech', 'Umbrella', 'Stark', 'Wayne', 'Hooli', 'Vandelay']
+MODELS = ['Router X1', 'Router X2', 'Mesh Node', 'CloudDrive', 'MailPro', 'VPN Client',
+          'Smart Hub', 'Security Camera', 'Fibre Modem', 'Payment Terminal']
+TOPICS = ['Password reset', 'Installation guide', 'Troubleshooting', 'Billing FAQ',
+          'Warranty policy', 'Firmware update', 'Factory reset', 'Technical specifications',
+          'Return policy', 'Account setup', 'Data backup', 'Network configuration',
+          'Parental controls', 'Error codes', 'Release notes']
+
+REGIONS = ['UK', 'US', 'HK', 'SG']
+
+SETTINGS = ['Admin password', 'Default IP address', 'Wi-Fi channel', 'Firmware version',
+            'Support hotline', 'Warranty period', 'Return window', 'Backup schedule',
+            'Monthly fee', 'Maximum devices']
+
+SENTENCES = [
+    "The {product} keeps its settings after a restart unless a factory reset is performed.",
+    "Customers on the {plan} plan can contact support at any time for help with {topic_lower}.",
+    "Before you start, make sure the {product} is connected to power and the status light is green.",
+    "Most {topic_lower} questions are answered in the steps below.",
+    "If the problem persists after {minutes} minutes, restart the {product} and try again.",
+    "The warranty covers hardware faults for {months} months from the date of purchase.",
+    "Refunds are processed within {days} business days after the returned item is received.",
+    "Error code E{code} means the {product} could not reach the update server.",
+    "The default administrator password is printed on the label under the device.",
+    "Version {major}.{minor} of the firmware fixed an issue with {topic_lower} on older units.",
+    "Billing questions are handled by the accounts team, not by technical support.",
+    "Data is backed up every {hours} hours when automatic backup is enabled.",
+    "Parental controls can block websites by category and limit screen time per device.",
+    "Up to {devices} devices can be connected to one {product} at the same time.",
+]
+
+SCHEMA = """
+CREATE TABLE page (
+    page_id INTEGER PRIMARY KEY,
+    page_namespace INTEGER NOT NULL,
+    page_title TEXT NOT NULL,
+    page_is_redirect INTEGER NOT NULL DEFAULT 0,
+    page_is_new INTEGER NOT NULL DEFAULT 0,
+    page_random REAL NOT NULL,
+    page_touched TEXT NOT NULL,
+    page_links_updated TEXT,
+    page_latest INTEGER NOT NULL,
+    page_len INTEGER NOT NULL,
+    page_content_model TEXT,
+    page_lang TEXT
+);
+CREATE UNIQUE INDEX page_name_title ON page (page_namespace, page_title);
+CREATE INDEX page_redirect_namespace_len ON page (page_is_redirect, page_namespace, page_len);
+
+CREATE TABLE revision (
+    rev_id INTEGER PRIMARY KEY,
+    rev_page INTEGER NOT NULL,
+    rev_comment_id INTEGER NOT NULL DEFAULT 0,
+    rev_actor INTEGER NOT NULL DEFAULT 0,
+    rev_timestamp TEXT NOT NULL,
+    rev_minor_edit INTEGER NOT NULL DEFAULT 0,
+    rev_deleted INTEGER NOT NULL DEFAULT 0,
+    rev_len INTEGER,
+    rev_parent_id INTEGER,
+    rev_sha1 TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX rev_page_timestamp ON revision (rev_page, rev_timestamp);
+
+CREATE TABLE slots (
+    slot_revision_id INTEGER NOT NULL,
+    slot_role_id INTEGER NOT NULL,
+    slot_content_id INTEGER NOT NULL,
+    slot_origin INTEGER NOT NULL,
+    PRIMARY KEY (slot_revision_id, slot_role_id)
+);
+
+CREATE TABLE slot_roles (
+    role_id INTEGER PRIMARY KEY,
+    role_name TEXT NOT NULL
+);
+
+CREATE TABLE content (
+    content_id INTEGER PRIMARY KEY,
+    content_size INTEGER NOT NULL,
+    content_sha1 TEXT NOT NULL,
+    content_model INTEGER NOT NULL,
+    content_address TEXT NOT NULL
+);
+
+CREATE TABLE content_models (
+    model_id INTEGER PRIMARY KEY,
+    model_name TEXT NOT NULL
+);
+
+CREATE TABLE text (
+    old_id INTEGER PRIMARY KEY,
+    old_text BLOB NOT NULL,
+    old_flags TEXT NOT NULL
+);
+
+CREATE TABLE categorylinks (
+    cl_from INTEGER NOT NULL,
+    cl_to TEXT NOT NULL,
+    cl_sortkey TEXT NOT NULL DEFAULT '',
+    cl_sortkey_prefix TEXT NOT NULL DEFAULT '',
+    cl_timestamp TEXT NOT NULL DEFAULT '',
+    cl_collation TEXT NOT NULL DEFAULT '',
+    cl_type TEXT NOT NULL DEFAULT 'page',
+    PRIMARY KEY (cl_from, cl_to)
+);
+CREATE INDEX cl_sortkey ON categorylinks (cl_to, cl_type, cl_sortkey, cl_from);
+"""
+
+
+class _SQLiteCursor:
+    """DictCursor-like wrapper: %s placeholders, rows as dicts"""
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.cursor = connection.cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cursor.close()
+
+    def execute(self, sql, params=()):
+        self.cursor.execute(sql.replace('%s', '?'), tuple(params))
+
+    def _row(self, row):
+        return dict(zip([d[0] for d in self.cursor.description], row))
+
+    def fetchall(self):
+        return [self._row(row) for row in self.cursor.fetchall()]
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        return self._row(row) if row is not None else None
+
+
+class _SQLiteConnection:
+    """The part of the pymysql connection API WikiDBConnector uses"""
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+
+    def cursor(self):
+        return _SQLiteCursor(self.connection)
+
+    def close(self):
+        self.connection.close()
+
+
+class SyntheticWikiDB(WikiDBConnector):
+    """WikiDBConnector backed by a synthetic SQLite wiki"""
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+
+    def open_connection(self):
+        if not os.path.exists(self.path):
+            print(f"Database connection error: {self.path} does not exist")
+            return None
+        return _SQLiteConnection(self.path)
+
+
+def page_title(i: int) -> str:
+    """Deterministic title of the i-th synthetic page"""
+    products = len(BRANDS) * len(MODELS)
+    brand = BRANDS[i % len(BRANDS)]
+    model = MODELS[(i // len(BRANDS)) % len(MODELS)]
+    topic = TOPICS[(i // products) % len(TOPICS)]
+    variant = i // (products * len(TOPICS))
+    title = f"{brand} {model} {topic}"
+    if variant:
+        title += f" (v{variant + 1})"
+    return title
+
+
+def _page_text(rng: random.Random, title: str, revision: int) -> str:
+    """Wikitext for one revision of a page"""
+    brand, rest = title.split(' ', 1)
+    model = next(m for m in MODELS if rest.startswith(m))
+    topic = rest[len(model) + 1:].split(' (')[0]
+    product = f"{brand} {model}"
+
+    def sentence():
+        return rng.choice(SENTENCES).format(
+            product=product, topic_lower=topic.lower(), plan=rng.choice(['Basic', 'Plus', 'Business']),
+            minutes=rng.choice([5, 10, 15]), months=rng.choice([12, 24, 36]), days=rng.choice([5, 7, 10]),
+            code=rng.randint(100, 999), major=rng.randint(1, 4), minor=rng.randint(0, 9),
+            hours=rng.choice([6, 12, 24]), devices=rng.choice([16, 32, 64]))
+
+    lines = [
+        f"{{{{Infobox product|name={product}|brand={brand}|released={rng.randint(2015, 2024)}}}}}",
+        f"'''{title}''' explains {topic.lower()} for the [[{product}]]. " + ' '.join(sentence() for _ in range(2)),
+        "",
+        "== Overview ==",
+        ' '.join(sentence() for _ in range(rng.randint(3, 6))),
+        "",
+        "== Steps ==",
+    ]
+    for step in range(rng.randint(3, 7)):
+        lines.append(f"# Open [[{product} Settings|Settings]] and select '''{rng.choice(SETTINGS)}''' (step {step + 1}).")
+    lines += ["", "== Details ==", '{| class="wikitable"', "! Setting !! Value"]
+    for setting in rng.sample(SETTINGS, rng.randint(3, 6)):
+        lines += ["|-", f"| {setting} || {rng.randint(1, 9999)}"]
+    lines += ["|}", ""]
+    if revision > 0:
+        lines += ["== Notes ==", "<ref>Updated by the support team.</ref> " +
+                  ' '.join(sentence() for _ in range(rng.randint(2, 8))), ""]
+    lines += ["== See also ==",
+              f"* [[{brand} {rng.choice(MODELS)} {rng.choice(TOPICS)}]]",
+              f"* [[{product} {rng.choice(TOPICS)}]]",
+              "",
+              f"[[Category:{brand}]]",
+              f"[[Category:{topic}]]"]
+    return '\n'.join(lines)
+
+
+def create_wiki(path: str, pages: int = 3000, seed: int = 42) -> dict:
+    """Create the synthetic wiki database at path (replacing it); returns counts"""
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed)
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    connection.execute("INSERT INTO slot_roles VALUES (1, 'main')")
+    connection.execute("INSERT INTO content_models VALUES (1, 'wikitext')")
+
+    titles = [page_title(i) for i in range(pages)]
+    # A few redirects and expired copies, like a real support wiki accumulates
+    for i in range(pages // 30):
+        titles.append(f"{titles[i].split(' ', 1)[1]} ({titles[i].split(' ', 1)[0]})")
+    # Copy-pasted pages: index -> index of the page they copy
+    copy_of = {}
+    for i in range(pages // 20):
+        copy_of[len(titles)] = i * 7 % pages
+        titles.append(f"{titles[i * 7 % pages]} (EXPIRED)")
+    for i in range(pages // 25):
+        copy_of[len(titles)] = i * 11 % pages
+        titles.append(f"{titles[i * 11 % pages]} ({REGIONS[i % len(REGIONS)]})")
+
+    counts = {'pages': 0, 'redirects': 0, 'copies': 0, 'revisions': 0, 'gzip_texts': 0, 'text_bytes': 0}
+    latest_text = {}
+    rev_id = 0
+    for page_id, title in enumerate(titles, 1):
+        is_redirect = page_id > pages and page_id <= pages + pages // 30
+        source = copy_of.get(page_id - 1)
+        revisions = 1 if is_redirect or source is not None else rng.randint(1, 3)
+        parent = None
+        for revision in range(revisions):
+            rev_id += 1
+            year = 2024
+            if is_redirect:
+                text = f"#REDIRECT [[{titles[page_id - pages - 1]}]]"
+            elif source is not None and title.endswith('(EXPIRED)'):
+                text = latest_text[source]
+                year = 2023
+            elif source is not None:
+                region = title.rsplit('(', 1)[1].rstrip(')')
+                text = latest_text[source] + f"\nThis page applies to customers in the {region}."
+            else:
+                text = _page_text(rng, title, revision)
+            data = text.encode('utf-8')
+            timestamp = f"{year}{(revision % 12) + 1:02d}{rng.randint(1, 28):02d}{rng.randint(0, 23):02d}0000"
+
+            if rng.random() < 0.2:
+                compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+                stored, flags = compressor.compress(data) + compressor.flush(), 'utf-8,gzip'
+                counts['gzip_texts'] += 1
+            else:
+                stored, flags = text, 'utf-8'
+            connection.execute("INSERT INTO text VALUES (?, ?, ?)", (rev_id, stored, flags))
+            connection.execute("INSERT INTO content VALUES (?, ?, ?, 1, ?)",
+                               (rev_id, len(data), f"{zlib.crc32(data):x}", f"tt:{rev_id}"))
+            connection.execute("INSERT INTO slots VALUES (?, 1, ?, ?)", (rev_id, rev_id, rev_id))
+            connection.execute(
+                "INSERT INTO revision (rev_id, rev_page, rev_timestamp, rev_len, rev_parent_id) VALUES (?, ?, ?, ?, ?)",
+                (rev_id, page_id, timestamp, len(data), parent))
+            parent = rev_id
+            counts['revisions'] += 1
+            counts['text_bytes'] += len(data)
+
+        connection.execute(
+            "INSERT INTO page (page_id, page_namespace, page_title, page_is_redirect, page_random, "
+            "page_touched, page_latest, page_len, page_content_model) VALUES (?, 0, ?, ?, ?, ?, ?, ?, 'wikitext')",
+            (page_id, title.replace(' ', '_'), int(is_redirect), rng.random(), timestamp, rev_id, len(data)))
+        if not is_redirect:
+            brand, rest = title.split(' ', 1)
+            topic = next(t for t in TOPICS if t in rest)
+            for category in (brand, topic.replace(' ', '_')):
+                connection.execute("INSERT INTO categorylinks (cl_from, cl_to, cl_sortkey) VALUES (?, ?, ?)",
+                                   (page_id, category, title.upper()))
+        latest_text[page_id - 1] = text
+        counts['pages'] += 1
+        counts['redirects'] += int(is_redirect)
+        counts['copies'] += int(source is not None)
+
+    connection.commit()
+    connection.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create a synthetic MediaWiki 1.43 database (SQLite)")
+    parser.add_argument('path', help="SQLite file to create (replaced if it exists)")
+    parser.add_argument('--pages', type=int, default=3000, help="Number of regular pages")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    start = time.time()
+    counts = create_wiki(args.path, pages=args.pages, seed=args.seed)
+    print(f"✓ Created {args.path} in {time.time() - start:.1f}s: "
+          f"{counts['pages']} pages ({counts['redirects']} redirects, {counts['copies']} copies), "
+          f"{counts['revisions']} revisions, "
+          f"{counts['text_bytes'] / (1024 * 1024):.1f} MB of text")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark: wikitext.wikitext_to_text vs the old regex chain
+
+Usage:
+    python3 bench/wikitext_bench.py [--size-mb 8] [--repeat 3] [--json out.json]
+
+The fixture corpus in bench/fixtures/*.wiki is repeated until it reaches
+--size-mb, then both converters are timed on every page. A second run feeds
+both converters pages with unclosed links of growing size to show how they
+scale on malformed markup.
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wikitext import wikitext_to_text
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def legacy_clean_wiki_text(text: str) -> str:
+    """The previous WikiChatbot.clean_wiki_text, kept for comparison"""
+    if not text:
+        return ""
+
+    text = re.sub(r'\[\[([^\]|]+)\|([^\]]+)\]\]', r'\2', text)  # [[link|text]] -> text
+    text = re.sub(r'\[\[([^\]]+)\]\]', r'\1', text)  # [[link]] -> link
+    text = re.sub(r'\{\{[^\}]+\}\}', '', text)  # Remove templates
+    text = re.sub(r'==+\s*([^=]+)\s*==+', r'\1:', text)  # Headers
+    text = re.sub(r"'''([^']+)'''", r'\1', text)  # Bold
+    text = re.sub(r"''([^']+)''", r'\1', text)  # Italic
+    text = re.sub(r'<[^>]+>', '', text)  # HTML tags
+    text = re.sub(r'\n\n+', '\n\n', text)  # Multiple newlines
+
+    return text.strip()
+
+
+def load_corpus(size_mb: float):
+    """Fixture pages repeated up to roughly size_mb megabytes"""
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, '*.wiki'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            fixtures.append(f.read())
+    if not fixtures:
+        raise SystemExit(f"No fixtures found in {FIXTURE_DIR}")
+
+    target = int(size_mb * 1024 * 1024)
+    corpus = []
+    total = 0
+    i = 0
+    while total < target:
+        # Vary pages slightly so nothing can be cached between iterations
+        page = fixtures[i % len(fixtures)] + f"\n<!-- copy {i} -->\n"
+        corpus.append(page)
+        total += len(page.encode('utf-8'))
+        i += 1
+    return corpus, total
+
+
+def time_converter(func, corpus, repeat: int) -> float:
+    """Best wall time over `repeat` runs of func over the corpus"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for page in corpus:
+            func(page)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def time_scaling(func, sizes):
+    """Milliseconds per page of n unclosed "[[Link|label" fragments"""
+    timings = {}
+    for n in sizes:
+        page = "[[Link|label " * n
+        start = time.perf_counter()
+        func(page)
+        timings[str(n)] = round((time.perf_counter() - start) * 1000, 2)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark wikitext conversion throughput")
+    parser.add_argument('--size-mb', type=float, default=8.0, help="Corpus size in MB")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per converter (best is kept)")
+    parser.add_argument('--scaling-sizes', default='500,1000,2000,4000',
+                        help="Comma-separated fragment counts for the unclosed-link run")
+    parser.add_argument('--json', dest='json_path', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    corpus, total_bytes = load_corpus(args.size_mb)
+    megabytes = total_bytes / (1024 * 1024)
+
+    sizes = [int(n) for n in args.scaling_sizes.split(',') if n]
+
+    results = {
+        'corpus_pages': len(corpus),
+        'corpus_mb': round(megabytes, 2),
+        'converters': {},
+        'unclosed_link_ms': {}
+    }
+    for name, func in (('legacy_regex', legacy_clean_wiki_text), ('wikitext', wikitext_to_text)):
+        seconds = time_converter(func, corpus, args.repeat)
+        results['converters'][name] = {
+            'seconds': round(seconds, 4),
+            'mb_per_second': round(megabytes / seconds, 2),
+            'pages_per_second': round(len(corpus) / seconds, 1)
+        }
+        results['unclosed_link_ms'][name] = time_scaling(func, sizes)
+
+    print("=" * 60)
+    print(f"Wikitext conversion: {len(corpus)} pages, {megabytes:.2f} MB")
+    print("=" * 60)
+    for name, stats in results['converters'].items():
+        print(f"  {name:<14} {stats['mb_per_second']:>8.2f} MB/s  {stats['pages_per_second']:>10.1f} pages/s")
+
+    print("\nUnclosed links (ms per page by fragment count):")
+    for name, timings in results['unclosed_link_ms'].items():
+        row = '  '.join(f"{n}: {ms}" for n, ms in timings.items())
+        print(f"  {name:<14} {row}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,58 +13,119 @@ Customer Service Agent Persona:
 - Never makes up information outside the context
 """
 
-from db_connector import WikiDBConnector
+from db_connector import WikiDBConnector, normalize_category
 from llm_model import LlamaModel
 from vector_store import VectorStore
 from config import Config
-from typing import Dict, List
+from context_compressor import ContextCompressor
+from wikitext import wikitext_to_text
+from title_index import TitleIndex
+from circuit_breaker import CircuitOpenError
+import circuit_breaker
+import dedup
+import metrics
+from typing import Dict, Iterator, List, Optional, Tuple
+import copy
 import re
+import threading
+import time
+
+REQUESTS = metrics.registry.counter(
+    'wikichat_chat_requests_total', 'Chat requests answered, by retrieval method and mode')
+DUPLICATES = metrics.registry.counter(
+    'wikichat_duplicates_collapsed_total', 'Near-duplicate pages dropped from retrieved context')
 
 class WikiChatbot:
     """Main chatbot logic combining wiki data and LLM"""
     
-    def __init__(self):
+    # Per-page context length when context compression is off
+    MAX_CONTENT_CHARS = 1500
+    # Similarity added per query keyword found in a page title
+    TITLE_KEYWORD_BOOST = 0.15
+    # Similarity added when the question names a page title exactly
+    EXACT_TITLE_BOOST = 0.5
+    # Questions retrieved together by chat_batch()
+    BATCH_CHUNK_SIZE = 32
+    # Retrieval methods from best to most degraded; a request reports the most degraded one it used
+    RETRIEVAL_METHODS = ('vector_search', 'keyword_search', 'local_search')
+    
+    def __init__(self, db: Optional[WikiDBConnector] = None, llm: Optional[LlamaModel] = None,
+                 vector_store: Optional[VectorStore] = None):
+        """Components can be passed in (e.g. by benchmarks); passed ones are used as they are"""
         self.config = Config()
-        self.db = WikiDBConnector()
-        self.llm = LlamaModel()
+        self.db = db or WikiDBConnector()
+        self.llm = llm or LlamaModel()
         self.vector_store = None
+        self.vector_ready = False
+        # The configured vector store while it can't be opened; the probe retries it
+        self.failed_vector_store = None
+        self.last_index_check = time.monotonic()
+        self.compressor = None
         
-        self.db.connect()
-        self.llm.load_model()
+        if not self.db.connected:
+            self.db.connect()
+        if llm is None:
+            self.llm.load_model()
+        
+        # Page titles for autocompletion and exact-title matching
+        self.titles = TitleIndex()
+        self.titles.load(self.db)
+        if self.config.TITLE_INDEX_REFRESH_INTERVAL > 0:
+            threading.Thread(target=self._refresh_titles_loop, daemon=True).start()
         
         # Initialize vector store if enabled
-        if self.config.USE_VECTOR_SEARCH:
+        if vector_store is not None:
+            self.vector_store = vector_store
             try:
-                self.vector_store = VectorStore(persist_directory=self.config.VECTOR_DB_PATH)
-                if self.vector_store.initialize():
-                    if not self.vector_store.is_empty():
-                        print(f"✓ Vector search enabled ({self.vector_store.collection.count()} documents)")
-                    else:
-                        print("⚠️  Vector store is empty. Run index_wiki.py to populate it.")
-                        self.vector_store = None
-                else:
-                    print("⚠️  Vector store initialization failed. Using keyword search only.")
-                    self.vector_store = None
+                self.vector_ready = not vector_store.is_empty()
             except Exception as e:
-                print(f"⚠️  Vector store error: {e}. Using keyword search only.")
-                self.vector_store = None
-    
-    def clean_wiki_text(self, text: str) -> str:
-        """Remove MediaWiki markup for cleaner context"""
-        if not text:
-            return ""
-        
-        # Remove common wiki markup
-        text = re.sub(r'\[\[([^\]|]+)\|([^\]]+)\]\]', r'\2', text)  # [[link|text]] -> text
-        text = re.sub(r'\[\[([^\]]+)\]\]', r'\1', text)  # [[link]] -> link
-        text = re.sub(r'\{\{[^\}]+\}\}', '', text)  # Remove templates
-        text = re.sub(r'==+\s*([^=]+)\s*==+', r'\1:', text)  # Headers
-        text = re.sub(r"'''([^']+)'''", r'\1', text)  # Bold
-        text = re.sub(r"''([^']+)''", r'\1', text)  # Italic
-        text = re.sub(r'<[^>]+>', '', text)  # HTML tags
-        text = re.sub(r'\n\n+', '\n\n', text)  # Multiple newlines
-        
-        return text.strip()
+                print(f"⚠️  Vector store error: {e}. Using keyword search until it answers.")
+        elif self.config.USE_VECTOR_SEARCH:
+            self._open_vector_store()
+        
+        # Context compression reuses the vector store's embedding model when available
+        if self.config.CONTEXT_COMPRESSION:
+            self.compressor = ContextCompressor(
+                token_budget=self.config.CONTEXT_TOKEN_BUDGET,
+                embed=self.vector_store.embed if self.vector_store else None,
+                count_tokens=self.llm.count_tokens
+            )
+            print(f"✓ Context compression enabled ({self.config.CONTEXT_TOKEN_BUDGET} token budget)")
+        
+        # Re-enable dependencies that failed once they answer again
+        if self.config.HEALTH_PROBE_INTERVAL > 0:
+            threading.Thread(target=self._probe_loop, daemon=True).start()
+    
+    def _open_vector_store(self) -> bool:
+        """Open the configured vector store; on failure keyword search is used until a probe succeeds"""
+        # A retry reuses the failed store, with its embedding model and workers
+        vector_store = self.failed_vector_store
+        try:
+            if vector_store is None:
+                vector_store = VectorStore(persist_directory=self.config.VECTOR_DB_PATH)
+            if vector_store.initialize():
+                # An empty store is kept: a later index build is picked up without a restart
+                vector_ready = not vector_store.is_empty()
+                self.vector_store = vector_store
+                self.vector_ready = vector_ready
+                self.failed_vector_store = None
+                if self.compressor and self.compressor.embed is None:
+                    self.compressor.embed = vector_store.embed
+                if vector_ready:
+                    print(f"✓ Vector search enabled ({vector_store.collection.count()} documents)")
+                else:
+                    print("⚠️  Vector store is empty. Run index_wiki.py to populate it. Using keyword search until then.")
+                return True
+            print("⚠️  Vector store initialization failed. Using keyword search until it recovers.")
+        except Exception as e:
+            print(f"⚠️  Vector store error: {e}. Using keyword search until it recovers.")
+        self.failed_vector_store = vector_store
+        return False
+    
+    def clean_wiki_text(self, text: str, max_chars: Optional[int] = None) -> str:
+        """Remove MediaWiki markup for cleaner context (cut to max_chars, if given)"""
+        with metrics.span('clean_text'):
+            return wikitext_to_text(text, max_chars=max_chars)
     
     def extract_keywords(self, query: str) -> str:
         """Extract important keywords from user query"""
@@ -91,108 +152,348 @@ class WikiChatbot:
         keywords = [w for w in words if w not in stop_words and len(w) > 1]
         return ' '.join(keywords[:6])  # Limit to top 6 keywords
     
-    def retrieve_context(self, query: str, max_pages: int = 3) -> List[Dict]:
-        """Retrieve relevant wiki pages for the query"""
+    @staticmethod
+    def make_filters(categories=None, namespaces=None) -> Optional[Dict]:
+        """Retrieval filters from request values (a name or list of each), None if there are none"""
+        if isinstance(categories, str):
+            categories = [categories]
+        if isinstance(namespaces, (int, str)):
+            namespaces = [namespaces]
+        filters = {}
+        categories = [normalize_category(c) for c in categories or [] if normalize_category(c)]
+        if categories:
+            filters['categories'] = categories
+        if namespaces:
+            filters['namespaces'] = [int(n) for n in namespaces]
+        return filters or None
+    
+    def embed_query(self, query: str) -> Optional[List[float]]:
+        """Embed the query once so retrieval and compression can share it"""
+        embeddings = self.embed_queries([query])
+        return embeddings[0] if embeddings else None
+    
+    def embed_queries(self, queries: List[str]) -> Optional[List[List[float]]]:
+        """Embed several queries in one model call (None if embeddings aren't used)"""
+        if not queries or not self.vector_store or not (self.vector_ready or self.compressor):
+            return None
+        try:
+            return self.vector_store.embed(queries)
+        except CircuitOpenError:
+            return None
+        except Exception as e:
+            print(f"Query embedding error: {e}")
+            return None
+    
+    def _truncate_content(self, content: str) -> str:
+        """Cut page content to MAX_CONTENT_CHARS"""
+        if len(content) > self.MAX_CONTENT_CHARS:
+            return content[:self.MAX_CONTENT_CHARS] + "..."
+        return content
+    
+    def _limit_content(self, content: str) -> str:
+        """Truncate page content unless the compressor will trim it to its budget"""
+        if self.compressor is None:
+            return self._truncate_content(content)
+        return content
+    
+    def _refresh_titles_loop(self):
+        """Apply page creations, moves and deletions to the title index periodically"""
+        while True:
+            time.sleep(self.config.TITLE_INDEX_REFRESH_INTERVAL)
+            try:
+                self.titles.refresh(self.db)
+            except Exception as e:
+                print(f"Title index refresh error: {e}")
+    
+    def _probe_loop(self):
+        """Re-probe failed dependencies every HEALTH_PROBE_INTERVAL seconds"""
+        while True:
+            time.sleep(self.config.HEALTH_PROBE_INTERVAL)
+            try:
+                self.probe_dependencies()
+            except Exception as e:
+                print(f"Dependency probe error: {e}")
+    
+    def probe_dependencies(self) -> Dict[str, bool]:
+        """Check dependencies that are down and re-enable the ones that answer
+        
+        Only dependencies whose circuit breaker is open (or a vector store
+        that failed to open) are probed; probes go through even while a
+        breaker is open. Returns whether each dependency is usable.
+        """
+        status = {}
+        
+        db_breaker = circuit_breaker.get('mariadb')
+        if not db_breaker.available():
+            self.db.ping()
+        status['mariadb'] = db_breaker.available()
+        
+        if self.vector_store is None:
+            if self.failed_vector_store is not None:
+                self._open_vector_store()
+            status['vector_store'] = self.vector_store is not None
+        else:
+            if not self.vector_store.breaker.available():
+                if self.vector_store.ping():
+                    # The index may have been rebuilt while the store was down
+                    self.refresh_vector_index(force=True)
+            elif not self.vector_ready:
+                self.refresh_vector_index(force=True)
+            status['vector_store'] = self.vector_store.breaker.available()
+        return status
+    
+    def refresh_vector_index(self, force: bool = False) -> bool:
+        """Switch to a newly activated index version, if any
+        
+        Checks the version pointer at most every INDEX_RELOAD_INTERVAL seconds
+        unless forced. Returns True if the index changed.
+        """
+        if not self.vector_store:
+            return False
+        now = time.monotonic()
+        if not force and now - self.last_index_check < self.config.INDEX_RELOAD_INTERVAL:
+            return False
+        self.last_index_check = now
+        
+        try:
+            changed = self.vector_store.reload_if_changed()
+            if changed or force:
+                self.vector_ready = not self.vector_store.is_empty()
+            return changed
+        except Exception as e:
+            print(f"Index reload error: {e}")
+            return False
+    
+    def retrieve_context(self, query: str, max_pages: int = 3,
+                         query_embedding: Optional[List[float]] = None,
+                         filters: Optional[Dict] = None) -> List[Dict]:
+        """Retrieve relevant wiki pages for the query
+        
+        filters (from make_filters) limit the search to pages in any of the
+        given categories and namespaces.
+        """
+        self.refresh_vector_index()
         
         # Use vector search if available
-        if self.vector_store:
-            return self._retrieve_context_vector(query, max_pages)
+        if self._use_vector_search():
+            return self._retrieve_context_vector(query, max_pages, query_embedding, filters)
         else:
-            return self._retrieve_context_keyword(query, max_pages)
+            return self._retrieve_context_keyword(query, max_pages, filters)
+    
+    def _use_vector_search(self) -> bool:
+        """True if the vector store is ready (a store that failed to open counts as unavailable)"""
+        if self.vector_store is None and self.failed_vector_store is not None:
+            circuit_breaker.note_unavailable('vector_store')
+        return bool(self.vector_store and self.vector_ready)
     
-    def _retrieve_context_vector(self, query: str, max_pages: int = 3) -> List[Dict]:
+    def _note_retrieval(self, method: str):
+        """Record a retrieval method used by the current request (the most degraded one is reported)"""
+        timings = metrics.current_timings()
+        if timings is None:
+            return
+        current = timings.values.get('retrieval_method')
+        if current is None or self.RETRIEVAL_METHODS.index(method) > self.RETRIEVAL_METHODS.index(current):
+            timings.set('retrieval_method', method)
+    
+    def _retrieve_context_vector(self, query: str, max_pages: int = 3,
+                                 query_embedding: Optional[List[float]] = None,
+                                 filters: Optional[Dict] = None) -> List[Dict]:
         """Retrieve context using hybrid vector + keyword search with expired page filtering"""
+        query_embeddings = [query_embedding] if query_embedding is not None else None
+        return self._retrieve_context_vector_batch([query], max_pages, query_embeddings, filters)[0]
+    
+    def _retrieve_context_vector_batch(self, queries: List[str], max_pages: int = 3,
+                                       query_embeddings: Optional[List[List[float]]] = None,
+                                       filters: Optional[Dict] = None) -> List[List[Dict]]:
+        """Hybrid retrieval for several queries: one vector query, one page fetch for all of them"""
         try:
-            # Search vector store with more results to filter
-            vector_results = self.vector_store.search(query, top_k=max_pages * 4)
-            
-            # Filter out expired/outdated pages and prioritize exact title matches
-            filtered_results = []
-            query_lower = query.lower()
-            keywords = self.extract_keywords(query).lower().split()
+            # Search vector store with more results to filter (filters apply inside the search)
+            vector_results = self.vector_store.search_batch(queries, top_k=max_pages * 4,
+                                                            query_embeddings=query_embeddings,
+                                                            **(filters or {}))
+            if filters and not any(vector_results):
+                # Index built before categories were stored, or nothing in scope
+                return [self._retrieve_context_keyword(query, max_pages, filters) for query in queries]
+            ranked = [self._rank_vector_results(query, results, max_pages, filters)
+                      for query, results in zip(queries, vector_results)]
             
-            for result in vector_results:
-                title = result['title']
-                title_lower = title.lower()
-                original_score = result.get('similarity_score', 0)
-                
-                # Skip expired/outdated pages unless explicitly asked for
-                if ('expired' in query_lower or 'outdated' in query_lower):
-                    pass  # Include them if user asks
-                elif ('(expired)' in title_lower or '(outdated)' in title_lower or 
-                      title_lower.endswith('(expired)') or title_lower.endswith('(outdated)') or
-                      title_lower.startswith('(expired)') or title_lower.startswith('(outdated)')):
-                    continue  # Skip expired pages
-                
-                # Boost score if title contains keywords (helps with exact matches)
-                boost = 0
-                for keyword in keywords:
-                    if len(keyword) >= 3 and keyword in title_lower:
-                        boost += 0.15
-                
-                result['adjusted_similarity'] = original_score + boost
-                filtered_results.append(result)
-            
-            # Sort by adjusted similarity and take top results
-            filtered_results.sort(key=lambda x: x.get('adjusted_similarity', 0), reverse=True)
-            filtered_results = filtered_results[:max_pages]
+            # Get full page content from database in one round trip
+            page_ids = sorted(set(result['page_id'] for results in ranked for result in results))
+            pages_by_id = {page['page_id']: page for page in self.db.get_pages_by_ids(page_ids)}
             
-            context_pages = []
-            for result in filtered_results:
-                # Get full page content from database
-                page_data = self.db.get_page_by_title(result['title'].replace(' ', '_'))
-                
-                if page_data:
-                    content = page_data.get('content', '')
-                    if isinstance(content, bytes):
-                        content = content.decode('utf-8', errors='ignore')
-                    content = self.clean_wiki_text(content)
-                    
-                    # Limit content length
-                    if len(content) > 1500:
-                        content = content[:1500] + "..."
+            # Pages shared by several queries are cleaned once
+            cleaned = {}
+            if 'mariadb' in circuit_breaker.unavailable_in_request():
+                # Database down: cached or indexed text stands in for the pages it didn't return
+                cleaned = self._local_page_texts([page_id for page_id in page_ids if page_id not in pages_by_id])
+            batch_pages = []
+            for results in ranked:
+                context_pages = []
+                for result in results:
+                    page_data = pages_by_id.get(result['page_id'])
                     
-                    context_pages.append({
-                        'title': result['title'],
-                        'content': content,
-                        'similarity': result.get('adjusted_similarity')
-                    })
+                    if page_data or result['page_id'] in cleaned:
+                        if result['page_id'] not in cleaned:
+                            content = page_data.get('content', '')
+                            if isinstance(content, bytes):
+                                content = content.decode('utf-8', errors='ignore')
+                            cleaned[result['page_id']] = self._limit_content(self.clean_wiki_text(content))
+                        
+                        context_pages.append({
+                            'title': result['title'],
+                            'content': cleaned[result['page_id']],
+                            'similarity': result.get('adjusted_similarity')
+                        })
+                batch_pages.append(context_pages)
             
-            return context_pages
+            self._note_retrieval('vector_search')
+            return batch_pages
             
+        except CircuitOpenError:
+            # Vector store known to be down: no need to log every request
+            return [self._retrieve_context_keyword(query, max_pages, filters) for query in queries]
         except Exception as e:
             print(f"Vector search error: {e}. Falling back to keyword search.")
-            return self._retrieve_context_keyword(query, max_pages)
+            return [self._retrieve_context_keyword(query, max_pages, filters) for query in queries]
+    
+    def _rank_vector_results(self, query: str, vector_results: List[Dict], max_pages: int,
+                             filters: Optional[Dict] = None) -> List[Dict]:
+        """Drop expired pages, boost title matches and keep the best max_pages results"""
+        # Pages whose whole title appears in the question (hash lookups)
+        exact_ids = self.titles.match_titles(query)
+        
+        # Named pages the vector search missed still get a chance via the boost
+        returned_ids = set(result['page_id'] for result in vector_results)
+        title_pages = self.titles.pages  # a refresh swaps in a new dict
+        missed_ids = [page_id for page_id in exact_ids
+                      if page_id in title_pages and page_id not in returned_ids]
+        if missed_ids and filters:
+            missed_ids = self._filter_page_ids(missed_ids, filters)
+        signatures = self._page_signatures(missed_ids) if missed_ids else {}
+        for page_id in missed_ids:
+            vector_results.append({
+                'page_id': page_id,
+                'title': title_pages[page_id]['title'],
+                'similarity_score': 0.0,
+                'minhash': signatures.get(page_id, '')
+            })
+        
+        # Filter out expired/outdated pages and prioritize exact title matches
+        filtered_results = []
+        query_lower = query.lower()
+        keywords = [k for k in self.extract_keywords(query).lower().split() if len(k) >= 3]
+        
+        for result in vector_results:
+            title = result['title']
+            title_lower = title.lower()
+            original_score = result.get('similarity_score') or 0
+            
+            # Skip expired/outdated pages unless explicitly asked for
+            if ('expired' in query_lower or 'outdated' in query_lower):
+                pass  # Include them if user asks
+            elif ('(expired)' in title_lower or '(outdated)' in title_lower or 
+                  title_lower.endswith('(expired)') or title_lower.endswith('(outdated)') or
+                  title_lower.startswith('(expired)') or title_lower.startswith('(outdated)')):
+                continue  # Skip expired pages
+            
+            # Boost score if title contains keywords (helps with exact matches)
+            boost = self.TITLE_KEYWORD_BOOST * sum(1 for keyword in keywords if keyword in title_lower)
+            if result['page_id'] in exact_ids:
+                boost += self.EXACT_TITLE_BOOST
+            
+            result['adjusted_similarity'] = original_score + boost
+            filtered_results.append(result)
+        
+        # Sort by adjusted similarity and take top results
+        filtered_results.sort(key=lambda x: x.get('adjusted_similarity', 0), reverse=True)
+        filtered_results = self._collapse_duplicates(filtered_results,
+                                                     lambda result: dedup.decode(result.get('minhash')))
+        return filtered_results[:max_pages]
+    
+    def _page_signatures(self, page_ids: List[int]) -> Dict[int, str]:
+        """Near-duplicate signatures of pages from their text, as the indexer computes them"""
+        if self.config.DEDUP_THRESHOLD <= 0:
+            return {}
+        signatures = {}
+        for page in self.db.get_pages_by_ids(page_ids):
+            content = page.get('content', '')
+            if isinstance(content, bytes):
+                content = content.decode('utf-8', errors='ignore')
+            signatures[page['page_id']] = dedup.encode(dedup.signature(self.clean_wiki_text(content)))
+        return signatures
+    
+    def _collapse_duplicates(self, results: List[Dict], get_signature) -> List[Dict]:
+        """Keep one of each group of near-duplicate results (the current page with the newest revision)"""
+        threshold = self.config.DEDUP_THRESHOLD
+        if threshold <= 0 or len(results) < 2:
+            return results
+        kept, dropped = dedup.collapse(
+            results, threshold, get_signature,
+            lambda result: dedup.preference(result['title'], result.get('rev_timestamp'))
+        )
+        if dropped:
+            DUPLICATES.inc(dropped)
+            timings = metrics.current_timings()
+            if timings is not None:
+                timings.set('duplicates_collapsed', timings.values.get('duplicates_collapsed', 0) + dropped)
+        return kept
+    
+    def _filter_page_ids(self, page_ids: List[int], filters: Dict) -> List[int]:
+        """Pages (all from the title index, so main namespace) that are in scope of the filters"""
+        if filters.get('namespaces') and 0 not in filters['namespaces']:
+            return []
+        if not filters.get('categories'):
+            return page_ids
+        wanted = set(filters['categories'])
+        page_categories = self.db.get_page_categories(page_ids)
+        return [page_id for page_id in page_ids if wanted & set(page_categories.get(page_id, []))]
     
-    def _retrieve_context_keyword(self, query: str, max_pages: int = 3) -> List[Dict]:
+    def _retrieve_context_keyword(self, query: str, max_pages: int = 3,
+                                  filters: Optional[Dict] = None) -> List[Dict]:
         """Retrieve context using keyword search"""
         # Extract keywords from the question
         keywords = self.extract_keywords(query)
+        filters = filters or {}
+        # Fetch spare pages so collapsing near-duplicates still leaves max_pages
+        dedupe = self.config.DEDUP_THRESHOLD > 0
+        limit = max_pages * 2 if dedupe else max_pages
+        
+        def search(terms):
+            # Once the database has failed, the narrower searches would only wait on it too
+            if 'mariadb' in circuit_breaker.unavailable_in_request():
+                return []
+            return self.db.search_pages(terms, limit=limit, **filters) or []
         
         # Try searching with all keywords first
-        results = self.db.search_pages(keywords, limit=max_pages)
+        results = search(keywords)
         
         # If no results, try with fewer keywords (progressively)
         if not results and len(keywords.split()) > 2:
             # Try first 3 keywords
             keywords_reduced = ' '.join(keywords.split()[:3])
-            results = self.db.search_pages(keywords_reduced, limit=max_pages)
+            results = search(keywords_reduced)
             
             # Try first 2 keywords
             if not results and len(keywords.split()) > 1:
                 keywords_reduced = ' '.join(keywords.split()[:2])
-                results = self.db.search_pages(keywords_reduced, limit=max_pages)
+                results = search(keywords_reduced)
         
         # If still no results, try each keyword individually (prioritize longer keywords first)
         if not results:
             sorted_keywords = sorted(keywords.split(), key=len, reverse=True)
             for keyword in sorted_keywords[:4]:
                 if len(keyword) >= 2:  # Allow 2-char keywords like "BE"
-                    results = self.db.search_pages(keyword, limit=max_pages)
+                    results = search(keyword)
                     if results:
                         break
         
+        if not results and 'mariadb' in circuit_breaker.unavailable_in_request():
+            return self._retrieve_context_local(query, max_pages, filters)
+        self._note_retrieval('keyword_search')
+        
         context_pages = []
+        signatures = []
+        timestamps = []
         for result in results:
             # Handle bytes from database
             page_title = result['page_title']
@@ -203,18 +504,100 @@ class WikiChatbot:
             content = result.get('content', '')
             if isinstance(content, bytes):
                 content = content.decode('utf-8', errors='ignore')
-            content = self.clean_wiki_text(content)
-            
             # Limit content length to avoid context overflow
-            if len(content) > 1500:
-                content = content[:1500] + "..."
+            content = self._limit_content(self.clean_wiki_text(content))
             
             context_pages.append({
                 'title': page_title,
                 'content': content
             })
+            signatures.append(dedup.signature(content) if dedupe else [])
+            timestamps.append(result.get('rev_timestamp'))
+        
+        if dedupe:
+            candidates = [{'title': page['title'], 'rev_timestamp': timestamp, 'index': i}
+                          for i, (page, timestamp) in enumerate(zip(context_pages, timestamps))]
+            candidates = self._collapse_duplicates(candidates, lambda candidate: signatures[candidate['index']])
+            context_pages = [context_pages[candidate['index']] for candidate in candidates]
+        
+        return context_pages[:max_pages]
+    
+    def _retrieve_context_local(self, query: str, max_pages: int = 3,
+                                filters: Optional[Dict] = None) -> List[Dict]:
+        """Retrieve context without the database, for when MariaDB is unavailable
         
-        return context_pages
+        Pages are found in the title index (titles named in the question,
+        then titles sharing its keywords); their text comes from the page
+        cache or the vector index.
+        """
+        self._note_retrieval('local_search')
+        filters = filters or {}
+        if filters.get('namespaces') and 0 not in filters['namespaces']:
+            return []  # the title index has main namespace pages only
+        
+        exact_ids = set(self.titles.match_titles(query))
+        keywords = set(k for k in self.extract_keywords(query).lower().split() if len(k) >= 3)
+        query_lower = query.lower()
+        include_expired = 'expired' in query_lower or 'outdated' in query_lower
+        
+        title_pages = self.titles.pages  # a refresh swaps in a new dict
+        scored = []
+        for page_id, entry in title_pages.items():
+            if entry['redirect'] or (entry['expired'] and not include_expired):
+                continue
+            score = self.TITLE_KEYWORD_BOOST * len(keywords & entry['words'])
+            if page_id in exact_ids:
+                score += self.EXACT_TITLE_BOOST
+            if score > 0:
+                scored.append((score, page_id))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        
+        # Spare candidates for pages that are in neither the cache nor the index
+        candidates = [page_id for _, page_id in scored[:max_pages * 4]]
+        texts = self._local_page_texts(candidates, filters.get('categories'))
+        return [{'title': title_pages[page_id]['title'], 'content': texts[page_id]}
+                for page_id in candidates if page_id in texts][:max_pages]
+    
+    def _local_page_texts(self, page_ids: List[int], categories: Optional[List[str]] = None) -> Dict[int, str]:
+        """Cleaned, length-limited text of pages from the page cache, else the vector index
+        
+        With categories only indexed pages in one of them are returned (the
+        cache doesn't know page categories).
+        """
+        texts = {}
+        if not categories:
+            for page_id, content in self.db.content.cached_pages(page_ids).items():
+                texts[page_id] = self._limit_content(self.clean_wiki_text(content))
+        
+        missing = [page_id for page_id in page_ids if page_id not in texts]
+        if missing and self.vector_store:
+            try:
+                documents = self.vector_store.get_documents(missing)
+            except CircuitOpenError:
+                documents = {}
+            except Exception as e:
+                print(f"Indexed page lookup error: {e}")
+                documents = {}
+            wanted = set(categories or [])
+            for page_id, document in documents.items():
+                if not wanted or wanted & set(document['categories']):
+                    # Indexed text is already cleaned
+                    texts[page_id] = self._limit_content(document['content'])
+        return texts
+    
+    def compress_context(self, query: str, context_pages: List[Dict],
+                         query_embedding: Optional[List[float]] = None) -> Tuple[List[Dict], Dict]:
+        """Keep only the query-relevant sentences of the retrieved pages"""
+        keywords = self.extract_keywords(query).split()
+        compressed_pages, stats = self.compressor.compress(query_embedding, keywords, context_pages)
+        
+        # Compare against what the uncompressed path would have sent
+        baseline_tokens = sum(
+            self.llm.count_tokens(self._truncate_content(page['content'])) for page in context_pages
+        )
+        stats['baseline_tokens'] = baseline_tokens
+        stats['tokens_saved'] = max(0, baseline_tokens - stats['compressed_tokens'])
+        return compressed_pages, stats
     
     def build_prompt(self, user_question: str, context_pages: List[Dict]) -> str:
         """Build RAG prompt for customer service agent"""
@@ -249,17 +632,188 @@ ANSWER:"""
         
         return prompt
     
-    def chat(self, user_question: str) -> Dict:
-        """Main RAG chat function with retrieval and generation"""
+    def chat(self, user_question: str, include_timings: bool = False, filters: Optional[Dict] = None) -> Dict:
+        """Main RAG chat function with retrieval and generation
+        
+        With include_timings the response carries per-stage timings, token
+        counts and DB query counts for this request. filters (from
+        make_filters) scope retrieval to categories and namespaces.
+        """
+        timings = metrics.start_request()
+        try:
+            context_pages, prompt, compression = self._prepare(user_question, filters)
+            
+            # Step 3: Generate response from LLM (Generation)
+            generation = {}
+            max_tokens = self._token_budget(user_question, context_pages, compression)
+            answer = self.llm.generate_response(prompt, max_tokens, stats=generation)
+            
+            return self._build_response(user_question, answer, context_pages, compression,
+                                        generation, timings, include_timings, filters)
+        finally:
+            metrics.end_request(timings)
+    
+    def chat_stream(self, user_question: str, include_timings: bool = False,
+                    filters: Optional[Dict] = None) -> Iterator[Dict]:
+        """Like chat(), but yields the answer while it is generated
+        
+        Yields {'type': 'token', 'text': ...} events, then the full response
+        (as chat() returns it) with 'type': 'done'.
+        """
+        timings = metrics.start_request()
+        try:
+            context_pages, prompt, compression = self._prepare(user_question, filters)
+            
+            generation = {}
+            pieces = []
+            max_tokens = self._token_budget(user_question, context_pages, compression)
+            try:
+                for text in self.llm.stream_response(prompt, max_tokens, stats=generation):
+                    pieces.append(text)
+                    yield {'type': 'token', 'text': text}
+                answer = ''.join(pieces).strip()
+            except Exception as e:
+                print(f"Generation error: {e}")
+                answer = f"Error generating response: {str(e)}"
+            
+            response = self._build_response(user_question, answer, context_pages, compression,
+                                            generation, timings, include_timings, filters)
+            response['type'] = 'done'
+            yield response
+        finally:
+            metrics.end_request(timings)
+    
+    def chat_batch(self, questions: List[str], include_timings: bool = False,
+                   filters: Optional[Dict] = None) -> Iterator[Dict]:
+        """Answer many questions; yields one response per question, in order
+        
+        Questions are retrieved BATCH_CHUNK_SIZE at a time with one embedding
+        call, one vector query and one page fetch for the union of their
+        pages. Responses are chat() responses with 'type': 'answer' and
+        their 'index' in questions; a final 'type': 'summary' item has the
+        totals. filters apply to every question.
+        """
+        start = time.perf_counter()
+        chunks = [questions[i:i + self.BATCH_CHUNK_SIZE] for i in range(0, len(questions), self.BATCH_CHUNK_SIZE)]
+        prepare_timings = metrics.Timings()
+        generate_seconds = 0.0
+        completion_tokens = 0
+        seconds_saved = 0.0
+        answered = 0
+        
+        for chunk in chunks:
+            # Retrieved on this thread: the DB connection and the tokenizer are not thread-safe
+            prepared, chunk_timings, chunk_seconds = self._prepare_batch(chunk, filters)
+            for stage, (seconds, calls) in chunk_timings.stages.items():
+                prepare_timings.add(stage, seconds, calls)
+            
+            for question, (context_pages, prompt, compression) in zip(chunk, prepared):
+                timings = metrics.start_request()
+                try:
+                    # Retrieval ran for the whole chunk
+                    for key in ('retrieval_method', 'unavailable'):
+                        if key in chunk_timings.values:
+                            timings.set(key, copy.copy(chunk_timings.values[key]))
+                    generation = {}
+                    max_tokens = self._token_budget(question, context_pages, compression)
+                    answer = self.llm.generate_response(prompt, max_tokens, stats=generation)
+                    response = self._build_response(question, answer, context_pages, compression,
+                                                    generation, timings, include_timings, filters)
+                    generate_seconds += timings.total_seconds()
+                    completion_tokens += generation.get('completion_tokens', 0)
+                    seconds_saved += generation.get('seconds_saved', 0.0)
+                finally:
+                    metrics.end_request(timings)
+                
+                if include_timings:
+                    # This question's share of its chunk's retrieval
+                    response['timings']['batch_prepare_ms'] = round(
+                        chunk_seconds * 1000 / len(chunk), 2)
+                response['type'] = 'answer'
+                response['index'] = answered
+                answered += 1
+                yield response
         
+        seconds = time.perf_counter() - start
+        yield {
+            'type': 'summary',
+            'questions': answered,
+            'seconds': round(seconds, 3),
+            'questions_per_second': round(answered / seconds, 3) if seconds else 0.0,
+            'generate_seconds': round(generate_seconds, 3),
+            'completion_tokens_per_answer': round(completion_tokens / answered, 1) if answered else 0.0,
+            'seconds_saved_per_answer': round(seconds_saved / answered, 3) if answered else 0.0,
+            'prepare_stages_ms': prepare_timings.to_dict()['stages_ms']
+        }
+    
+    def _prepare_batch(self, questions: List[str], filters: Optional[Dict] = None) -> Tuple[List[Tuple[List[Dict], str, Optional[Dict]]],
+                                                            metrics.Timings, float]:
+        """_prepare() for several questions at once, plus the chunk's stage timings and seconds"""
+        timings = metrics.start_request()
+        try:
+            self.refresh_vector_index()
+            query_embeddings = self.embed_queries(questions)
+            with metrics.span('retrieve'):
+                if self._use_vector_search():
+                    batch_pages = self._retrieve_context_vector_batch(questions, 3, query_embeddings, filters)
+                else:
+                    batch_pages = [self._retrieve_context_keyword(question, 3, filters) for question in questions]
+            
+            prepared = []
+            for i, (question, context_pages) in enumerate(zip(questions, batch_pages)):
+                query_embedding = query_embeddings[i] if query_embeddings else None
+                prepared.append(self._augment(question, context_pages, query_embedding))
+            return prepared, timings, timings.total_seconds()
+        finally:
+            # A chunk is not a request: its stages are observed, its total is not
+            metrics.end_request(timings, observe_total=False)
+    
+    def _prepare(self, user_question: str, filters: Optional[Dict] = None) -> Tuple[List[Dict], str, Optional[Dict]]:
+        """Retrieval and augmentation: context pages, prompt and compression stats"""
         # Step 1: Retrieve relevant wiki pages (Retrieval)
-        context_pages = self.retrieve_context(user_question, max_pages=3)
+        query_embedding = self.embed_query(user_question)
+        with metrics.span('retrieve'):
+            context_pages = self.retrieve_context(user_question, max_pages=3, query_embedding=query_embedding,
+                                                  filters=filters)
+        
+        return self._augment(user_question, context_pages, query_embedding)
+    
+    def _augment(self, user_question: str, context_pages: List[Dict],
+                 query_embedding: Optional[List[float]]) -> Tuple[List[Dict], str, Optional[Dict]]:
+        """Compress the retrieved pages (optional) and build the prompt"""
+        # Step 1b: Drop context sentences unrelated to the question (optional)
+        compression = None
+        if self.compressor and context_pages:
+            with metrics.span('compress'):
+                context_pages, compression = self.compress_context(user_question, context_pages, query_embedding)
         
         # Step 2: Build RAG prompt with context (Augmentation)
-        prompt = self.build_prompt(user_question, context_pages)
+        with metrics.span('build_prompt'):
+            prompt = self.build_prompt(user_question, context_pages)
         
-        # Step 3: Generate response from LLM (Generation)
-        answer = self.llm.generate_response(prompt)
+        return context_pages, prompt, compression
+    
+    def _token_budget(self, user_question: str, context_pages: List[Dict],
+                      compression: Optional[Dict]) -> Optional[int]:
+        """Answer token budget for a prepared question (None: the fixed MODEL_MAX_TOKENS)"""
+        if not self.config.ADAPTIVE_MAX_TOKENS:
+            return None
+        if compression is not None:
+            context_tokens = compression['compressed_tokens']
+        else:
+            context_tokens = sum(self.llm.count_tokens(page['content']) for page in context_pages)
+        return self.llm.token_budget(user_question, context_tokens)
+    
+    def _build_response(self, user_question: str, answer: str, context_pages: List[Dict],
+                        compression: Optional[Dict], generation: Dict,
+                        timings: metrics.Timings, include_timings: bool,
+                        filters: Optional[Dict] = None) -> Dict:
+        """Response dict with answer, sources and optional filter, compression and timing blocks"""
+        for key in ('prompt_tokens', 'completion_tokens', 'tokens_per_second', 'max_tokens',
+                    'stop_reason', 'tokens_saved', 'seconds_saved'):
+            if key in generation:
+                timings.set(key, generation[key])
+        timings.set('question_type', self.llm.question_type(user_question))
         
         # Step 4: Extract and format sources with URLs
         sources = []
@@ -272,17 +826,33 @@ ANSWER:"""
                 'url': page_url
             })
         
-        # Add metadata about retrieval method used
-        retrieval_method = "vector_search" if self.vector_store else "keyword_search"
+        # Add metadata about retrieval method used, and the dependencies it had to do without
+        retrieval_method = timings.values.pop('retrieval_method', None) or (
+            "vector_search" if self.vector_store and self.vector_ready else "keyword_search")
+        unavailable = timings.values.pop('unavailable', [])
+        mode = 'degraded' if unavailable else 'normal'
         
-        return {
+        response = {
             'question': user_question,
             'answer': answer,
             'sources': sources,
             'context_used': len(context_pages) > 0,
             'retrieval_method': retrieval_method,
+            'mode': mode,
             'num_sources': len(sources)
         }
+        if unavailable:
+            response['unavailable'] = unavailable
+        if filters:
+            response['filters'] = filters
+        if compression is not None:
+            response['compression'] = compression
+        
+        REQUESTS.inc(retrieval_method=retrieval_method, mode=mode)
+        if include_timings:
+            response['timings'] = timings.to_dict()
+        
+        return response
     
     def close(self):
         """Clean up resources"""
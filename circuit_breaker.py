@@ -0,0 +1,150 @@
+"""
+Circuit breakers for the chatbot's dependencies (MariaDB, the vector store)
+
+A breaker counts consecutive failures of one dependency. After
+BREAKER_FAILURE_THRESHOLD of them it opens, and calls fail at once with
+CircuitOpenError instead of each waiting for a timeout. After
+BREAKER_RESET_TIMEOUT seconds one trial call is let through (half-open):
+its success closes the breaker, its failure opens it again. Probe calls
+(WikiChatbot's background re-probe) are always let through, so a recovered
+dependency is re-enabled without a user request paying for the trial.
+
+There is one breaker per dependency, shared by every connection to it.
+Failures and rejections are also noted on the current request's timings
+('unavailable'), so a response can say which dependencies it ran without.
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config import Config
+import metrics
+
+DEPENDENCY_UP = metrics.registry.gauge(
+    'wikichat_dependency_up', 'Whether a dependency is in use (1) or its circuit breaker is open (0)')
+CIRCUIT_OPENED = metrics.registry.counter(
+    'wikichat_circuit_opened_total', 'Times a dependency circuit breaker opened')
+CIRCUIT_REJECTED = metrics.registry.counter(
+    'wikichat_circuit_rejected_total', 'Calls failed fast because a circuit breaker was open')
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose breaker is open"""
+
+
+def note_unavailable(name: str):
+    """Record on the current request that a dependency could not be used"""
+    timings = metrics.current_timings()
+    if timings is not None:
+        unavailable = timings.values.setdefault('unavailable', [])
+        if name not in unavailable:
+            unavailable.append(name)
+
+
+def unavailable_in_request() -> List[str]:
+    """Dependencies the current request could not use"""
+    timings = metrics.current_timings()
+    return list(timings.values.get('unavailable', [])) if timings is not None else []
+
+
+class CircuitBreaker:
+    """Closed -> open after failure_threshold consecutive failures -> half-open after reset_timeout"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.last_error = None
+        DEPENDENCY_UP.set(1, dependency=name)
+
+    def allow(self, probe: bool = False) -> bool:
+        """True if a call may go to the dependency now
+
+        While open, only probes and (after reset_timeout) one trial call
+        at a time get through.
+        """
+        with self.lock:
+            if self.state == self.CLOSED or probe:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self.trial_running:
+                self.trial_running = True
+                return True
+        CIRCUIT_REJECTED.inc(dependency=self.name)
+        note_unavailable(self.name)
+        return False
+
+    def available(self) -> bool:
+        """False while the breaker is open (no side effects, for choosing a fallback up front)"""
+        with self.lock:
+            return self.state == self.CLOSED
+
+    def record_success(self):
+        with self.lock:
+            if self.state != self.CLOSED:
+                print(f"✓ {self.name} is available again")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial_running = False
+        DEPENDENCY_UP.set(1, dependency=self.name)
+
+    def record_failure(self, error: Exception):
+        note_unavailable(self.name)
+        with self.lock:
+            self.failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+            self.trial_running = False
+            opened = self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.failures >= self.failure_threshold)
+            if opened:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+        if opened:
+            print(f"⚠️  {self.name} circuit opened after {self.failures} failures ({self.last_error})")
+            CIRCUIT_OPENED.inc(dependency=self.name)
+            DEPENDENCY_UP.set(0, dependency=self.name)
+
+    def status(self) -> Dict:
+        with self.lock:
+            status = {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'last_error': self.last_error
+            }
+            if self.state != self.CLOSED:
+                status['open_seconds'] = round(time.monotonic() - self.opened_at, 1)
+            return status
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get(name: str, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None) -> CircuitBreaker:
+    """The shared breaker for a dependency (created with the configured thresholds on first use)"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold if failure_threshold is not None else Config.BREAKER_FAILURE_THRESHOLD,
+                reset_timeout if reset_timeout is not None else Config.BREAKER_RESET_TIMEOUT
+            )
+        return _breakers[name]
+
+
+def status_all() -> Dict[str, Dict]:
+    """State of every dependency breaker, by name"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.status() for breaker in breakers}
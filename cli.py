@@ -1,11 +1,85 @@
 #!/usr/bin/env python3
 """
 Simple CLI interface to test the chatbot
+
+Usage:
+    python3 cli.py                                  # interactive
+    python3 cli.py --batch questions.txt [--output results.jsonl] [--timings]
+
+Batch files have one question per line, or one JSON object per line with a
+"question" and an optional "id" that is copied to the result. Results are
+written as JSON lines in input order, followed by a summary line.
 """
 from chatbot import WikiChatbot
+from contextlib import redirect_stdout
+import argparse
+import json
 import sys
 
+def load_batch(path: str):
+    """Questions and their ids (None if not given) from a batch file, '-' for stdin"""
+    f = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8')
+    try:
+        questions, ids = [], []
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                item = json.loads(line)
+                questions.append(item['question'])
+                ids.append(item.get('id'))
+            else:
+                questions.append(line)
+                ids.append(None)
+        return questions, ids
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def run_batch(args):
+    """Answer every question in the batch file, writing JSON lines"""
+    questions, ids = load_batch(args.batch)
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    
+    try:
+        # Keep stdout clean for the results: status messages go to stderr
+        with redirect_stdout(sys.stderr):
+            print(f"Initializing chatbot for {len(questions)} questions...")
+            bot = WikiChatbot()
+            try:
+                for result in bot.chat_batch(questions, include_timings=args.timings):
+                    if result['type'] == 'answer' and ids[result['index']] is not None:
+                        result['id'] = ids[result['index']]
+                    out.write(json.dumps(result) + '\n')
+                    out.flush()
+                    if result['type'] == 'summary':
+                        print(f"✓ {result['questions']} questions in {result['seconds']}s "
+                              f"({result['questions_per_second']} questions/s)")
+                    elif (result['index'] + 1) % 10 == 0:
+                        print(f"  Answered {result['index'] + 1}/{len(questions)}")
+            finally:
+                bot.close()
+    finally:
+        # Only a file we opened; stdout stays open for whoever runs us
+        if args.output:
+            out.close()
+
 def main():
+    parser = argparse.ArgumentParser(description="MediaWiki Chatbot CLI")
+    parser.add_argument('--batch', metavar='FILE', help="Answer the questions in FILE ('-' for stdin) as JSON lines")
+    parser.add_argument('--output', metavar='FILE', help="Write batch results to FILE instead of stdout")
+    parser.add_argument('--timings', action='store_true', help="Include per-question timings in batch results")
+    args = parser.parse_args()
+    
+    if args.batch:
+        try:
+            run_batch(args)
+        except Exception as e:
+            print(f"❌ Batch failed: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+    
     print("=" * 60)
     print("MediaWiki Chatbot CLI")
     print("=" * 60)
@@ -34,7 +108,7 @@ def main():
                 print(f"\n🤖 Bot: {response['answer']}")
                 
                 if response['sources']:
-                    print(f"\n📚 Sources: {', '.join(response['sources'])}")
+                    print(f"\n📚 Sources: {', '.join(source['title'] for source in response['sources'])}")
             
             except KeyboardInterrupt:
                 print("\n\nGoodbye!")
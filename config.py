@@ -12,23 +12,55 @@ class Config:
     DB_NAME = os.getenv('DB_NAME', 'wikidb')
     DB_USER = os.getenv('DB_USER', 'wikiuser')
     DB_PASSWORD = os.getenv('DB_PASSWORD', '')
+    CONTENT_CACHE_SIZE = int(os.getenv('CONTENT_CACHE_SIZE', 1000))  # Decoded page texts kept in memory
+    TITLE_INDEX_REFRESH_INTERVAL = float(os.getenv('TITLE_INDEX_REFRESH_INTERVAL', 60))  # Seconds between title index refreshes; 0 = never
+    DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', 3))  # Seconds to wait for a connection
+    DB_READ_TIMEOUT = int(os.getenv('DB_READ_TIMEOUT', 10))  # Seconds to wait for a query result
+    DB_WRITE_TIMEOUT = int(os.getenv('DB_WRITE_TIMEOUT', 5))  # Seconds to wait sending a query
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 4))  # Idle database connections kept for reuse
+    SEARCH_MAX_COMPRESSED = int(os.getenv('SEARCH_MAX_COMPRESSED', 500))  # Compressed page texts one keyword search decodes at most
     
     # Llama model settings
     MODEL_PATH = os.getenv('MODEL_PATH', './models/model.gguf')
     MODEL_N_CTX = int(os.getenv('MODEL_N_CTX', 2048))
     MODEL_N_THREADS = int(os.getenv('MODEL_N_THREADS', 4))
-    MODEL_MAX_TOKENS = int(os.getenv('MODEL_MAX_TOKENS', 512))
+    MODEL_MAX_TOKENS = int(os.getenv('MODEL_MAX_TOKENS', 512))  # Longest answer (ceiling for adaptive budgets)
     MODEL_TEMPERATURE = float(os.getenv('MODEL_TEMPERATURE', 0.7))
+    ADAPTIVE_MAX_TOKENS = os.getenv('ADAPTIVE_MAX_TOKENS', 'True').lower() == 'true'  # Token budget per question type and context size
+    EARLY_STOP = os.getenv('EARLY_STOP', 'True').lower() == 'true'  # Stop at repeated sentences or looping output
     
     # Flask settings
     FLASK_HOST = os.getenv('FLASK_HOST', '0.0.0.0')
     FLASK_PORT = int(os.getenv('FLASK_PORT', 5000))
     FLASK_DEBUG = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
+    WEB_SERVER_PORT = int(os.getenv('WEB_SERVER_PORT', 8080))  # serve_web.py port
+    SERVE_UI = os.getenv('SERVE_UI', 'False').lower() == 'true'  # Also serve index.html from app.py at /
+    MAX_CONCURRENT_CHATS = int(os.getenv('MAX_CONCURRENT_CHATS', 1))  # Simultaneous generations (llama.cpp is not thread-safe)
+    CHAT_QUEUE_TIMEOUT = float(os.getenv('CHAT_QUEUE_TIMEOUT', 30))  # Seconds a chat waits for a slot before 429
+    MAX_BATCH_QUESTIONS = int(os.getenv('MAX_BATCH_QUESTIONS', 5000))  # Questions accepted by /api/chat/batch
+    CHATBOT_AUTOINIT = os.getenv('CHATBOT_AUTOINIT', 'True').lower() == 'true'  # False when a script installs its own chatbot
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')  # Required in X-Admin-Token for /api/admin/*; empty = admin endpoints disabled
+    PROFILE_DIR = os.getenv('PROFILE_DIR', './profiles')  # Where profiled requests are saved
+    PROFILE_MAX_PER_MINUTE = int(os.getenv('PROFILE_MAX_PER_MINUTE', 2))  # Profiled requests allowed per minute
+    PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', 0.005))  # Seconds between stack samples
     
     # Vector store settings
     USE_VECTOR_SEARCH = os.getenv('USE_VECTOR_SEARCH', 'True').lower() == 'true'
     VECTOR_DB_PATH = os.getenv('VECTOR_DB_PATH', './chroma_db')
     VECTOR_TOP_K = int(os.getenv('VECTOR_TOP_K', 3))
+    INDEX_RELOAD_INTERVAL = float(os.getenv('INDEX_RELOAD_INTERVAL', 10))  # Seconds between checks for a new index version
+    INDEX_KEEP_VERSIONS = int(os.getenv('INDEX_KEEP_VERSIONS', 2))  # Index versions kept on disk (active + rollback)
+    DEDUP_THRESHOLD = float(os.getenv('DEDUP_THRESHOLD', 0.85))  # Similarity at which pages count as near-duplicates (0 disables)
+    VECTOR_TIMEOUT = float(os.getenv('VECTOR_TIMEOUT', 5))  # Seconds to wait for an embedding or vector query
+    
+    # Dependency failure handling (MariaDB, vector store)
+    BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 3))  # Consecutive failures that open a circuit breaker
+    BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', 30))  # Seconds before an open breaker lets a trial call through
+    HEALTH_PROBE_INTERVAL = float(os.getenv('HEALTH_PROBE_INTERVAL', 15))  # Seconds between re-probes of failed dependencies; 0 = never
+    
+    # Context compression settings (keep only query-relevant sentences)
+    CONTEXT_COMPRESSION = os.getenv('CONTEXT_COMPRESSION', 'False').lower() == 'true'
+    CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', 512))
     
     # Wiki settings
     WIKI_BASE_URL = os.getenv('WIKI_BASE_URL', 'http://172.17.7.95/cswikiuat/index.php')
@@ -0,0 +1,134 @@
+"""
+Query-focused extractive context compression
+
+Sits between retrieval and prompt building: each retrieved page is split
+into sentences, sentences are scored against the query (embedding cosine
+similarity plus keyword overlap), and only the best ones are kept, in their
+original order, until the token budget is spent. Prefill time on CPU grows
+linearly with prompt length, so fewer context tokens means faster answers.
+"""
+
+import math
+import re
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Sentence ends followed by something that starts a new sentence, or line breaks
+# (list items, table rows and headings are units of their own)
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"\'(\[])|\n+')
+_WORD = re.compile(r'[\w.-]+')
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split cleaned page text into sentences"""
+    return [s.strip() for s in _SENTENCE_BOUNDARY.split(text) if s and s.strip()]
+
+
+def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token for English text)"""
+    return (len(text) + 3) // 4
+
+
+class ContextCompressor:
+    """Keeps the sentences of retrieved pages that are most relevant to the query"""
+
+    # Sentences per request that are embedded; the rest are ranked by keywords only
+    MAX_EMBEDDED_SENTENCES = 64
+
+    def __init__(self, token_budget: int = 512,
+                 embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                 count_tokens: Optional[Callable[[str], int]] = None,
+                 keyword_weight: float = 0.3):
+        self.token_budget = token_budget
+        self.embed = embed
+        self.count_tokens = count_tokens or estimate_tokens
+        self.keyword_weight = keyword_weight
+
+    def _keyword_score(self, sentence: str, keywords: List[str]) -> float:
+        """Fraction of query keywords that appear in the sentence"""
+        if not keywords:
+            return 0.0
+        words = set(w.lower() for w in _WORD.findall(sentence))
+        return sum(1 for k in keywords if k in words) / len(keywords)
+
+    def compress(self, query_embedding: Optional[List[float]], keywords: List[str],
+                 pages: List[Dict]) -> Tuple[List[Dict], Dict]:
+        """Compress page contents to the token budget
+
+        Returns the compressed pages (same order and titles) and statistics
+        with the token counts before and after.
+        """
+        keywords = [k.lower() for k in keywords if len(k) > 1]
+
+        # (page index, sentence index, sentence, keyword score)
+        candidates = []
+        for p, page in enumerate(pages):
+            for s, sentence in enumerate(split_sentences(page.get('content', ''))):
+                candidates.append((p, s, sentence, self._keyword_score(sentence, keywords)))
+
+        scores = {}
+        if candidates:
+            # Embedding is the expensive part, so only the most promising sentences
+            # (by keyword overlap, then position) are embedded
+            to_embed = candidates
+            if len(to_embed) > self.MAX_EMBEDDED_SENTENCES:
+                to_embed = sorted(candidates, key=lambda c: (-c[3], c[1]))[:self.MAX_EMBEDDED_SENTENCES]
+
+            similarities = {}
+            if self.embed and query_embedding is not None:
+                try:
+                    embeddings = self.embed([c[2] for c in to_embed])
+                    for candidate, embedding in zip(to_embed, embeddings):
+                        similarities[(candidate[0], candidate[1])] = _cosine(query_embedding, embedding)
+                except Exception as e:
+                    print(f"Sentence embedding error: {e}. Ranking by keywords only.")
+
+            for p, s, sentence, keyword_score in candidates:
+                # Small positional prior so page openings win ties
+                scores[(p, s)] = (similarities.get((p, s), 0.0)
+                                  + self.keyword_weight * keyword_score
+                                  - 0.001 * s)
+
+        # Every page keeps its best sentence so sources stay meaningful, then the
+        # remaining budget goes to the highest scoring sentences overall
+        ranked = sorted(candidates, key=lambda c: scores[(c[0], c[1])], reverse=True)
+        selected = set()
+        covered_pages = set()
+        used = 0
+        for p, s, sentence, _ in ranked:
+            if p in covered_pages:
+                continue
+            covered_pages.add(p)
+            selected.add((p, s))
+            used += self.count_tokens(sentence)
+        for p, s, sentence, _ in ranked:
+            if (p, s) in selected:
+                continue
+            cost = self.count_tokens(sentence)
+            # Keep going: a shorter sentence further down may still fit
+            if used + cost > self.token_budget:
+                continue
+            selected.add((p, s))
+            used += cost
+
+        compressed_pages = []
+        for p, page in enumerate(pages):
+            compressed = dict(page)
+            compressed['content'] = '\n'.join(
+                sentence for page_index, s, sentence, _ in candidates
+                if page_index == p and (p, s) in selected
+            )
+            compressed_pages.append(compressed)
+
+        stats = {
+            'input_tokens': sum(self.count_tokens(page.get('content', '')) for page in pages),
+            'compressed_tokens': sum(self.count_tokens(page['content']) for page in compressed_pages),
+            'sentences_kept': len(selected),
+            'sentences_total': len(candidates)
+        }
+        return compressed_pages, stats
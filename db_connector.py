@@ -1,53 +1,327 @@
 import pymysql
-from typing import List, Dict, Optional
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Iterable, Tuple
 from config import Config
+from circuit_breaker import CircuitOpenError
+import circuit_breaker
+import metrics
+
+def normalize_category(name: str) -> str:
+    """Category name as stored in categorylinks.cl_to ("category:product faq" -> "Product_faq")"""
+    name = name.strip()
+    if name.lower().startswith('category:'):
+        name = name[len('category:'):]
+    name = '_'.join(name.replace('_', ' ').split())
+    return name[:1].upper() + name[1:]
+
+class ContentResolver:
+    """Resolves MediaWiki content addresses to page text
+    
+    MediaWiki 1.43 stores revision text behind content.content_address
+    ("tt:<old_id>" for rows in the text table). Addresses are parsed here
+    so text rows are fetched by primary key, in bulk, instead of joining
+    on an expression. Decoded text is cached by content_id; content rows
+    are immutable, so entries never go stale. The content_id last seen
+    for each page is remembered too, so cached text can stand in for a
+    page while the database is unavailable (cached_pages()).
+    """
+    
+    # Maximum number of ids in one IN (...) lookup
+    BATCH_SIZE = 500
+    
+    def __init__(self, cache_size: int = 1000):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.page_content_ids = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def parse_address(address) -> Optional[int]:
+        """Return the text.old_id for a "tt:" address, None for anything else"""
+        if isinstance(address, bytes):
+            address = address.decode('utf-8', errors='ignore')
+        if address and address.startswith('tt:') and address[3:].isdigit():
+            return int(address[3:])
+        return None
+    
+    @staticmethod
+    def decode(old_text, old_flags) -> str:
+        """Decode a text row according to its old_flags"""
+        if old_text is None:
+            return ""
+        if isinstance(old_flags, bytes):
+            old_flags = old_flags.decode('utf-8', errors='ignore')
+        flags = set((old_flags or '').split(','))
+        
+        if 'external' in flags or 'object' in flags:
+            # ExternalStore URLs and serialized history blobs need MediaWiki itself
+            return ""
+        
+        data = old_text if isinstance(old_text, bytes) else old_text.encode('utf-8')
+        if 'gzip' in flags:
+            try:
+                # MediaWiki compresses with gzdeflate(), i.e. raw deflate
+                data = zlib.decompress(data, -zlib.MAX_WBITS)
+            except zlib.error as e:
+                print(f"Text decompression error: {e}")
+                return ""
+        return data.decode('utf-8', errors='ignore')
+    
+    def get_cached(self, content_id) -> Optional[str]:
+        """Cached text for content_id, or None"""
+        with self.lock:
+            text = self.cache.get(content_id)
+            if text is None:
+                self.misses += 1
+                return None
+            self.cache.move_to_end(content_id)
+            self.hits += 1
+            return text
+    
+    def put(self, content_id, text: str, page_id: Optional[int] = None):
+        """Store decoded text, evicting the least recently used entries"""
+        if self.cache_size <= 0:
+            return
+        with self.lock:
+            if page_id is not None:
+                self.page_content_ids[page_id] = content_id
+            self.cache[content_id] = text
+            self.cache.move_to_end(content_id)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+    
+    def resolve(self, cursor, rows: Iterable[Dict]) -> List[Dict]:
+        """Fill row['content'] for rows carrying content_id and content_address
+        
+        Cache misses are fetched with batched primary-key lookups on text.
+        """
+        rows = list(rows)
+        pending = {}
+        for row in rows:
+            if row.get('page_id') is not None:
+                with self.lock:
+                    self.page_content_ids[row['page_id']] = row['content_id']
+            text = self.get_cached(row['content_id'])
+            if text is not None:
+                row['content'] = text
+                continue
+            old_id = self.parse_address(row.get('content_address'))
+            if old_id is None:
+                # es: (ExternalStore) and other addresses are not stored locally
+                row['content'] = ""
+                continue
+            pending.setdefault(old_id, []).append(row)
+        
+        old_ids = list(pending)
+        for start in range(0, len(old_ids), self.BATCH_SIZE):
+            batch = old_ids[start:start + self.BATCH_SIZE]
+            placeholders = ', '.join(['%s'] * len(batch))
+            with metrics.span('db.text_fetch'):
+                cursor.execute(
+                    f"SELECT old_id, old_text, old_flags FROM text WHERE old_id IN ({placeholders})",
+                    tuple(batch)
+                )
+                text_rows = cursor.fetchall()
+            for text_row in text_rows:
+                text = self.decode(text_row['old_text'], text_row['old_flags'])
+                for row in pending.pop(text_row['old_id'], []):
+                    row['content'] = text
+                    self.put(row['content_id'], text, row.get('page_id'))
+        
+        # Addresses pointing at missing text rows
+        for missing in pending.values():
+            for row in missing:
+                row['content'] = ""
+        
+        for row in rows:
+            row.pop('content_address', None)
+        return rows
+    
+    def cached_pages(self, page_ids: Iterable[int]) -> Dict[int, str]:
+        """Text of the latest revision seen of each page that is still cached, by page_id"""
+        found = {}
+        with self.lock:
+            for page_id in page_ids:
+                text = self.cache.get(self.page_content_ids.get(page_id))
+                if text is not None:
+                    found[page_id] = text
+        return found
+    
+    def get_stats(self) -> Dict:
+        """Cache statistics"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.cache),
+                'max_size': self.cache_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
 
 class WikiDBConnector:
-    """Connector for MediaWiki MariaDB database"""
+    """Connector for MediaWiki MariaDB database
+    
+    Connecting, reading and writing are bounded by DB_CONNECT_TIMEOUT,
+    DB_READ_TIMEOUT and DB_WRITE_TIMEOUT, and all queries go through the
+    shared 'mariadb' circuit breaker: once it opens, queries fail at once
+    (the methods return their empty results) until the database answers
+    again.
+    
+    pymysql connections must not be shared between threads, so each query
+    takes a connection of its own from a small pool (up to DB_POOL_SIZE
+    idle connections are kept) and gives it back when done.
+    """
+    
+    # Errors that mean the server could not be reached or stopped answering
+    CONNECTION_ERRORS = (pymysql.err.OperationalError, pymysql.err.InterfaceError, OSError)
     
     def __init__(self):
         self.config = Config()
-        self.connection = None
+        self.idle = []  # Connections no query is using
+        self.pool_lock = threading.Lock()
+        self.content = ContentResolver(cache_size=self.config.CONTENT_CACHE_SIZE)
+        # Compressed texts search_pages matches in Python (a search reads up
+        # to limit more than SEARCH_MAX_COMPRESSED of them)
+        self.search_texts = ContentResolver(cache_size=2 * self.config.SEARCH_MAX_COMPRESSED)
+        self.breaker = circuit_breaker.get('mariadb')
     
-    def connect(self):
-        """Establish database connection"""
+    def open_connection(self):
+        """Open a new database connection (None on error)"""
         try:
-            self.connection = pymysql.connect(
+            connection = pymysql.connect(
                 host=self.config.DB_HOST,
                 port=self.config.DB_PORT,
                 user=self.config.DB_USER,
                 password=self.config.DB_PASSWORD,
                 database=self.config.DB_NAME,
                 charset='utf8mb4',
-                cursorclass=pymysql.cursors.DictCursor
+                cursorclass=pymysql.cursors.DictCursor,
+                connect_timeout=self.config.DB_CONNECT_TIMEOUT,
+                read_timeout=self.config.DB_READ_TIMEOUT,
+                write_timeout=self.config.DB_WRITE_TIMEOUT
             )
             print(f"Connected to database: {self.config.DB_NAME}")
-            return True
+            return connection
         except Exception as e:
             print(f"Database connection error: {e}")
+            return None
+    
+    def connect(self):
+        """Establish a database connection (kept in the pool for the next query)"""
+        connection = self.open_connection()
+        if connection is None:
             return False
+        self._release(connection)
+        return True
     
     def disconnect(self):
-        """Close database connection"""
-        if self.connection:
-            self.connection.close()
-            self.connection = None
-    
-    def search_pages(self, query: str, limit: int = 5) -> List[Dict]:
-        """Search wiki pages by title or content, prioritizing current pages"""
-        if not self.connection:
-            self.connect()
+        """Close the idle connections (connections in use are closed when given back)"""
+        with self.pool_lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            self._close(connection)
+    
+    @property
+    def connected(self) -> bool:
+        """True if an idle connection is ready"""
+        return bool(self.idle)
+    
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass  # already broken
+    
+    def _acquire(self):
+        """An idle connection, or a new one (None if it can't be opened)"""
+        with self.pool_lock:
+            if self.idle:
+                return self.idle.pop()
+        return self.open_connection()
+    
+    def _release(self, connection):
+        """Give a connection back to the pool, closing it if the pool is full"""
+        with self.pool_lock:
+            if len(self.idle) < self.config.DB_POOL_SIZE:
+                self.idle.append(connection)
+                return
+        self._close(connection)
+    
+    @contextmanager
+    def cursor(self, probe: bool = False):
+        """Cursor on a pooled connection used by this query only, guarded by the circuit breaker
+        
+        Raises CircuitOpenError while the breaker is open, unless probe.
+        Connection errors and timeouts count as failures and close the
+        connection (other queries keep theirs); SQL errors do not.
+        """
+        if not self.breaker.allow(probe):
+            raise CircuitOpenError("MariaDB is unavailable (circuit open)")
+        connection = self._acquire()
+        if connection is None:
+            error = ConnectionError("cannot connect to MariaDB")
+            self.breaker.record_failure(error)
+            raise error
+        broken = False
+        try:
+            with connection.cursor() as cursor:
+                yield cursor
+        except self.CONNECTION_ERRORS as e:
+            broken = True
+            self.breaker.record_failure(e)
+            raise
+        except Exception:
+            # The server answered, just not to this query
+            self.breaker.record_success()
+            raise
+        else:
+            self.breaker.record_success()
+        finally:
+            if broken:
+                self._close(connection)
+            else:
+                self._release(connection)
+    
+    def ping(self) -> bool:
+        """True if the database answers a trivial query (tried even while the breaker is open)"""
+        try:
+            with metrics.span('db.ping'), self.cursor(probe=True) as cursor:
+                cursor.execute("SELECT 1 AS ok")
+                cursor.fetchall()
+            return True
+        except Exception as e:
+            print(f"Database ping failed: {e}")
+            return False
+    
+    def search_pages(self, query: str, limit: int = 5, after: Optional[Tuple[int, int]] = None,
+                     categories: Optional[List[str]] = None,
+                     namespaces: Optional[List[int]] = None) -> Optional[List[Dict]]:
+        """Search wiki pages by title or content, prioritizing current pages
         
+        Results are ordered by relevance, then page_id. To get the next page
+        of results pass after=(relevance, page_id) of the last result seen.
+        categories (normalized names, any of them) and namespaces (default:
+        main namespace only) restrict the pages searched. Returns None on
+        error so callers can tell it from no matches.
+        
+        Compressed text ($wgCompressRevisions) can't be matched in SQL. A
+        search reads at most limit + SEARCH_MAX_COMPRESSED rows past the
+        cursor, decodes the compressed ones among them and stops there; a
+        search cut short that way is logged.
+        """
         try:
-            with self.connection.cursor() as cursor:
+            with metrics.span('db.search_pages'), self.cursor() as cursor:
                 # MediaWiki 1.43+ uses slots + content table
                 # Prioritize: 1) Current pages, 2) Title matches over content matches
-                sql = """
-                    SELECT 
-                        p.page_id,
-                        p.page_title,
-                        p.page_namespace,
-                        t.old_text as content,
+                search_term = f"%{query}%"
+                relevance = """
                         CASE 
                             WHEN p.page_title NOT LIKE %s
                                 AND p.page_title NOT LIKE %s
@@ -57,81 +331,268 @@ class WikiDBConnector:
                         CASE 
                             WHEN p.page_title LIKE %s THEN 2
                             ELSE 0
-                        END as relevance
+                        END"""
+                relevance_params = ('%OUTDATED%', '%EXPIRED%', '%MOVED%', search_term)
+                
+                # Scope: namespaces, and pages in any of the categories
+                namespaces = list(namespaces or [0])
+                scope = f"p.page_namespace IN ({', '.join(['%s'] * len(namespaces))})"
+                scope_params = tuple(namespaces)
+                if categories:
+                    scope += f"""
+                    AND EXISTS (
+                        SELECT 1 FROM categorylinks cl
+                        WHERE cl.cl_from = p.page_id
+                        AND cl.cl_to IN ({', '.join(['%s'] * len(categories))})
+                    )"""
+                    scope_params += tuple(categories)
+                
+                # Keyset pagination: rows after the cursor in (relevance DESC, page_id) order
+                keyset = ""
+                keyset_params = ()
+                if after is not None:
+                    keyset = f"AND ({relevance} < %s OR ({relevance} = %s AND p.page_id > %s))"
+                    keyset_params = relevance_params + (after[0],) + relevance_params + (after[0], after[1])
+                
+                # Titles and uncompressed text are matched by LIKE. LIKE can't
+                # see into gzip-compressed text, so compressed rows come back
+                # as candidates (without their text) and are matched here,
+                # case-sensitive like LIKE on MariaDB's binary text column.
+                # Up to SEARCH_MAX_COMPRESSED candidates are read on top of
+                # limit; their decoded texts have a cache of their own, so
+                # searches don't evict the pages answers are built from.
+                max_compressed = max(0, self.config.SEARCH_MAX_COMPRESSED)
+                gzip_filter = "OR t.old_flags LIKE %s" if max_compressed else ""
+                sql = f"""
+                    SELECT 
+                        p.page_id,
+                        p.page_title,
+                        p.page_namespace,
+                        r.rev_timestamp,
+                        c.content_id,
+                        c.content_address,
+                        CASE WHEN t.old_flags LIKE %s THEN NULL ELSE t.old_text END AS old_text,
+                        t.old_flags,
+                        CASE WHEN p.page_title LIKE %s THEN 1 ELSE 0 END AS title_match,{relevance} as relevance
                     FROM page p
                     JOIN revision r ON p.page_latest = r.rev_id
                     JOIN slots s ON r.rev_id = s.slot_revision_id
                     JOIN content c ON s.slot_content_id = c.content_id
                     LEFT JOIN text t ON CAST(SUBSTRING(c.content_address, 4) AS UNSIGNED) = t.old_id
-                    WHERE p.page_namespace = 0
+                    WHERE {scope}
                     AND (
                         p.page_title LIKE %s 
                         OR t.old_text LIKE %s
+                        {gzip_filter}
                     )
-                    ORDER BY relevance DESC
+                    {keyset}
+                    ORDER BY relevance DESC, p.page_id
                     LIMIT %s
                 """
-                search_term = f"%{query}%"
-                cursor.execute(sql, ('%OUTDATED%', '%EXPIRED%', '%MOVED%', search_term, search_term, search_term, limit))
-                results = cursor.fetchall()
+                params = (('%gzip%', search_term) + relevance_params + scope_params + (search_term, search_term)
+                          + (('%gzip%',) if max_compressed else ()) + keyset_params + (limit + max_compressed,))
+                cursor.execute(sql, params)
+                rows = cursor.fetchall()
+                
+                candidates = []
+                compressed_ids = set()
+                for row in rows:
+                    old_flags = row.pop('old_flags')
+                    if isinstance(old_flags, bytes):
+                        old_flags = old_flags.decode('utf-8', errors='ignore')
+                    old_text = row.pop('old_text')
+                    if 'gzip' in (old_flags or ''):
+                        candidates.append(row)
+                        compressed_ids.add(row['page_id'])
+                    else:
+                        # The text row is already here, so decode it directly
+                        row.pop('content_address')
+                        row['content'] = self.content.decode(old_text, old_flags)
+                self.search_texts.resolve(cursor, candidates)
+                
+                results = []
+                for row in rows:
+                    title_match = row.pop('title_match')
+                    if title_match or row['page_id'] not in compressed_ids or query in row['content']:
+                        results.append(row)
+                results = results[:limit]
+                if len(rows) == limit + max_compressed and len(results) < limit:
+                    print(f"⚠️  Search for '{query}' stopped after {max_compressed} compressed pages "
+                          f"(SEARCH_MAX_COMPRESSED)")
+                
+                # Warm the cache with the pages returned
+                for result in results:
+                    self.content.put(result['content_id'], result['content'], result['page_id'])
                 return results
         except Exception as e:
             print(f"Search error: {e}")
-            return []
+            return None
     
     def get_page_by_title(self, title: str) -> Optional[Dict]:
         """Get a specific page by title"""
-        if not self.connection:
-            self.connect()
-        
         try:
-            with self.connection.cursor() as cursor:
+            with metrics.span('db.get_page_by_title'), self.cursor() as cursor:
                 # MediaWiki 1.43+ schema
                 sql = """
                     SELECT 
                         p.page_id,
                         p.page_title,
                         p.page_namespace,
-                        t.old_text as content
+                        c.content_id,
+                        c.content_address
                     FROM page p
                     JOIN revision r ON p.page_latest = r.rev_id
                     JOIN slots s ON r.rev_id = s.slot_revision_id
                     JOIN content c ON s.slot_content_id = c.content_id
-                    LEFT JOIN text t ON CAST(SUBSTRING(c.content_address, 4) AS UNSIGNED) = t.old_id
                     WHERE p.page_title = %s
                     AND p.page_namespace = 0
                     LIMIT 1
                 """
                 cursor.execute(sql, (title.replace(' ', '_'),))
                 result = cursor.fetchone()
+                if result:
+                    self.content.resolve(cursor, [result])
                 return result
         except Exception as e:
             print(f"Get page error: {e}")
             return None
     
-    def get_all_pages(self, limit: int = 100) -> List[Dict]:
-        """Get all wiki pages (for context building)"""
-        if not self.connection:
-            self.connect()
+    def get_pages_by_ids(self, page_ids: List[int]) -> List[Dict]:
+        """Get several pages with full content in two round trips"""
+        if not page_ids:
+            return []
+        try:
+            with metrics.span('db.get_pages_by_ids'), self.cursor() as cursor:
+                placeholders = ', '.join(['%s'] * len(page_ids))
+                sql = f"""
+                    SELECT 
+                        p.page_id,
+                        p.page_title,
+                        p.page_namespace,
+                        c.content_id,
+                        c.content_address
+                    FROM page p
+                    JOIN revision r ON p.page_latest = r.rev_id
+                    JOIN slots s ON r.rev_id = s.slot_revision_id
+                    JOIN content c ON s.slot_content_id = c.content_id
+                    WHERE p.page_id IN ({placeholders})
+                """
+                cursor.execute(sql, tuple(page_ids))
+                results = cursor.fetchall()
+                return self.content.resolve(cursor, results)
+        except Exception as e:
+            print(f"Get pages error: {e}")
+            return []
+    
+    def get_page_titles(self, touched_since: Optional[str] = None) -> Optional[List[Dict]]:
+        """Get id, title, redirect flag and page_touched of all main namespace pages
         
+        With touched_since only pages touched at or after that timestamp are
+        returned. Returns None on error so callers can tell it from no pages.
+        """
         try:
-            with self.connection.cursor() as cursor:
+            with metrics.span('db.get_page_titles'), self.cursor() as cursor:
+                sql = """
+                    SELECT page_id, page_title, page_is_redirect, page_touched
+                    FROM page
+                    WHERE page_namespace = 0
+                """
+                params = ()
+                if touched_since is not None:
+                    sql += " AND page_touched >= %s"
+                    params = (touched_since,)
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+        except Exception as e:
+            print(f"Get page titles error: {e}")
+            return None
+    
+    def count_pages(self) -> Optional[int]:
+        """Number of main namespace pages, None on error"""
+        try:
+            with metrics.span('db.count_pages'), self.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) AS total FROM page WHERE page_namespace = 0")
+                return cursor.fetchone()['total']
+        except Exception as e:
+            print(f"Count pages error: {e}")
+            return None
+    
+    def get_page_list(self, after_id: int = 0, limit: int = 100) -> Optional[List[Dict]]:
+        """Get id and title of main namespace pages with page_id > after_id, in page_id order
+        
+        Title-only and keyset-paginated on the primary key, so listing the
+        whole wiki costs one index range scan per batch. Returns None on
+        error so callers can tell it from the end of the list.
+        """
+        try:
+            with metrics.span('db.get_page_list'), self.cursor() as cursor:
+                sql = """
+                    SELECT page_id, page_title
+                    FROM page
+                    WHERE page_namespace = 0
+                    AND page_id > %s
+                    ORDER BY page_id
+                    LIMIT %s
+                """
+                cursor.execute(sql, (after_id, limit))
+                return cursor.fetchall()
+        except Exception as e:
+            print(f"Get page list error: {e}")
+            return None
+    
+    def get_page_categories(self, page_ids: Optional[List[int]] = None) -> Dict[int, List[str]]:
+        """Categories (cl_to names) of the given pages, or of all pages if None"""
+        if page_ids is not None and not page_ids:
+            return {}
+        try:
+            with metrics.span('db.get_page_categories'), self.cursor() as cursor:
+                sql = "SELECT cl_from, cl_to FROM categorylinks"
+                params = ()
+                if page_ids is not None:
+                    sql += f" WHERE cl_from IN ({', '.join(['%s'] * len(page_ids))})"
+                    params = tuple(page_ids)
+                cursor.execute(sql, params)
+                
+                categories = {}
+                for row in cursor.fetchall():
+                    name = row['cl_to']
+                    if isinstance(name, bytes):
+                        name = name.decode('utf-8', errors='ignore')
+                    categories.setdefault(row['cl_from'], []).append(name)
+                return categories
+        except Exception as e:
+            print(f"Get page categories error: {e}")
+            return {}
+    
+    def get_all_pages(self, limit: int = 100, content_chars: Optional[int] = 200) -> List[Dict]:
+        """Get all wiki pages (for context building)
+        
+        Content is cut to content_chars characters; pass None for full text.
+        """
+        try:
+            with metrics.span('db.get_all_pages'), self.cursor() as cursor:
                 # MediaWiki 1.43+ schema
                 sql = """
                     SELECT 
                         p.page_id,
                         p.page_title,
-                        LEFT(t.old_text, 200) as content
+                        p.page_namespace,
+                        r.rev_timestamp,
+                        c.content_id,
+                        c.content_address
                     FROM page p
                     JOIN revision r ON p.page_latest = r.rev_id
                     JOIN slots s ON r.rev_id = s.slot_revision_id
                     JOIN content c ON s.slot_content_id = c.content_id
-                    LEFT JOIN text t ON CAST(SUBSTRING(c.content_address, 4) AS UNSIGNED) = t.old_id
                     WHERE p.page_namespace = 0
+                    ORDER BY p.page_id
                     LIMIT %s
                 """
                 cursor.execute(sql, (limit,))
-                results = cursor.fetchall()
+                results = self.content.resolve(cursor, cursor.fetchall())
+                if content_chars is not None:
+                    for result in results:
+                        result['content'] = result['content'][:content_chars]
                 return results
         except Exception as e:
             print(f"Get all pages error: {e}")
@@ -0,0 +1,141 @@
+"""
+Near-duplicate detection for wiki pages (one-permutation MinHash)
+
+A page's signature has K slots: each word 3-gram of the page is hashed once,
+the hash picks a slot, and each slot keeps the smallest hash that landed in
+it. The fraction of slots two signatures have in common estimates the
+Jaccard similarity of the pages' 3-gram sets. One hash per 3-gram keeps
+signing cheap enough for every page at index time and for keyword results
+at retrieval time.
+
+Copy-pasted pages ("(expired)" copies, per-region clones) share almost all
+of their 3-grams and score close to 1; pages that only share a template
+score far lower. Clustering a whole wiki compares only pages that agree on
+every slot of at least one band of slots (locality-sensitive hashing).
+"""
+
+import re
+import zlib
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Slots per signature
+SIGNATURE_SIZE = 64
+# Words per shingle
+SHINGLE_WORDS = 3
+# Slots per LSH band: pages are compared if all slots of one band match
+BAND_SIZE = 4
+# Value of a slot no shingle landed in
+EMPTY = 0xFFFFFFFF
+
+_WORD_RE = re.compile(r'\w+')
+_OUTDATED_TITLE_RE = re.compile(r'\((?:expired|outdated|moved)\)', re.IGNORECASE)
+
+
+def signature(text: str) -> List[int]:
+    """Smallest word 3-gram hash per slot (empty list for text without words)"""
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return []
+    shingles = set(' '.join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1)))
+    slots = [EMPTY] * SIGNATURE_SIZE
+    for shingle in shingles:
+        h = zlib.crc32(shingle.encode('utf-8'))
+        slot = h % SIGNATURE_SIZE
+        if h < slots[slot]:
+            slots[slot] = h
+    return slots
+
+
+def encode(sig: Sequence[int]) -> str:
+    """Signature as a hex string (for vector store metadata)"""
+    return ''.join(f"{h:08x}" for h in sig)
+
+
+def decode(value: Optional[str]) -> List[int]:
+    """Signature from encode(); empty for a missing value"""
+    if not value:
+        return []
+    return [int(value[i:i + 8], 16) for i in range(0, len(value), 8)]
+
+
+def similarity(a: Sequence[int], b: Sequence[int]) -> float:
+    """Estimated Jaccard similarity of the pages behind two signatures"""
+    if not a or not b:
+        return 0.0
+    used = same = 0
+    for x, y in zip(a, b):
+        if x != EMPTY or y != EMPTY:
+            used += 1
+            same += x == y
+    return same / used if used else 0.0
+
+
+def preference(title: str, timestamp) -> Tuple[bool, str]:
+    """Sort key for choosing which duplicate to keep: current titles, then the newest revision"""
+    if isinstance(timestamp, bytes):
+        timestamp = timestamp.decode('ascii', errors='ignore')
+    return (not _OUTDATED_TITLE_RE.search(title or ''), str(timestamp or ''))
+
+
+def find_clusters(signatures: Sequence[List[int]], threshold: float) -> List[List[int]]:
+    """Groups (indexes into signatures) of two or more near-duplicates
+
+    Candidates are pages that agree on a whole band of BAND_SIZE slots;
+    candidate pairs at or above threshold are joined, transitively.
+    """
+    buckets: Dict[Tuple, List[int]] = {}
+    for i, sig in enumerate(signatures):
+        for start in range(0, len(sig), BAND_SIZE):
+            band = tuple(sig[start:start + BAND_SIZE])
+            if any(h != EMPTY for h in band):
+                buckets.setdefault((start, band), []).append(i)
+
+    parent = list(range(len(signatures)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for members in buckets.values():
+        for x in range(len(members)):
+            for y in range(x + 1, len(members)):
+                i, j = members[x], members[y]
+                if find(i) != find(j) and similarity(signatures[i], signatures[j]) >= threshold:
+                    parent[find(j)] = find(i)
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(signatures)):
+        groups.setdefault(find(i), []).append(i)
+    return [members for members in groups.values() if len(members) > 1]
+
+
+def collapse(items: List[Dict], threshold: float, get_signature: Callable[[Dict], List[int]],
+             get_preference: Callable[[Dict], Tuple]) -> Tuple[List[Dict], int]:
+    """Drop near-duplicates from a ranked list; returns (kept items, number dropped)
+
+    A duplicate takes the rank of the best-ranked member of its group, and
+    the member kept is the one with the highest preference. Items without a
+    signature are never collapsed.
+    """
+    kept: List[Dict] = []
+    kept_signatures: List[List[int]] = []
+    dropped = 0
+    for item in items:
+        sig = get_signature(item)
+        match = None
+        if sig:
+            for position, other in enumerate(kept_signatures):
+                if similarity(sig, other) >= threshold:
+                    match = position
+                    break
+        if match is None:
+            kept.append(item)
+            kept_signatures.append(sig)
+            continue
+        dropped += 1
+        if get_preference(item) > get_preference(kept[match]):
+            kept[match] = item
+            kept_signatures[match] = sig
+    return kept, dropped
@@ -2,14 +2,131 @@
 """
 Script to index MediaWiki pages into vector database
 Run this once to populate the vector store, or when wiki content changes
+
+Each run builds a new index version next to the one being served and only
+switches to it after validation, so a running app.py keeps answering from
+the previous version until the switch.
+
+Near-duplicate pages (copy-pasted "(expired)" copies, per-region clones) are
+embedded once: every page gets a MinHash signature, and of each cluster of
+near-duplicates only the current, newest page is indexed.
 """
 
 from db_connector import WikiDBConnector
 from vector_store import VectorStore
-from chatbot import WikiChatbot
+from wikitext import wikitext_to_text
+from config import Config
+from typing import Dict, List, Tuple
+import dedup
 import sys
+import time
+
+def fetch_pages(db: WikiDBConnector, limit: int = 10000) -> List[Dict]:
+    """Fetch all pages with their categories and convert their wikitext to plain text"""
+    # Text rows are fetched in bulk by primary key
+    pages = db.get_all_pages(limit=limit, content_chars=None)  # Adjust limit as needed
+    # One categorylinks scan for all pages
+    categories = db.get_page_categories() if pages else {}
+    
+    formatted_pages = []
+    for page in pages:
+        # Handle bytes
+        page_title = page['page_title']
+        if isinstance(page_title, bytes):
+            page_title = page_title.decode('utf-8', errors='ignore')
+        page_title = page_title.replace('_', ' ')
+        
+        # Clean wiki markup
+        content = wikitext_to_text(page.get('content', ''))
+        
+        rev_timestamp = page.get('rev_timestamp') or ''
+        if isinstance(rev_timestamp, bytes):
+            rev_timestamp = rev_timestamp.decode('ascii', errors='ignore')
+        
+        formatted_pages.append({
+            'page_id': page['page_id'],
+            'title': page_title,
+            'content': content,
+            'namespace': page.get('page_namespace', 0),
+            'categories': categories.get(page['page_id'], []),
+            'rev_timestamp': str(rev_timestamp)
+        })
+    
+    return formatted_pages
+
+def dedupe_pages(pages: List[Dict], threshold: float) -> Tuple[List[Dict], int, int]:
+    """Sign every page and keep one page per cluster of near-duplicates
+    
+    Kept pages get a 'minhash' signature. A cluster is represented by its
+    current (not expired/moved) page with the newest revision, which takes
+    on the others' categories so category filters still find it. Returns
+    (pages to index, clusters, pages skipped).
+    """
+    signatures = [dedup.signature(page['content']) for page in pages]
+    for page, signature in zip(pages, signatures):
+        page['minhash'] = dedup.encode(signature)
+    if threshold <= 0:
+        return pages, 0, 0
+    
+    clusters = dedup.find_clusters(signatures, threshold)
+    skipped = set()
+    for members in clusters:
+        keep = max(members, key=lambda i: (dedup.preference(pages[i]['title'], pages[i]['rev_timestamp']),
+                                           pages[i]['page_id']))
+        others = [i for i in members if i != keep]
+        representative = pages[keep]
+        categories = list(representative.get('categories', []))
+        for i in others:
+            categories += [c for c in pages[i].get('categories', []) if c not in categories]
+        representative['categories'] = categories
+        skipped.update(others)
+    
+    kept = [page for i, page in enumerate(pages) if i not in skipped]
+    return kept, len(clusters), len(skipped)
+
+def build_index(vector_store: VectorStore, pages: List[Dict], keep_versions: int = 2,
+                dedup_threshold: float = None) -> Dict:
+    """Build a new index version, validate it, activate it and drop old versions
+    
+    Near-duplicates are collapsed first (dedup_threshold defaults to
+    DEDUP_THRESHOLD, 0 embeds every page). Raises an exception if validation
+    fails; the active version is untouched then.
+    """
+    start = time.time()
+    if dedup_threshold is None:
+        dedup_threshold = Config.DEDUP_THRESHOLD
+    pages, clusters, skipped = dedupe_pages(pages, dedup_threshold)
+    if skipped:
+        print(f"Skipping {skipped} near-duplicate pages in {clusters} clusters")
+    
+    version, collection = vector_store.create_version()
+    print(f"Building index version {version}...")
+    
+    try:
+        vector_store.index_pages(pages, collection=collection)
+        smoke_query = pages[0]['title'] if pages else None
+        if not vector_store.validate_version(collection, len(pages), smoke_query):
+            raise Exception(f"Index version {version} failed validation")
+    except Exception:
+        # Leave no half-built version behind
+        vector_store.client.delete_collection(collection.name)
+        raise
+    
+    vector_store.activate(version)
+    deleted = vector_store.garbage_collect(keep=keep_versions)
+    
+    return {
+        'version': version,
+        'documents': len(pages),
+        'duplicate_clusters': clusters,
+        'duplicates_skipped': skipped,
+        'seconds': round(time.time() - start, 2),
+        'deleted_versions': deleted
+    }
 
 def main():
+    config = Config()
+    
     print("=" * 60)
     print("MediaWiki Vector Database Indexer")
     print("=" * 60)
@@ -23,76 +140,45 @@ def main():
     
     print("✓ Database connected")
     
-    # Get all pages from wiki
-    print("\n2. Fetching all wiki pages...")
-    pages = db.get_all_pages(limit=10000)  # Adjust limit as needed
+    # Get all pages from wiki and clean wiki markup
+    print("\n2. Fetching and cleaning all wiki pages...")
+    formatted_pages = fetch_pages(db)
     
-    if not pages:
+    if not formatted_pages:
         print("❌ No pages found in database")
         sys.exit(1)
     
-    print(f"✓ Found {len(pages)} pages")
-    
-    # Clean and format pages
-    print("\n3. Cleaning wiki content...")
-    chatbot_temp = WikiChatbot.__new__(WikiChatbot)  # Create instance without __init__
-    
-    formatted_pages = []
-    for page in pages:
-        # Handle bytes
-        page_title = page['page_title']
-        if isinstance(page_title, bytes):
-            page_title = page_title.decode('utf-8', errors='ignore')
-        page_title = page_title.replace('_', ' ')
-        
-        # Get full content for this page
-        full_page = db.get_page_by_title(page_title)
-        if not full_page:
-            continue
-        
-        content = full_page.get('content', '')
-        if isinstance(content, bytes):
-            content = content.decode('utf-8', errors='ignore')
-        
-        # Clean wiki markup
-        content = chatbot_temp.clean_wiki_text(content)
-        
-        formatted_pages.append({
-            'page_id': page['page_id'],
-            'title': page_title,
-            'content': content
-        })
-    
-    print(f"✓ Cleaned {len(formatted_pages)} pages")
+    print(f"✓ Found {len(formatted_pages)} pages")
     
     # Initialize vector store
-    print("\n4. Initializing vector store...")
-    vector_store = VectorStore()
+    print("\n3. Initializing vector store...")
+    vector_store = VectorStore(persist_directory=config.VECTOR_DB_PATH)
     if not vector_store.initialize():
         print("❌ Failed to initialize vector store")
         sys.exit(1)
     
-    # Clear existing data (optional - comment out to keep existing)
-    if vector_store.collection.count() > 0:
-        response = input(f"\nVector store already contains {vector_store.collection.count()} documents. Clear and re-index? (y/n): ")
-        if response.lower() == 'y':
-            vector_store.clear()
-    
-    # Index pages
-    print("\n5. Indexing pages into vector database...")
-    vector_store.index_pages(formatted_pages)
+    # Index pages into a new version and switch to it
+    print("\n4. Indexing pages into vector database...")
+    try:
+        result = build_index(vector_store, formatted_pages, keep_versions=config.INDEX_KEEP_VERSIONS,
+                             dedup_threshold=config.DEDUP_THRESHOLD)
+    except Exception as e:
+        print(f"❌ Indexing failed: {e}")
+        sys.exit(1)
     
     # Show stats
     print("\n" + "=" * 60)
     stats = vector_store.get_stats()
     print("✓ Indexing Complete!")
+    print(f"  Active version: {result['version']}")
     print(f"  Total documents: {stats['total_documents']}")
+    print(f"  Near-duplicates skipped: {result['duplicates_skipped']} pages in {result['duplicate_clusters']} clusters")
     print(f"  Storage location: {stats['persist_directory']}")
     print("=" * 60)
     
     # Cleanup
     db.disconnect()
-    print("\nYou can now use the chatbot with vector search enabled!")
+    print("\nRunning servers pick up the new version automatically.")
 
 if __name__ == "__main__":
     main()
@@ -5,8 +5,172 @@ except ImportError:
     LLAMA_AVAILABLE = False
     print("Warning: llama-cpp-python not installed. Running in test mode.")
 
-from typing import Optional
+from typing import Dict, Iterator, Optional
 from config import Config
+import metrics
+import re
+import time
+
+LLM_TOKENS = metrics.registry.counter(
+    'wikichat_llm_tokens_total', 'Tokens processed by the model (kind=prompt|completion)')
+LLM_TOKENS_PER_SECOND = metrics.registry.histogram(
+    'wikichat_llm_decode_tokens_per_second', 'Decode speed per generation',
+    buckets=(1, 2, 5, 10, 15, 20, 30, 50, 100, 200))
+LLM_GENERATIONS = metrics.registry.counter(
+    'wikichat_llm_generations_total', 'Generations by why they ended (stop_reason)')
+LLM_TOKENS_SAVED = metrics.registry.counter(
+    'wikichat_llm_tokens_saved_total', 'Tokens not generated thanks to stopping runaway answers (upper bound)')
+LLM_SECONDS_SAVED = metrics.registry.counter(
+    'wikichat_llm_seconds_saved_total', 'Decode seconds not spent thanks to stopping runaway answers (estimate)')
+
+TEST_MODE_RESPONSE = "[TEST MODE] This is a test response. Install llama-cpp-python and download a model to get real AI responses."
+
+# llama.cpp stops at the end of sequence
+STOP_SEQUENCES = ["</s>"]
+# The start of a follow-up turn the model invents; cut by TurnStop, so an
+# answer cut there can be told from one that ended on its own
+TURN_SEQUENCES = ["User:", "\n\n\n", "USER QUESTION:", "\nQuestion:", "\nQ:"]
+
+# Answer token budgets by question type, first match wins
+QUESTION_TYPES = [
+    ('procedure', re.compile(r'\b(how (do|can|should|to)|steps?|guide|set ?up|install|configure|'
+                             r'enable|disable|reset|change|update|upgrade)\b', re.IGNORECASE), 384),
+    ('explanation', re.compile(r'\b(why|explain|difference|compare|versus|vs)\b', re.IGNORECASE), 256),
+    ('yes_no', re.compile(r'^\W*(is|are|can|could|does|do|did|will|should|has|have)\b', re.IGNORECASE), 96),
+    ('fact', re.compile(r'^\W*(what|which|who|when|where|how (much|many|long|often))\b', re.IGNORECASE), 128),
+]
+DEFAULT_QUESTION_BUDGET = 192
+# "I don't know based on the available information." fits easily
+NO_CONTEXT_BUDGET = 32
+# No budget goes below this, however little context there is
+MIN_ANSWER_BUDGET = 64
+
+class EarlyStop:
+    """Ends a generation that has stopped answering
+    
+    feed() takes each generated piece and returns the text that may be
+    shown. The generation should stop once `reason` is set:
+    - repeated_sentence: a sentence the answer already contains. While the
+      sentence being written could still turn into a repeat it is held back,
+      so a repeat is never shown.
+    - repetition: the same few words over and over ("reset reset reset ...",
+      "Press OK. Press OK. ..."). Only words with letters count, so table
+      rules ("|---|---|") and digit groups ("000 000 000") are not loops.
+    """
+    
+    # Sentences shorter than this may repeat ("Yes.")
+    MIN_SENTENCE_WORDS = 4
+    # Longest repeating run of words looked for, and how often (and over how
+    # many words) it must repeat to count as a loop
+    MAX_PATTERN_WORDS = 8
+    MIN_PATTERN_REPEATS = 4
+    MIN_REPEATED_WORDS = 12
+    # Enough trailing text to hold the longest loop looked for
+    LOOP_TAIL_CHARS = 2048
+    
+    _BOUNDARY_RE = re.compile(r'[.!?](?=\s)|\n')
+    _WORD_RE = re.compile(r'\w+')
+    _LETTER_RE = re.compile(r'[^\W\d_]')
+    
+    def __init__(self):
+        self.text = ''  # everything generated
+        self.pending = ''  # the sentence being written
+        self.released = False  # pending has diverged from every earlier sentence and is shown
+        self.sentences = set()
+        self.reason = None
+    
+    def _key(self, sentence: str) -> str:
+        return ' '.join(self._WORD_RE.findall(sentence.lower()))
+    
+    def _may_repeat(self, sentence: str) -> bool:
+        """True if the sentence so far (no words yet counts) is the start of an earlier one"""
+        key = self._key(sentence)
+        return any(seen.startswith(key) for seen in self.sentences)
+    
+    def _looping(self) -> bool:
+        """True if the text ends with a run of words repeated back to back"""
+        tail = self.text[-self.LOOP_TAIL_CHARS:]
+        words = self._WORD_RE.findall(tail.lower())
+        if words and self._WORD_RE.match(tail[-1:]):
+            words.pop()  # still being written
+        for length in range(1, self.MAX_PATTERN_WORDS + 1):
+            repeats = max(self.MIN_PATTERN_REPEATS, -(-self.MIN_REPEATED_WORDS // length))
+            if len(words) < length * repeats:
+                break
+            unit = words[-length:]
+            if (any(self._LETTER_RE.search(word) for word in unit)
+                    and words[-length * repeats:] == unit * repeats):
+                return True
+        return False
+    
+    def feed(self, piece: str) -> str:
+        """Text of the piece (and any held-back text) that can be shown now"""
+        self.text += piece
+        if self._looping():
+            self.reason = 'repetition'
+            return ''
+        
+        shown = ''
+        start = len(self.pending)
+        self.pending += piece
+        match = self._BOUNDARY_RE.search(self.pending)
+        while match:
+            sentence, self.pending = self.pending[:match.end()], self.pending[match.end():]
+            key = self._key(sentence)
+            if len(key.split()) >= self.MIN_SENTENCE_WORDS and key in self.sentences:
+                self.reason = 'repeated_sentence'
+                return shown
+            self.sentences.add(key)
+            shown += sentence[start if self.released else 0:]
+            self.released = False
+            start = 0
+            match = self._BOUNDARY_RE.search(self.pending)
+        
+        if self.released or not self._may_repeat(self.pending):
+            shown += self.pending[start if self.released else 0:]
+            self.released = True
+        return shown
+    
+    def flush(self) -> str:
+        """Held-back text once the generation ended on its own"""
+        if self.reason or self.released:
+            return ''
+        self.released = True
+        return self.pending
+
+class TurnStop:
+    """Cuts a generation at the first turn sequence, as llama.cpp's stop list would
+    
+    feed() returns the text that may be shown; text that could still become
+    a turn sequence is held back. `hit` is set once one was generated.
+    """
+    
+    def __init__(self, sequences=TURN_SEQUENCES):
+        self.sequences = sequences
+        self.pending = ''
+        self.hit = False
+    
+    def feed(self, piece: str) -> str:
+        self.pending += piece
+        hits = [pos for pos in (self.pending.find(sequence) for sequence in self.sequences) if pos >= 0]
+        if hits:
+            self.hit = True
+            shown, self.pending = self.pending[:min(hits)], ''
+            return shown
+        # Hold back the longest tail that starts a sequence
+        held = 0
+        for sequence in self.sequences:
+            for length in range(min(len(sequence) - 1, len(self.pending)), held, -1):
+                if self.pending.endswith(sequence[:length]):
+                    held = length
+                    break
+        shown, self.pending = self.pending[:len(self.pending) - held], self.pending[len(self.pending) - held:]
+        return shown
+    
+    def flush(self) -> str:
+        """Held-back text once the generation ended on its own"""
+        text, self.pending = self.pending, ''
+        return text
 
 class LlamaModel:
     """Wrapper for llama-cpp-python model"""
@@ -36,25 +200,149 @@ class LlamaModel:
             print(f"Model loading error: {e}")
             return False
     
-    def generate_response(self, prompt: str, max_tokens: Optional[int] = None) -> str:
-        """Generate response from the model"""
-        if not LLAMA_AVAILABLE:
-            return "[TEST MODE] This is a test response. Install llama-cpp-python and download a model to get real AI responses."
+    def count_tokens(self, text: str) -> int:
+        """Count prompt tokens with the model tokenizer (estimate without a model)"""
+        if not self.model:
+            return (len(text) + 3) // 4
+        return len(self.model.tokenize(text.encode('utf-8'), add_bos=False))
+    
+    @staticmethod
+    def question_type(question: str) -> str:
+        """Kind of answer a question needs (procedure, explanation, yes_no, fact or other)"""
+        for name, pattern, _ in QUESTION_TYPES:
+            if pattern.search(question):
+                return name
+        return 'other'
+    
+    def token_budget(self, question: str, context_tokens: int) -> int:
+        """max_tokens for one answer, from the question type and the context size
         
+        Step-by-step answers get the most room, yes/no and short facts the
+        least. An answer is not longer than the context it is based on, and
+        without context only the "I don't know" sentence is expected.
+        MODEL_MAX_TOKENS is the ceiling.
+        """
+        if context_tokens <= 0:
+            return min(NO_CONTEXT_BUDGET, self.config.MODEL_MAX_TOKENS)
+        kind = self.question_type(question)
+        budget = next((b for name, _, b in QUESTION_TYPES if name == kind), DEFAULT_QUESTION_BUDGET)
+        budget = min(budget, max(MIN_ANSWER_BUDGET, context_tokens))
+        return min(budget, self.config.MODEL_MAX_TOKENS)
+    
+    def stream_response(self, prompt: str, max_tokens: Optional[int] = None,
+                        stats: Optional[Dict] = None) -> Iterator[str]:
+        """Yield the response text as it is generated
+        
+        If a stats dict is given it is filled with prompt and completion token
+        counts, prefill (time to first token) and decode seconds, decode
+        tokens/sec, the token budget, why generation stopped and an estimate
+        of the tokens and seconds saved against the fixed MODEL_MAX_TOKENS,
+        also when the caller stops reading early. Generation ends at a turn
+        sequence (stop_reason 'turn') and, with EARLY_STOP, at the first
+        repeated sentence or looping pattern.
+        """
         if not self.model:
-            return "Error: Model not loaded"
+            yield TEST_MODE_RESPONSE if not LLAMA_AVAILABLE else "Error: Model not loaded"
+            return
         
+        max_tokens = max_tokens or self.config.MODEL_MAX_TOKENS
+        turn_stop = TurnStop()
+        early_stop = EarlyStop() if self.config.EARLY_STOP else None
+        start = time.perf_counter()
+        first_token = None
+        completion_tokens = 0
+        stop_reason = 'cancelled'  # until the generation ends
+        chunks = None
         try:
-            max_tokens = max_tokens or self.config.MODEL_MAX_TOKENS
-            response = self.model(
+            chunks = self.model(
                 prompt,
                 max_tokens=max_tokens,
                 temperature=self.config.MODEL_TEMPERATURE,
-                stop=["</s>", "User:", "\n\n\n"],
-                echo=False
+                stop=STOP_SEQUENCES,
+                echo=False,
+                stream=True
             )
-            
-            return response['choices'][0]['text'].strip()
+            # Each streamed chunk carries one token
+            for chunk in chunks:
+                if first_token is None:
+                    first_token = time.perf_counter()
+                completion_tokens += 1
+                choice = chunk['choices'][0]
+                text = turn_stop.feed(choice['text'])
+                if early_stop is not None:
+                    text = early_stop.feed(text)
+                if text:
+                    yield text
+                if early_stop is not None and early_stop.reason:
+                    stop_reason = early_stop.reason
+                    break
+                if turn_stop.hit:
+                    stop_reason = 'turn'
+                    break
+                if choice.get('finish_reason'):
+                    stop_reason = choice['finish_reason']
+            else:
+                if stop_reason == 'cancelled':
+                    stop_reason = 'length' if completion_tokens >= max_tokens else 'stop'
+                text = turn_stop.flush()
+                if early_stop is not None:
+                    text = early_stop.feed(text) + early_stop.flush()
+                if text:
+                    yield text
+        finally:
+            # Stopping early must stop the model too
+            if hasattr(chunks, 'close'):
+                chunks.close()
+            end = time.perf_counter()
+            first_token = first_token or end
+            self._record_stats(stats if stats is not None else {}, prompt, completion_tokens,
+                               first_token - start, end - first_token, max_tokens, stop_reason)
+    
+    def _record_stats(self, stats: Dict, prompt: str, completion_tokens: int,
+                      prefill_seconds: float, decode_seconds: float,
+                      max_tokens: int, stop_reason: str):
+        """Fill generation stats and update the LLM metrics"""
+        prompt_tokens = self.count_tokens(prompt)
+        # The first token comes out of prefill, the rest out of decode
+        tokens_per_second = (completion_tokens - 1) / decode_seconds if decode_seconds > 0 else 0.0
+        
+        # Only an answer cut where the model had stopped answering is counted:
+        # it would have run on to the fixed limit (an upper bound). An answer
+        # that hit its budget may have been complete or not, so it isn't.
+        if stop_reason in ('turn', 'repeated_sentence', 'repetition'):
+            tokens_saved = max(0, self.config.MODEL_MAX_TOKENS - completion_tokens)
+        else:
+            tokens_saved = 0
+        seconds_saved = tokens_saved / tokens_per_second if tokens_per_second else 0.0
+        
+        stats.update({
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'prefill_seconds': round(prefill_seconds, 4),
+            'decode_seconds': round(decode_seconds, 4),
+            'tokens_per_second': round(tokens_per_second, 2),
+            'max_tokens': max_tokens,
+            'stop_reason': stop_reason,
+            'tokens_saved': tokens_saved,
+            'seconds_saved': round(seconds_saved, 3)
+        })
+        
+        metrics.record('llm.prefill', prefill_seconds)
+        metrics.record('llm.decode', decode_seconds)
+        LLM_TOKENS.inc(prompt_tokens, kind='prompt')
+        LLM_TOKENS.inc(completion_tokens, kind='completion')
+        LLM_GENERATIONS.inc(stop_reason=stop_reason)
+        if tokens_saved:
+            LLM_TOKENS_SAVED.inc(tokens_saved)
+            LLM_SECONDS_SAVED.inc(seconds_saved)
+        if tokens_per_second:
+            LLM_TOKENS_PER_SECOND.observe(tokens_per_second)
+    
+    def generate_response(self, prompt: str, max_tokens: Optional[int] = None,
+                          stats: Optional[Dict] = None) -> str:
+        """Generate response from the model"""
+        try:
+            return ''.join(self.stream_response(prompt, max_tokens, stats)).strip()
         except Exception as e:
             print(f"Generation error: {e}")
             return f"Error generating response: {str(e)}"
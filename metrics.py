@@ -0,0 +1,244 @@
+"""
+Latency instrumentation and Prometheus text exposition
+
+Stages are timed with span():
+
+    with span('vector.search'):
+        ...
+
+A span adds its duration to the histogram wikichat_stage_seconds{stage=...}.
+While a request is being served (between start_request() and
+end_request()), spans are also collected per request. Per-stage totals
+can then be returned with the response, and are observed once per
+request instead of once per call.
+
+No client library is needed: the registry renders the Prometheus text
+format itself.
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from cache hits to long generations
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels: Dict) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: Tuple, extra: Optional[Tuple] = None) -> str:
+    items = list(key) + list(extra or ())
+    if not items:
+        return ''
+    escaped = (
+        f'{k}="' + v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for k, v in items
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = 'untyped'
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            return [f"{self.name}{_format_labels(key)} {_format_value(value)}"
+                    for key, value in sorted(self.values.items())]
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}",
+                f"# TYPE {self.name} {self.type_name}"] + self.samples()
+
+
+class Counter(_Metric):
+    """Monotonic counter"""
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set_total(self, value: float, **labels):
+        """Mirror a total that is counted elsewhere (e.g. cache hits)"""
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+    type_name = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram"""
+    type_name = 'histogram'
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self.lock:
+            for key, series in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series['counts']):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(series['sum'])}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+
+class Registry:
+    """Named metrics, rendered together for /metrics"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name: str, help_text: str, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help_text, **kwargs)
+            return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    'wikichat_stage_seconds', 'Time spent per pipeline stage (per request for chat stages)')
+STAGE_CALLS = registry.counter(
+    'wikichat_stage_calls_total', 'Number of times each stage ran')
+
+
+class Timings:
+    """Per-request stage timings"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}  # stage -> [seconds, calls]
+        self.values = {}
+
+    def add(self, stage: str, seconds: float, calls: int = 1):
+        entry = self.stages.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += calls
+
+    def set(self, name: str, value):
+        """Attach a non-timing value (token counts, tokens/sec) to the request"""
+        self.values[name] = value
+
+    def total_seconds(self) -> float:
+        return time.perf_counter() - self.start
+
+    def to_dict(self) -> Dict:
+        """Stage durations in milliseconds plus call counts and attached values"""
+        result = {
+            'total_ms': round(self.total_seconds() * 1000, 2),
+            'stages_ms': {stage: round(seconds * 1000, 2) for stage, (seconds, _) in self.stages.items()},
+            'db_queries': sum(calls for stage, (_, calls) in self.stages.items() if stage.startswith('db.'))
+        }
+        result.update(self.values)
+        return result
+
+
+_local = threading.local()
+
+
+def current_timings() -> Optional[Timings]:
+    """Timings of the request being served on this thread, if any"""
+    return getattr(_local, 'timings', None)
+
+
+def start_request() -> Timings:
+    """Start collecting spans for a request on this thread"""
+    _local.timings = Timings()
+    return _local.timings
+
+
+def end_request(timings: Timings, observe_total: bool = True):
+    """Stop collecting and observe the request's per-stage totals (and its total)"""
+    if current_timings() is timings:
+        _local.timings = None
+    for stage, (seconds, calls) in timings.stages.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+        STAGE_CALLS.inc(calls, stage=stage)
+    if observe_total:
+        STAGE_SECONDS.observe(timings.total_seconds(), stage='total')
+
+
+def record(stage: str, seconds: float, calls: int = 1):
+    """Record a duration measured elsewhere (e.g. LLM prefill)"""
+    timings = current_timings()
+    if timings is not None:
+        timings.add(stage, seconds, calls)
+    else:
+        STAGE_SECONDS.observe(seconds, stage=stage)
+        STAGE_CALLS.inc(calls, stage=stage)
+
+
+@contextmanager
+def span(stage: str):
+    """Time a block as one call of a stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
@@ -0,0 +1,175 @@
+"""
+On-demand profiling of single requests
+
+A profiled call runs under cProfile (deterministic, saved as .pstats) while
+a background thread samples the calling thread's stack. The samples are
+saved in the collapsed-stack format that flamegraph.pl and speedscope read
+(one "outer;inner;leaf count" line per distinct stack). Time spent in C
+code, such as a regex in clean_wiki_text or a cursor waiting on MariaDB,
+is charged to the Python frame that called it.
+
+Profiles are rate-limited and run one at a time; a call that can't be
+profiled simply runs unprofiled.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval"""
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {}
+        self.samples = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def _label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ':')
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame))
+                frame = frame.f_back
+            key = ';'.join(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def collapsed(self) -> str:
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(self.counts.items()))
+
+
+class RequestProfiler:
+    """Profiles single calls on request, at most max_per_minute of them"""
+
+    # Functions listed in the response, by own time
+    TOP_FUNCTIONS = 10
+
+    def __init__(self, directory: str = './profiles', max_per_minute: int = 2,
+                 sample_interval: float = 0.005):
+        self.directory = directory
+        self.max_per_minute = max_per_minute
+        self.sample_interval = sample_interval
+        self.lock = threading.Lock()  # guards armed and recent, never held during a call
+        self.profile_lock = threading.Lock()  # one profile at a time (cProfile allows only one)
+        self.recent = deque()  # start times of recent profiles
+        self.armed = 0  # requests to profile without being asked (set by an admin)
+
+    def arm(self, requests: int):
+        """Profile the next `requests` calls that check take_armed()"""
+        with self.lock:
+            self.armed = max(0, requests)
+
+    def take_armed(self) -> bool:
+        """Consume one armed request, True if there was one"""
+        with self.lock:
+            if self.armed > 0:
+                self.armed -= 1
+                return True
+            return False
+
+    def _admit(self) -> Optional[str]:
+        """Reserve a profiling slot; returns why not if it can't"""
+        with self.lock:
+            now = time.monotonic()
+            while self.recent and now - self.recent[0] > 60:
+                self.recent.popleft()
+            if len(self.recent) >= self.max_per_minute:
+                return f"rate limited ({self.max_per_minute} per minute)"
+            self.recent.append(now)
+            return None
+
+    def run(self, func: Callable, name: str = 'request') -> Tuple[object, Dict]:
+        """Call func under the profilers; returns (result, profile info)
+
+        If the call can't be profiled (rate limit, another profile running)
+        it runs normally and the info says why.
+        """
+        if not self.profile_lock.acquire(blocking=False):
+            return func(), {'skipped': 'another profile is running'}
+        try:
+            reason = self._admit()
+            if not reason:
+                return self._profile(func, name)
+        finally:
+            self.profile_lock.release()
+        # Rate limited: runs without holding the profile lock
+        return func(), {'skipped': reason}
+
+    def _profile(self, func: Callable, name: str) -> Tuple[object, Dict]:
+        profile_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{name}-{uuid.uuid4().hex[:8]}"
+        sampler = StackSampler(threading.get_ident(), self.sample_interval)
+        profiler = cProfile.Profile()
+
+        start = time.perf_counter()
+        sampler.start()
+        profiler.enable()
+        try:
+            result = func()
+        finally:
+            profiler.disable()
+            sampler.stop()
+        seconds = time.perf_counter() - start
+
+        os.makedirs(self.directory, exist_ok=True)
+        pstats_path = os.path.join(self.directory, f"{profile_id}.pstats")
+        collapsed_path = os.path.join(self.directory, f"{profile_id}.collapsed")
+        profiler.dump_stats(pstats_path)
+        with open(collapsed_path, 'w') as f:
+            f.write(sampler.collapsed())
+
+        return result, {
+            'id': profile_id,
+            'seconds': round(seconds, 4),
+            'pstats': pstats_path,
+            'collapsed': collapsed_path,
+            'samples': sampler.samples,
+            'top': self._top_functions(profiler)
+        }
+
+    def _top_functions(self, profiler: cProfile.Profile) -> List[Dict]:
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        rows = []
+        for (filename, line, function), (_, calls, total, cumulative, _) in stats.stats.items():
+            rows.append({
+                'function': f"{function} ({os.path.basename(filename)}:{line})",
+                'calls': calls,
+                'total_seconds': round(total, 4),
+                'cumulative_seconds': round(cumulative, 4)
+            })
+        # Own time points at the culprit; cumulative time mostly at wrappers
+        rows.sort(key=lambda row: row['total_seconds'], reverse=True)
+        return rows[:self.TOP_FUNCTIONS]
+
+    def list_profiles(self) -> List[str]:
+        """Saved profile files, newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        names = [n for n in os.listdir(self.directory) if n.endswith(('.pstats', '.collapsed'))]
+        return sorted(names, reverse=True)
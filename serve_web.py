@@ -2,45 +2,122 @@
 """
 Web server for serving the HTML interface
 Automatically reads port from .env and injects API port into HTML
+
+index.html is read and the API port injected once at startup. The page is
+kept in memory both plain and gzipped, and requests are answered with an
+ETag so browsers revalidate with a 304 instead of downloading it again.
+The same page can be served by app.py itself (SERVE_UI=True).
 """
+import gzip
+import hashlib
 import http.server
-import socketserver
 import os
 from config import Config
 
-class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
-    """Custom handler that injects API port into index.html"""
+INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'index.html')
+
+class StaticPage:
+    """index.html with the API port injected, in memory plain and gzipped"""
     
-    def do_GET(self):
-        if self.path == '/' or self.path == '/index.html':
-            # Serve index.html with API port injected
-            config = Config()
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            
-            # Read index.html and inject API port
-            with open('index.html', 'r') as f:
-                html_content = f.read()
-            
-            # Replace the API port line
+    # Revalidate on every load (cheap with the ETag): the page has no versioned URL
+    CACHE_CONTROL = 'no-cache'
+    
+    def __init__(self, path: str = INDEX_PATH, api_port: int = None):
+        with open(path, 'r', encoding='utf-8') as f:
+            html_content = f.read()
+        
+        # Replace the API port line
+        if api_port is not None:
             html_content = html_content.replace(
                 "const apiPort = urlParams.get('api_port') || '5000';",
-                f"const apiPort = urlParams.get('api_port') || '{config.FLASK_PORT}';"
+                f"const apiPort = urlParams.get('api_port') || '{api_port}';"
             )
-            
-            self.wfile.write(html_content.encode())
-        else:
-            # Serve other files normally
-            super().do_GET()
+        
+        self.body = html_content.encode('utf-8')
+        self.gzipped = gzip.compress(self.body, compresslevel=9, mtime=0)
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:20]}"'
+    
+    @staticmethod
+    def accepts_gzip(accept_encoding: str) -> bool:
+        """True if an Accept-Encoding header allows gzip"""
+        for part in (accept_encoding or '').split(','):
+            coding, *params = part.split(';')
+            if coding.strip().lower() not in ('gzip', '*'):
+                continue
+            quality = 1.0
+            for param in params:
+                name, _, value = param.strip().partition('=')
+                if name.lower() == 'q':
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+            return quality > 0
+        return False
+    
+    def matches(self, if_none_match: str) -> bool:
+        """True if an If-None-Match header names the current version"""
+        for tag in (if_none_match or '').split(','):
+            tag = tag.strip()
+            if tag == '*' or tag.replace('W/', '', 1) == self.etag:
+                return True
+        return False
+    
+    def respond(self, if_none_match: str = None, accept_encoding: str = None):
+        """(status, headers, body) for a GET of the page"""
+        headers = {
+            'ETag': self.etag,
+            'Cache-Control': self.CACHE_CONTROL,
+            'Vary': 'Accept-Encoding'
+        }
+        if self.matches(if_none_match):
+            return 304, headers, b''
+        
+        body = self.body
+        if self.accepts_gzip(accept_encoding):
+            body = self.gzipped
+            headers['Content-Encoding'] = 'gzip'
+        headers['Content-Type'] = 'text/html; charset=utf-8'
+        headers['Content-Length'] = str(len(body))
+        return 200, headers, body
+
+class CustomHTTPRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Serves the in-memory index.html; nothing else from disk"""
+    
+    # Keep-alive: every response has a Content-Length
+    protocol_version = 'HTTP/1.1'
+    page = None
+    
+    def do_GET(self):
+        self.respond(send_body=True)
+    
+    def do_HEAD(self):
+        self.respond(send_body=False)
+    
+    def respond(self, send_body: bool):
+        if self.path.split('?', 1)[0] not in ('/', '/index.html'):
+            self.send_error(404)
+            return
+        
+        status, headers, body = self.page.respond(
+            self.headers.get('If-None-Match'),
+            self.headers.get('Accept-Encoding')
+        )
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
 
 def main():
     config = Config()
     port = config.WEB_SERVER_PORT
     
-    handler = CustomHTTPRequestHandler
+    CustomHTTPRequestHandler.page = StaticPage(api_port=config.FLASK_PORT)
     
-    with socketserver.TCPServer(("", port), handler) as httpd:
+    # One thread per connection: a slow client doesn't hold up the others
+    with http.server.ThreadingHTTPServer(("", port), CustomHTTPRequestHandler) as httpd:
         print(f"=" * 60)
         print(f"Web Server Starting")
         print(f"=" * 60)
@@ -0,0 +1,94 @@
+"""
+Shared setup for the tests
+
+The modules read their settings from the environment when imported, so the
+background threads WikiChatbot would start are switched off first. The bench
+directory holds the synthetic wiki and fake model the tests run against.
+"""
+
+import os
+import shutil
+import sys
+
+os.environ.setdefault('CHATBOT_AUTOINIT', 'False')
+os.environ.setdefault('TITLE_INDEX_REFRESH_INTERVAL', '0')
+os.environ.setdefault('HEALTH_PROBE_INTERVAL', '0')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'bench')]
+
+import pytest
+
+import circuit_breaker
+from synthetic_wiki import SyntheticWikiDB, create_wiki
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers():
+    """Every test starts with closed breakers (connectors made in it pick up new ones)"""
+    circuit_breaker._breakers.clear()
+    yield
+    circuit_breaker._breakers.clear()
+
+
+@pytest.fixture(scope='session')
+def wiki_template(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('wiki') / 'wiki.sqlite')
+    create_wiki(path, pages=120, seed=7)
+    return path
+
+
+@pytest.fixture
+def wiki_path(wiki_template, tmp_path):
+    """A synthetic wiki the test may change"""
+    path = str(tmp_path / 'wiki.sqlite')
+    shutil.copy(wiki_template, path)
+    return path
+
+
+@pytest.fixture
+def wiki_db(wiki_path):
+    db = SyntheticWikiDB(wiki_path)
+    assert db.connect()
+    yield db
+    db.disconnect()
+
+
+@pytest.fixture
+def vector_store(wiki_db, tmp_path):
+    """A real Chroma store in tmp_path with the synthetic wiki indexed (hash embeddings)"""
+    from hash_embedding import HashEmbeddingFunction
+    from index_wiki import build_index, fetch_pages
+    from vector_store import VectorStore
+
+    store = VectorStore(persist_directory=str(tmp_path / 'chroma'), embedding_function=HashEmbeddingFunction())
+    assert store.initialize()
+    build_index(store, fetch_pages(wiki_db))
+    yield store
+    store.executor.shutdown(wait=False)
+
+
+@pytest.fixture
+def make_chatbot(wiki_db, monkeypatch):
+    """WikiChatbot on the synthetic wiki with an instant fake LLM; keyword search unless given a vector store"""
+    from chatbot import WikiChatbot
+    from config import Config
+    from fake_llm import make_fake_llm
+
+    def make(vector_store=None):
+        if vector_store is None:
+            monkeypatch.setattr(Config, 'USE_VECTOR_SEARCH', False)
+        return WikiChatbot(db=wiki_db, llm=make_fake_llm(prefill_tps=0, decode_tps=0), vector_store=vector_store)
+    return make
+
+
+@pytest.fixture
+def chatbot(make_chatbot):
+    """Keyword-search chatbot"""
+    return make_chatbot()
+
+
+@pytest.fixture
+def vector_chatbot(make_chatbot, vector_store):
+    """Chatbot searching the indexed vector_store"""
+    return make_chatbot(vector_store)
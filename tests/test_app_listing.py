@@ -0,0 +1,57 @@
+import pytest
+
+import app as app_module
+from config import Config
+
+
+@pytest.fixture
+def client(chatbot, monkeypatch):
+    monkeypatch.setattr(app_module, 'chatbot', chatbot)
+    return app_module.app.test_client()
+
+
+def _fail_queries(monkeypatch, wiki_db):
+    def cursor(*args, **kwargs):
+        raise RuntimeError("server has gone away")
+    monkeypatch.setattr(wiki_db, 'cursor', cursor)
+
+
+def test_search_pages_returns_none_on_error(wiki_db, monkeypatch):
+    _fail_queries(monkeypatch, wiki_db)
+    assert wiki_db.search_pages('router') is None
+
+
+def test_search_streams_results(client):
+    body = client.get('/api/search?q=Router&limit=3').get_json()
+    assert body['query'] == 'Router'
+    assert body['count'] == 3 and len(body['results']) == 3
+    assert body['next_cursor']
+    assert 'error' not in body
+
+
+def test_failed_search_ends_with_an_error(client, wiki_db, monkeypatch):
+    _fail_queries(monkeypatch, wiki_db)
+    body = client.get('/api/search?q=Router').get_json()
+    assert body['results'] == [] and body['count'] == 0
+    assert body['error'] == 'Database error'
+
+
+def test_failed_page_list_ends_with_the_same_error(client, wiki_db, monkeypatch):
+    _fail_queries(monkeypatch, wiki_db)
+    body = client.get('/api/pages').get_json()
+    assert body['error'] == 'Database error'
+
+
+def test_keyword_retrieval_survives_a_failed_search(chatbot, wiki_db, monkeypatch):
+    monkeypatch.setattr(wiki_db, 'search_pages', lambda *args, **kwargs: None)
+    assert chatbot._retrieve_context_keyword("Acme Router X1 password reset") == []
+
+
+def test_admin_endpoints_refuse_everyone_without_a_token(client, monkeypatch):
+    monkeypatch.setattr(Config, 'ADMIN_TOKEN', '')
+    assert client.get('/api/admin/profiling').status_code == 403
+    assert client.get('/api/admin/profiling', headers={'X-Admin-Token': ''}).status_code == 403
+
+    monkeypatch.setattr(Config, 'ADMIN_TOKEN', 'secret')
+    assert client.get('/api/admin/profiling', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    assert client.get('/api/admin/profiling', headers={'X-Admin-Token': 'secret'}).status_code == 200
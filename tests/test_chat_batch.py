@@ -0,0 +1,34 @@
+import threading
+
+from chatbot import WikiChatbot
+
+
+def _record_threads(monkeypatch, obj, name, threads):
+    original = getattr(obj, name)
+
+    def recorded(*args, **kwargs):
+        threads.add(threading.get_ident())
+        return original(*args, **kwargs)
+    monkeypatch.setattr(obj, name, recorded)
+
+
+def test_batch_answers_in_order(vector_chatbot, monkeypatch):
+    monkeypatch.setattr(WikiChatbot, 'BATCH_CHUNK_SIZE', 2)
+    questions = ["How do I reset the Acme Router X1 password?", "Shipping to the EU",
+                 "Globex Router X2 setup", "Return policy", "Warranty claims"]
+    results = list(vector_chatbot.chat_batch(questions, include_timings=True))
+    answers, summary = results[:-1], results[-1]
+    assert [answer['index'] for answer in answers] == list(range(len(questions)))
+    assert [answer['question'] for answer in answers] == questions
+    assert all(answer['type'] == 'answer' and 'batch_prepare_ms' in answer['timings'] for answer in answers)
+    assert summary['type'] == 'summary' and summary['questions'] == len(questions)
+
+
+def test_batch_uses_the_connection_and_tokenizer_on_the_calling_thread(vector_chatbot, wiki_db, monkeypatch):
+    monkeypatch.setattr(WikiChatbot, 'BATCH_CHUNK_SIZE', 2)
+    threads = set()
+    _record_threads(monkeypatch, wiki_db, 'cursor', threads)
+    _record_threads(monkeypatch, vector_chatbot.llm, 'count_tokens', threads)
+    results = list(vector_chatbot.chat_batch(["Acme Router X1", "Globex Router X2", "Shipping", "Returns"]))
+    assert len(results) == 5
+    assert threads == {threading.get_ident()}
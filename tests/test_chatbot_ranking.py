@@ -0,0 +1,29 @@
+import pytest
+
+import dedup
+
+
+def test_title_boost_matches_keywords_inside_title_words(chatbot):
+    results = [
+        {'page_id': 1001, 'title': 'Printer setup', 'similarity_score': 0.6},
+        {'page_id': 1002, 'title': 'Routers overview', 'similarity_score': 0.5},
+    ]
+    ranked = chatbot._rank_vector_results('router problems', results, max_pages=2)
+    assert [result['page_id'] for result in ranked] == [1002, 1001]
+    assert ranked[0]['adjusted_similarity'] == pytest.approx(0.5 + chatbot.TITLE_KEYWORD_BOOST)
+
+
+def test_injected_title_match_is_deduplicated(chatbot, wiki_db):
+    named = wiki_db.get_pages_by_ids([1])[0]
+    # The vector search returned a near-copy of the named page, but not the page itself
+    copy = {'page_id': 2, 'title': 'Globex Router X1 Password reset', 'similarity_score': 0.9,
+            'minhash': dedup.encode(dedup.signature(chatbot.clean_wiki_text(named['content'])))}
+    ranked = chatbot._rank_vector_results('How do I do an Acme Router X1 Password reset?', [copy], max_pages=5)
+    assert len([result for result in ranked if result['page_id'] in (1, 2)]) == 1
+
+
+def test_injected_title_match_is_kept_without_duplicates(chatbot):
+    other = {'page_id': 2, 'title': 'Globex Router X1 Password reset', 'similarity_score': 0.9,
+             'minhash': dedup.encode(dedup.signature("Unrelated text about the Globex router"))}
+    ranked = chatbot._rank_vector_results('How do I do an Acme Router X1 Password reset?', [other], max_pages=5)
+    assert {result['page_id'] for result in ranked} == {1, 2}
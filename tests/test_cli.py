@@ -0,0 +1,29 @@
+import argparse
+import json
+import sys
+
+import pytest
+
+import cli
+
+
+@pytest.fixture
+def batch_file(make_chatbot, tmp_path, monkeypatch):
+    monkeypatch.setattr(cli, 'WikiChatbot', make_chatbot)
+    path = tmp_path / 'questions.txt'
+    path.write_text('{"question": "Acme Router X1 password reset", "id": "q1"}\nShipping to the EU\n')
+    return str(path)
+
+
+def test_batch_to_stdout_leaves_stdout_open(batch_file, capsys):
+    cli.run_batch(argparse.Namespace(batch=batch_file, output=None, timings=False))
+    assert not sys.stdout.closed
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [line['type'] for line in lines] == ['answer', 'answer', 'summary']
+    assert lines[0]['id'] == 'q1'
+
+
+def test_batch_to_a_file_closes_the_file(batch_file, tmp_path):
+    output = tmp_path / 'results.jsonl'
+    cli.run_batch(argparse.Namespace(batch=batch_file, output=str(output), timings=False))
+    assert len(output.read_text().splitlines()) == 3
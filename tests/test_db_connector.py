@@ -0,0 +1,149 @@
+import sqlite3
+import threading
+import zlib
+
+import pytest
+
+from db_connector import normalize_category
+
+
+def _latest_text(path: str, compressed: bool):
+    """(page_id, old_id) of a content page whose latest text row is (or isn't) gzip-compressed"""
+    connection = sqlite3.connect(path)
+    row = connection.execute(
+        "SELECT p.page_id, t.old_id FROM page p JOIN text t ON t.old_id = p.page_latest "
+        "WHERE p.page_is_redirect = 0 AND t.old_flags LIKE ? ORDER BY p.page_id LIMIT 1",
+        ('%gzip%' if compressed else 'utf-8',)).fetchone()
+    connection.close()
+    return row
+
+
+def _set_text(path: str, old_id: int, text: str, compressed: bool):
+    data = text.encode('utf-8')
+    if compressed:
+        compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        stored, flags = compressor.compress(data) + compressor.flush(), 'utf-8,gzip'
+    else:
+        stored, flags = text, 'utf-8'
+    connection = sqlite3.connect(path)
+    connection.execute("UPDATE text SET old_text = ?, old_flags = ? WHERE old_id = ?", (stored, flags, old_id))
+    connection.commit()
+    connection.close()
+
+
+def test_search_matches_compressed_and_plain_text(wiki_db, wiki_path):
+    gzip_page, gzip_text = _latest_text(wiki_path, compressed=True)
+    plain_page, plain_text = _latest_text(wiki_path, compressed=False)
+    _set_text(wiki_path, gzip_text, "Pair with the zebracorn dongle first.", compressed=True)
+    _set_text(wiki_path, plain_text, "The zebracorn dongle ships separately.", compressed=False)
+
+    results = wiki_db.search_pages('zebracorn dongle', limit=5)
+    assert sorted(result['page_id'] for result in results) == sorted([gzip_page, plain_page])
+    by_id = {result['page_id']: result for result in results}
+    assert by_id[gzip_page]['content'] == "Pair with the zebracorn dongle first."
+    assert 'content_address' not in by_id[gzip_page]
+
+
+def test_search_without_matches(wiki_db):
+    assert wiki_db.search_pages('no page mentions this', limit=5) == []
+
+
+def test_search_keyset_pages_cover_the_full_result(wiki_db):
+    everything = wiki_db.search_pages('the', limit=40)
+    assert len(everything) == 40
+
+    seen = []
+    after = None
+    while len(seen) < 40:
+        page = wiki_db.search_pages('the', limit=7, after=after)
+        assert page
+        seen.extend(page)
+        after = (page[-1]['relevance'], page[-1]['page_id'])
+    assert [r['page_id'] for r in seen[:40]] == [r['page_id'] for r in everything]
+
+
+def test_search_orders_title_matches_first(wiki_db):
+    results = wiki_db.search_pages('Router', limit=10)
+    assert results
+    relevance = [result['relevance'] for result in results]
+    assert relevance == sorted(relevance, reverse=True)
+    assert all('Router' in result['page_title'] for result in results if result['relevance'] >= 4)
+
+
+def test_search_caches_only_returned_pages(wiki_db):
+    wiki_db.content.cache.clear()
+    results = wiki_db.search_pages('the', limit=3)
+    assert set(wiki_db.content.cache) == {result['content_id'] for result in results}
+
+
+def test_normalize_category():
+    assert normalize_category('category:product  faq') == 'Product_faq'
+
+
+def _compress_all(path: str):
+    connection = sqlite3.connect(path)
+    rows = connection.execute("SELECT old_id, old_text FROM text WHERE old_flags NOT LIKE '%gzip%'").fetchall()
+    connection.close()
+    for old_id, text in rows:
+        _set_text(path, old_id, text if isinstance(text, str) else text.decode('utf-8'), compressed=True)
+
+
+def test_search_decodes_a_bounded_number_of_compressed_texts(wiki_db, wiki_path, monkeypatch, capsys):
+    _compress_all(wiki_path)
+    wiki_db.config.SEARCH_MAX_COMPRESSED = 20
+    decoded = []
+    decode = wiki_db.search_texts.decode
+    monkeypatch.setattr(wiki_db.search_texts, 'decode', lambda text, flags: decoded.append(1) or decode(text, flags))
+
+    assert wiki_db.search_pages('no page mentions this', limit=5) == []
+    assert len(decoded) == 20 + 5
+    assert "stopped after 20 compressed pages" in capsys.readouterr().out
+
+    # Texts already decoded come from the search cache
+    decoded.clear()
+    assert wiki_db.search_pages('no page mentions this', limit=5) == []
+    assert decoded == []
+
+
+def test_search_finds_compressed_text_within_the_cap(wiki_db, wiki_path):
+    _compress_all(wiki_path)
+    gzip_page, gzip_text = _latest_text(wiki_path, compressed=True)
+    _set_text(wiki_path, gzip_text, "Pair with the zebracorn dongle first.", compressed=True)
+
+    wiki_db.config.SEARCH_MAX_COMPRESSED = 500
+    assert [result['page_id'] for result in wiki_db.search_pages('zebracorn', limit=5)] == [gzip_page]
+    wiki_db.config.SEARCH_MAX_COMPRESSED = 0
+    assert wiki_db.search_pages('zebracorn', limit=5) == []
+
+
+def test_concurrent_queries_use_their_own_connections(wiki_db):
+    inside = threading.Barrier(2)
+    connections = []
+
+    def query():
+        with wiki_db.cursor() as cursor:
+            connections.append(cursor.cursor.connection)
+            inside.wait(timeout=5)
+            cursor.execute("SELECT COUNT(*) AS n FROM page")
+            assert cursor.fetchone()['n'] > 0
+
+    threads = [threading.Thread(target=query) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(connections) == 2 and connections[0] is not connections[1]
+    assert len(wiki_db.idle) == 2
+
+
+def test_connection_error_closes_only_that_connection(wiki_db):
+    with wiki_db.cursor() as cursor:
+        healthy = cursor.cursor.connection
+        with pytest.raises(OSError):
+            with wiki_db.cursor() as broken:
+                broken.execute("SELECT 1")
+                raise OSError("connection reset")
+        assert wiki_db.breaker.status()['consecutive_failures'] == 1
+        cursor.execute("SELECT COUNT(*) AS n FROM page")
+        assert cursor.fetchone()['n'] > 0
+    assert [connection.connection for connection in wiki_db.idle] == [healthy]
@@ -0,0 +1,82 @@
+import shutil
+
+import app as app_module
+import circuit_breaker
+from chatbot import WikiChatbot
+from config import Config
+from fake_llm import make_fake_llm
+from hash_embedding import HashEmbeddingFunction
+
+
+def test_breaker_opens_then_lets_one_trial_through():
+    breaker = circuit_breaker.CircuitBreaker('dependency', failure_threshold=2, reset_timeout=0)
+    breaker.record_failure(RuntimeError("down"))
+    assert breaker.available()
+    breaker.record_failure(RuntimeError("down"))
+    assert not breaker.available()
+    assert breaker.status()['state'] == 'open'
+
+    assert breaker.allow()  # the trial call after reset_timeout
+    assert not breaker.allow()  # one trial at a time
+    assert breaker.allow(probe=True)
+    breaker.record_failure(RuntimeError("still down"))
+    assert breaker.status()['state'] == 'open'
+
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.available()
+    assert breaker.status()['consecutive_failures'] == 0
+
+
+def test_probe_closes_the_breaker_of_a_store_that_answers(vector_chatbot, vector_store):
+    bot = vector_chatbot
+    for _ in range(vector_store.breaker.failure_threshold):
+        vector_store.breaker.record_failure(RuntimeError("timed out"))
+    assert not vector_store.breaker.available()
+
+    assert bot.probe_dependencies() == {'mariadb': True, 'vector_store': True}
+    assert vector_store.breaker.available()
+    assert bot.vector_store is vector_store
+
+
+def test_probe_reopens_the_failed_store_in_place(wiki_db, vector_store, tmp_path, monkeypatch):
+    # A file where the store's directory should be: opening fails
+    path = tmp_path / 'store'
+    path.write_text('')
+    monkeypatch.setattr(Config, 'VECTOR_DB_PATH', str(path))
+    monkeypatch.setattr(Config, 'USE_VECTOR_SEARCH', True)
+    bot = WikiChatbot(db=wiki_db, llm=make_fake_llm(prefill_tps=0, decode_tps=0))
+    failed = bot.failed_vector_store
+    assert bot.vector_store is None and failed is not None
+    failed.embedding_function = HashEmbeddingFunction()
+    executor = failed.executor
+
+    # Still failing: the same store is retried, nothing new is built
+    assert bot.probe_dependencies()['vector_store'] is False
+    assert bot.failed_vector_store is failed
+
+    path.unlink()
+    shutil.copytree(vector_store.persist_directory, path)
+    assert bot.probe_dependencies()['vector_store'] is True
+    assert bot.vector_store is failed and bot.failed_vector_store is None
+    assert bot.vector_store.executor is executor
+    assert bot.vector_ready
+    failed.executor.shutdown(wait=False)
+
+
+def test_reinitialize_keeps_a_client_that_answers(vector_store):
+    client = vector_store.client
+    assert vector_store.initialize()
+    assert vector_store.client is client
+
+
+def test_metrics_skip_the_document_count_while_the_store_is_down(vector_chatbot, vector_store, monkeypatch):
+    monkeypatch.setattr(app_module, 'chatbot', vector_chatbot)
+    for _ in range(vector_store.breaker.failure_threshold):
+        vector_store.breaker.record_failure(RuntimeError("timed out"))
+    counted = []
+    monkeypatch.setattr(vector_store.collection, 'count', lambda: counted.append(1) or 0)
+
+    response = app_module.app.test_client().get('/metrics')
+    assert response.status_code == 200
+    assert counted == []  # the open breaker fails the call before it reaches the store
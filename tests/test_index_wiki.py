@@ -0,0 +1,47 @@
+from index_wiki import build_index, dedupe_pages
+
+TEXT = ("To reset the {product} password, hold the reset button on the back for ten seconds "
+        "until the status light blinks, then sign in with the default password printed on the label "
+        "and choose a new password of at least twelve characters.")
+
+
+def _page(page_id, title, product, timestamp, categories, extra=''):
+    return {'page_id': page_id, 'title': title, 'content': TEXT.format(product=product) + extra,
+            'namespace': 0, 'categories': categories, 'rev_timestamp': timestamp}
+
+
+def _pages():
+    return [
+        _page(1, "Acme Router X1 password reset", "Acme Router X1", '20240301000000', ['Routers']),
+        _page(2, "Acme Router X1 password reset (expired)", "Acme Router X1", '20240501000000', ['Archive'],
+              extra=" This page is kept for reference."),
+        _page(3, "Acme Router X1 password reset (EU)", "Acme Router X1", '20240201000000', ['EU']),
+        _page(4, "Globex Switch S4 firmware update", "Globex Switch S4", '20240101000000', ['Switches'],
+              extra=" Download the firmware from the support site, open the web console and upload it. "
+                    "The switch restarts twice; do not unplug it while the update runs."),
+    ]
+
+
+def test_near_duplicates_are_grouped_and_one_is_kept():
+    kept, clusters, skipped = dedupe_pages(_pages(), threshold=0.7)
+    assert (clusters, skipped) == (1, 2)
+    assert sorted(page['page_id'] for page in kept) == [1, 4]
+    # The current title wins over a newer expired copy, and carries the copies' categories
+    representative = next(page for page in kept if page['page_id'] == 1)
+    assert sorted(representative['categories']) == ['Archive', 'EU', 'Routers']
+    assert all(page['minhash'] for page in kept)
+
+
+def test_threshold_zero_keeps_every_page():
+    kept, clusters, skipped = dedupe_pages(_pages(), threshold=0)
+    assert (len(kept), clusters, skipped) == (4, 0, 0)
+
+
+def test_index_holds_one_page_per_cluster(vector_store):
+    result = build_index(vector_store, _pages(), dedup_threshold=0.7)
+    assert result['documents'] == 2
+    assert (result['duplicate_clusters'], result['duplicates_skipped']) == (1, 2)
+    assert vector_store.count() == 2
+    # A skipped copy's category finds the page that stands for it
+    matches = vector_store.search("Acme Router X1 password reset", top_k=2, categories=['EU'])
+    assert [match['page_id'] for match in matches] == [1]
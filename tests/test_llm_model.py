@@ -0,0 +1,93 @@
+import pytest
+
+from fake_llm import FakeLlama
+from llm_model import EarlyStop, LlamaModel, TurnStop
+
+
+class ScriptedLlama(FakeLlama):
+    """FakeLlama generating the given pieces, however long the budget"""
+
+    def __init__(self, pieces):
+        super().__init__(prefill_tps=0, decode_tps=0)
+        self.pieces = pieces
+
+    def _answer(self, prompt, max_tokens):
+        return self.pieces[:max_tokens]
+
+
+def _generate(pieces, max_tokens=64, early_stop=True):
+    llm = LlamaModel()
+    llm.config.EARLY_STOP = early_stop
+    llm.model = ScriptedLlama(pieces)
+    stats = {}
+    text = llm.generate_response("prompt", max_tokens, stats=stats)
+    return llm, text, stats
+
+
+def test_turn_stop_cuts_at_a_new_question_line():
+    turn_stop = TurnStop()
+    shown = ''.join(turn_stop.feed(piece) for piece in ["Hold reset.", "\n", "Quest", "ion: more?"])
+    assert shown == "Hold reset."
+    assert turn_stop.hit
+
+
+def test_turn_stop_keeps_question_inside_a_line():
+    turn_stop = TurnStop()
+    shown = ''.join(turn_stop.feed(piece) for piece in ["The Question: field ", "is optional.\n"])
+    shown += turn_stop.flush()
+    assert shown == "The Question: field is optional.\n"
+    assert not turn_stop.hit
+
+
+@pytest.mark.parametrize('early_stop', [True, False])
+def test_invented_turn_ends_generation_and_counts_as_saved(early_stop):
+    pieces = ["Hold ", "the ", "reset ", "button.", "\nQuestion: ", "How ", "else?"]
+    llm, text, stats = _generate(pieces, early_stop=early_stop)
+    assert text == "Hold the reset button."
+    assert stats['stop_reason'] == 'turn'
+    assert stats['tokens_saved'] == llm.config.MODEL_MAX_TOKENS - stats['completion_tokens']
+
+
+def test_question_mid_line_is_part_of_the_answer():
+    llm, text, stats = _generate(["Fill ", "in ", "the ", "Question: ", "field."])
+    assert text == "Fill in the Question: field."
+    assert stats['stop_reason'] == 'stop'
+    assert stats['tokens_saved'] == 0
+
+
+def test_budget_cut_saves_nothing():
+    llm, text, stats = _generate([f"word{i} " for i in range(40)], max_tokens=10)
+    assert stats['stop_reason'] == 'length'
+    assert stats['tokens_saved'] == 0 and stats['seconds_saved'] == 0.0
+
+
+def test_repeated_sentence_counts_as_saved():
+    sentence = ["Press ", "and ", "hold ", "reset. "]
+    llm, text, stats = _generate(sentence * 4)
+    assert text == "Press and hold reset."
+    assert stats['stop_reason'] == 'repeated_sentence'
+    assert stats['tokens_saved'] == llm.config.MODEL_MAX_TOKENS - stats['completion_tokens']
+
+
+def _early_stop(pieces):
+    early_stop = EarlyStop()
+    shown = ''.join(early_stop.feed(piece) for piece in pieces)
+    return early_stop, shown + early_stop.flush()
+
+
+@pytest.mark.parametrize('text', [
+    "| Model | Port | Speed | Range | Band | Price |\n|---|---|---|---|---|---|\n| X1 | 4 | 1G | 50m | 5GHz | 99 |\n",
+    "Call us at 0800 000 000 000 000 000 000 000 000 000 000 000 000 for help.",
+    "Separator: ================================================================\n",
+])
+def test_markup_and_digit_groups_are_not_loops(text):
+    early_stop, shown = _early_stop([text[i:i + 3] for i in range(0, len(text), 3)])
+    assert early_stop.reason is None
+    assert shown == text
+
+
+def test_repeated_words_are_a_loop():
+    early_stop, shown = _early_stop(["Press ", "OK. "] + ["reset ", "the ", "router "] * 10)
+    assert early_stop.reason == 'repetition'
+    assert shown.startswith("Press OK. ")
+    assert shown.count("reset the router") < 4
@@ -0,0 +1,72 @@
+import re
+
+import app as app_module
+import metrics
+
+# name{label="value",...} value
+SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:[a-zA-Z_]\w*="(?:[^"\\]|\\.)*",?)*\})? (\S+)$')
+
+
+def _parse(text):
+    """{family: type} and [(name, labels, value)] from a text exposition, checking every line"""
+    types, samples = {}, []
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            name, type_name = line[len('# TYPE '):].split(' ')
+            assert name not in types, f"{name} declared twice"
+            types[name] = type_name
+        elif line.startswith('# HELP '):
+            continue
+        else:
+            match = SAMPLE_RE.match(line)
+            assert match, f"not a sample line: {line!r}"
+            float(match.group(3))  # '+Inf' and 'NaN' parse too
+            samples.append((match.group(1), match.group(2) or '', match.group(3)))
+    return types, samples
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = metrics.Registry()
+    histogram = registry.histogram('demo_seconds', 'Demo latency', buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value, stage='db')
+
+    text = registry.render()
+    assert text.startswith("# HELP demo_seconds Demo latency\n# TYPE demo_seconds histogram\n")
+    assert text.endswith('\n')
+    types, samples = _parse(text)
+    assert types == {'demo_seconds': 'histogram'}
+    assert samples == [
+        ('demo_seconds_bucket', '{stage="db",le="0.1"}', '1'),
+        ('demo_seconds_bucket', '{stage="db",le="1"}', '3'),
+        ('demo_seconds_bucket', '{stage="db",le="+Inf"}', '4'),
+        ('demo_seconds_sum', '{stage="db"}', '4.25'),
+        ('demo_seconds_count', '{stage="db"}', '4'),
+    ]
+
+
+def test_label_values_are_escaped():
+    registry = metrics.Registry()
+    registry.counter('demo_total', 'Demo').inc(2, path='C:\\wiki "main"\nnext')
+    types, samples = _parse(registry.render())
+    assert types == {'demo_total': 'counter'}
+    assert samples == [('demo_total', '{path="C:\\\\wiki \\"main\\"\\nnext"}', '2')]
+
+
+def test_metrics_endpoint_serves_the_text_format(vector_chatbot, monkeypatch):
+    monkeypatch.setattr(app_module, 'chatbot', vector_chatbot)
+    client = app_module.app.test_client()
+    client.get('/health')
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert 'version=0.0.4' in response.content_type
+    types, samples = _parse(response.get_data(as_text=True))
+    families = {name for name, _, _ in samples}
+    # Every sample belongs to a declared family (histograms add _bucket/_sum/_count)
+    for name in families:
+        assert name in types or re.sub(r'_(bucket|sum|count)$', '', name) in types, name
+    assert types['wikichat_http_request_seconds'] == 'histogram'
+    documents = [value for name, _, value in samples if name == 'wikichat_vector_index_documents']
+    assert documents == [str(vector_chatbot.vector_store.count())]
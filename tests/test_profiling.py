@@ -0,0 +1,60 @@
+import os
+import threading
+
+from profiling import RequestProfiler
+
+
+def _busy():
+    return sum(i * i for i in range(20000))
+
+
+def test_profile_is_saved(tmp_path):
+    profiler = RequestProfiler(str(tmp_path), max_per_minute=2)
+    result, info = profiler.run(_busy, name='chat')
+    assert result == _busy()
+    assert os.path.exists(info['pstats']) and os.path.exists(info['collapsed'])
+    assert info['top']
+    assert sorted(profiler.list_profiles()) == sorted(os.path.basename(p) for p in (info['pstats'], info['collapsed']))
+
+
+def test_rate_limited_call_runs_unprofiled(tmp_path):
+    profiler = RequestProfiler(str(tmp_path), max_per_minute=1)
+    profiler.run(_busy)
+    result, info = profiler.run(lambda: 'answer')
+    assert result == 'answer'
+    assert info == {'skipped': 'rate limited (1 per minute)'}
+
+
+def test_arming_does_not_wait_for_a_running_profile(tmp_path):
+    profiler = RequestProfiler(str(tmp_path), max_per_minute=5)
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_chat():
+        started.set()
+        release.wait(5)
+        return 'slow'
+
+    thread = threading.Thread(target=profiler.run, args=(slow_chat,))
+    thread.start()
+    try:
+        assert started.wait(5)
+        # Both return at once although the profile still runs
+        profiler.arm(2)
+        assert profiler.take_armed()
+        result, info = profiler.run(lambda: 'other')
+        assert result == 'other'
+        assert info == {'skipped': 'another profile is running'}
+    finally:
+        release.set()
+        thread.join()
+    assert profiler.armed == 1
+
+
+def test_rate_limited_call_does_not_block_profiles(tmp_path):
+    profiler = RequestProfiler(str(tmp_path), max_per_minute=1)
+    profiler.run(_busy)
+    inside = []
+    result, info = profiler.run(lambda: inside.append(profiler.profile_lock.locked()))
+    assert info['skipped'].startswith('rate limited')
+    assert inside == [False]
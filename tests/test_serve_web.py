@@ -0,0 +1,93 @@
+import gzip
+import http.client
+import http.server
+import threading
+
+import pytest
+
+import serve_web
+from serve_web import StaticPage
+
+
+@pytest.fixture
+def page(tmp_path):
+    path = tmp_path / 'index.html'
+    path.write_text("<script>const apiPort = urlParams.get('api_port') || '5000';</script>" + "<p>wiki</p>" * 200)
+    return StaticPage(str(path), api_port=5123)
+
+
+@pytest.fixture
+def server(page, monkeypatch):
+    monkeypatch.setattr(serve_web.CustomHTTPRequestHandler, 'page', page)
+    monkeypatch.setattr(serve_web.CustomHTTPRequestHandler, 'log_message', lambda *args: None)
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), serve_web.CustomHTTPRequestHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield http.client.HTTPConnection('127.0.0.1', httpd.server_address[1], timeout=5)
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_page_has_the_api_port_and_a_matching_gzip(page):
+    assert b"|| '5123';" in page.body
+    assert gzip.decompress(page.gzipped) == page.body
+    assert len(page.gzipped) < len(page.body)
+
+
+@pytest.mark.parametrize('accept_encoding, gzipped', [
+    ('gzip, deflate, br', True),
+    ('br;q=1.0, GZIP;q=0.5', True),
+    ('*', True),
+    ('gzip;q=0', False),
+    ('deflate', False),
+    (None, False),
+])
+def test_gzip_only_when_accepted(page, accept_encoding, gzipped):
+    status, headers, body = page.respond(accept_encoding=accept_encoding)
+    assert status == 200
+    assert (headers.get('Content-Encoding') == 'gzip') is gzipped
+    assert body == (page.gzipped if gzipped else page.body)
+    assert headers['Content-Length'] == str(len(body))
+    assert headers['Vary'] == 'Accept-Encoding'
+
+
+@pytest.mark.parametrize('if_none_match, status', [
+    (None, 200),
+    ('"0123456789abcdef0123"', 200),
+    ('SAME', 304),
+    ('W/SAME', 304),
+    ('"other", SAME', 304),
+    ('*', 304),
+])
+def test_revalidation_by_etag(page, if_none_match, status):
+    if if_none_match:
+        if_none_match = if_none_match.replace('SAME', page.etag)
+    got, headers, body = page.respond(if_none_match=if_none_match)
+    assert got == status
+    assert headers['ETag'] == page.etag and headers['Cache-Control'] == 'no-cache'
+    if status == 304:
+        assert body == b'' and 'Content-Length' not in headers
+
+
+def test_server_answers_200_then_304_on_one_connection(server, page):
+    server.request('GET', '/', headers={'Accept-Encoding': 'gzip'})
+    response = server.getresponse()
+    assert response.status == 200
+    assert response.getheader('Content-Encoding') == 'gzip'
+    assert gzip.decompress(response.read()) == page.body
+    etag = response.getheader('ETag')
+
+    # Same (kept-alive) connection: the browser revalidates
+    server.request('GET', '/index.html?api_port=5000', headers={'If-None-Match': etag})
+    response = server.getresponse()
+    assert response.status == 304
+    assert response.read() == b''
+
+    server.request('HEAD', '/')
+    response = server.getresponse()
+    assert response.status == 200 and response.getheader('Content-Length') == str(len(page.body))
+    assert response.read() == b''
+
+    server.request('GET', '/config.py')
+    response = server.getresponse()
+    assert response.status == 404
+    response.read()
@@ -0,0 +1,111 @@
+import pytest
+
+import circuit_breaker
+from index_wiki import build_index, fetch_pages
+from vector_store import VectorStore
+
+
+def test_embed_returns_plain_floats(vector_store):
+    embeddings = vector_store.embed(["reset the router password", "warranty"])
+    assert len(embeddings) == 2
+    assert all(type(value) is float for embedding in embeddings for value in embedding)
+
+
+def test_search_with_precomputed_embedding(vector_store):
+    query = "How do I reset the password on the Acme Router X1?"
+    embedding = vector_store.embed([query])[0]
+
+    results = vector_store.search(query, top_k=3, query_embedding=embedding)
+    assert [r['page_id'] for r in results] == [r['page_id'] for r in vector_store.search(query, top_k=3)]
+    assert len(results) == 3
+    assert 'Router' in results[0]['title']
+    assert circuit_breaker.get('vector_store').status()['consecutive_failures'] == 0
+
+
+def test_search_batch_with_precomputed_embeddings(vector_store):
+    queries = ["Acme Router X1 password reset", "Globex warranty policy"]
+    results = vector_store.search_batch(queries, top_k=2, query_embeddings=vector_store.embed(queries))
+    assert [len(matches) for matches in results] == [2, 2]
+    assert vector_store.breaker.status()['state'] == 'closed'
+
+
+def _reader(store):
+    """A second store on the same directory, as another app process would open it"""
+    reader = VectorStore(persist_directory=store.persist_directory, embedding_function=store.embedding_function)
+    assert reader.initialize()
+    return reader
+
+
+def _page(page_id, title):
+    return {'page_id': page_id, 'title': title, 'namespace': 0, 'categories': [],
+            'content': f"{title}: unplug the device, wait ten seconds and plug it back in."}
+
+
+def test_reader_follows_the_pointer_to_a_new_version(vector_store):
+    reader = _reader(vector_store)
+    old_version = reader.active_version
+    assert not reader.reload_if_changed()
+
+    result = build_index(vector_store, [_page(9001, "Initech Modem M1 restart"), _page(9002, "Initech Modem M2 restart")],
+                         dedup_threshold=0)
+    # Until it checks the pointer the reader keeps answering from the old version
+    assert reader.active_version == old_version
+    assert reader.reload_if_changed()
+    assert reader.active_version == result['version'] != old_version
+    assert reader.count() == 2
+    assert reader.search("Initech Modem M1 restart", top_k=1)[0]['page_id'] == 9001
+    reader.executor.shutdown(wait=False)
+
+
+def test_failed_build_leaves_the_pointer_alone(vector_store, monkeypatch):
+    reader = _reader(vector_store)
+    active = vector_store.active_version
+    versions = vector_store.list_versions()
+    monkeypatch.setattr(vector_store, 'validate_version', lambda *args, **kwargs: False)
+
+    with pytest.raises(Exception, match="failed validation"):
+        build_index(vector_store, [_page(9001, "Initech Modem M1 restart")], dedup_threshold=0)
+    assert vector_store.active_version == active
+    assert vector_store.list_versions() == versions
+    assert not reader.reload_if_changed()
+    reader.executor.shutdown(wait=False)
+
+
+def _categories(wiki_db):
+    return {page['page_id']: set(page['categories']) for page in fetch_pages(wiki_db)}
+
+
+def test_category_filter_clauses(vector_store):
+    assert vector_store.build_filter() is None
+    assert vector_store.build_filter(['Acme']) == {'cat:Acme': True}
+    assert vector_store.build_filter(['Acme', 'Globex'], [0]) == {'$and': [
+        {'$or': [{'cat:Acme': True}, {'cat:Globex': True}]},
+        {'namespace': {'$in': [0]}},
+    ]}
+
+
+def test_category_filter_is_applied_inside_the_query(vector_store, wiki_db):
+    categories = _categories(wiki_db)
+    # A question about another brand still fills top_k from the filtered pages
+    results = vector_store.search("Globex Router X2 password reset", top_k=5, categories=['Acme'])
+    assert len(results) == 5
+    assert all('Acme' in categories[result['page_id']] for result in results)
+
+    results = vector_store.search("password reset", top_k=10, categories=['Acme', 'Initech'])
+    assert len(results) == 10
+    assert all(categories[result['page_id']] & {'Acme', 'Initech'} for result in results)
+    assert {'Acme', 'Initech'} <= set.union(*(categories[result['page_id']] for result in results))
+
+
+def test_filters_without_matching_pages_return_nothing(vector_store):
+    assert vector_store.search("password reset", top_k=5, categories=['No_such_category']) == []
+    assert vector_store.search("password reset", top_k=5, categories=['Acme'], namespaces=[1]) == []
+
+
+def test_chatbot_category_names_match_the_index(vector_chatbot, wiki_db):
+    categories = {page['title']: set(page['categories']) for page in fetch_pages(wiki_db)}
+    filters = vector_chatbot.make_filters(categories="category:installation guide")
+    assert filters == {'categories': ['Installation_guide']}
+    pages = vector_chatbot.retrieve_context("Acme Router X1 password reset", max_pages=3, filters=filters)
+    assert len(pages) == 3
+    assert all('Installation_guide' in categories[page['title']] for page in pages)
@@ -0,0 +1,96 @@
+import time
+
+import wikitext
+from wikitext import wikitext_sections, wikitext_to_text
+
+
+def test_template_parameters_leave_no_brace():
+    assert wikitext_to_text("a {{{param|x}}} b {{{1}}} c") == "a  b  c"
+
+
+def test_nested_templates_are_removed():
+    text = "Price {{price|{{currency|{{{1}}}}}|{{n}}}} today"
+    assert wikitext_to_text(text) == "Price  today"
+
+
+def test_links():
+    text = ("[[Page]] [[Page|label]] [[Page#Setup]] [[#Setup]] [[:Category:Phones]] "
+            "[[File:a.png|thumb|a [[Page|caption]]]][[Category:Phones]] [https://example.com site] "
+            "[https://example.com]")
+    assert wikitext_to_text(text) == (
+        "Page label Page Setup Category:Phones  site https://example.com")
+
+
+def test_table_rows_and_caption():
+    text = ('Intro\n{| class="wikitable"\n|+ Shipping\n! Region !! Days\n|-\n'
+            '| style="color:red" | EU || 3\n|-\n| US\n| 5\n|}\nAfter')
+    assert wikitext_to_text(text) == "Intro\n\nShipping\nRegion | Days\nEU | 3\nUS | 5\n\nAfter"
+
+
+def test_blocks_and_comments():
+    text = ("Fact<ref>Source [[x]]</ref>.<!-- hidden <b>x</b> --> "
+            "<nowiki>[[kept]] ''as is''</nowiki> <pre>{{raw}}</pre><gallery>a.png</gallery>")
+    assert wikitext_to_text(text) == "Fact. [[kept]] ''as is'' {{raw}}"
+
+
+def test_line_markup():
+    text = ("== Setup ==\n* one\n** two\n# three\n: indent\n----\n"
+            "'''bold''' and ''italic'' &amp; co<br/>\nnext")
+    assert wikitext_to_text(text) == (
+        "Setup:\n- one\n- two\n- three\nindent\n\nbold and italic & co\nnext")
+
+
+def test_redirect():
+    assert wikitext_to_text("#REDIRECT [[Target page]]") == "REDIRECT Target page"
+
+
+def test_max_chars():
+    assert wikitext_to_text("'''Hello''' world", max_chars=5) == "Hello"
+
+
+def _page(paragraphs: int) -> str:
+    return ''.join(f"== Part {i} ==\n'''Step {i}''' uses [[Router X{i}|the router]]{{{{note|{i}}}}}.\n\n"
+                   for i in range(paragraphs))
+
+
+def test_max_chars_converts_a_bounded_prefix(monkeypatch):
+    text = _page(50000)  # ~3 MB
+    expected = wikitext_to_text(_page(100))[:200]
+    converted = []
+    convert = wikitext._convert
+    monkeypatch.setattr(wikitext, '_convert', lambda source, **kwargs: converted.append(len(source))
+                        or convert(source, **kwargs))
+
+    snippet = wikitext_to_text(text, max_chars=200)
+    assert snippet == expected
+    # The first prefix and its double
+    assert converted == [wikitext._MIN_PREFIX, 2 * wikitext._MIN_PREFIX]
+
+
+def test_max_chars_grows_past_markup_cut_by_the_prefix():
+    # A template opened in the snippet closes far beyond the first prefixes
+    text = "Intro text. {{infobox|" + "x " * 20000 + "}} After the box. " + _page(200)
+    assert wikitext_to_text(text, max_chars=200) == wikitext_to_text(text)[:200]
+    # A comment that only ends later
+    text = "Start <!-- " + "hidden " * 3000 + "--> shown " + "word " * 2000
+    assert wikitext_to_text(text, max_chars=100) == wikitext_to_text(text)[:100]
+
+
+def test_sections():
+    text = "Lead text\n== Setup ==\nStep [[one]]\n=== Cables ===\nPlug in\n"
+    assert wikitext_sections(text) == [
+        ('', "Lead text"), ('Setup', "Step one"), ('Cables', "Plug in")]
+
+
+def _seconds(text: str) -> float:
+    start = time.perf_counter()
+    wikitext_to_text(text)
+    return time.perf_counter() - start
+
+
+def test_unclosed_markup_converts_in_linear_time():
+    for fragment in ("[[a ", "<ref>a ", "{{a ", "<!-- a "):
+        small = min(_seconds(fragment * 1000) for _ in range(3))
+        large = min(_seconds(fragment * 8000) for _ in range(3))
+        # Quadratic growth would make the large page ~64x slower
+        assert large < max(small, 0.001) * 24, fragment
@@ -0,0 +1,256 @@
+"""
+In-memory page title index
+
+Backs title autocompletion (/api/suggest) and exact-title matching during
+retrieval without touching the database per request:
+
+- a sorted list of (key, page_id, title length) with one key per title
+  word suffix, so a prefix lookup is a binary search ("pass" completes
+  "Password reset" and "Reset password")
+- a dict from normalized title to page_id for O(1) exact-title lookups
+
+The index is loaded from the page table once and then refreshed
+incrementally from page_touched. Refreshes build new structures and swap
+them in, so readers never need a lock.
+"""
+
+import bisect
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# Title markers the wiki uses for pages that should no longer be suggested
+_EXPIRED = re.compile(r'\((?:expired|outdated|moved)\)', re.IGNORECASE)
+_SPACES = re.compile(r'[\s_]+')
+_PUNCTUATION = '?!.,;:"\''
+
+
+def normalize_title(title) -> str:
+    """Lowercase title with underscores and runs of whitespace as single spaces"""
+    if isinstance(title, bytes):
+        title = title.decode('utf-8', errors='ignore')
+    return _SPACES.sub(' ', title).strip().lower()
+
+
+class TitleIndex:
+    """Sorted title index for prefix completion and exact title lookup"""
+
+    # Sorted keys examined per suggest() call; bounds latency for one-letter prefixes
+    MAX_SCAN = 500
+    # More changed pages than this in one refresh rebuilds the sorted list
+    # instead of inserting into it
+    MAX_INCREMENTAL = 1000
+    # Shortest phrase match_titles() looks up, so titles like "A" don't match everything
+    MIN_MATCH_CHARS = 3
+
+    def __init__(self):
+        self.pages = {}  # page_id -> entry
+        self.by_title = {}  # normalized title -> page_id
+        self.sorted_keys = []  # (word suffix of normalized title, page_id, title length)
+        self.max_title_words = 0
+        self.watermark = None  # newest page_touched seen
+        self.refresh_lock = threading.Lock()
+
+    @staticmethod
+    def _entry(row: Dict) -> Dict:
+        title = row['page_title']
+        if isinstance(title, bytes):
+            title = title.decode('utf-8', errors='ignore')
+        title = title.replace('_', ' ')
+        key = normalize_title(title)
+        return {
+            'page_id': row['page_id'],
+            'title': title,
+            'key': key,
+            'words': frozenset(key.split(' ')),
+            'redirect': bool(row.get('page_is_redirect')),
+            'expired': bool(_EXPIRED.search(title))
+        }
+
+    @staticmethod
+    def _suggestible(entry: Dict) -> bool:
+        return not entry['redirect'] and not entry['expired']
+
+    @staticmethod
+    def _sort_items(entry: Dict) -> List[Tuple[str, int, int]]:
+        """Sorted list items for an entry, one per title word suffix"""
+        key = entry['key']
+        words = key.split(' ')
+        return [(' '.join(words[i:]), entry['page_id'], len(key)) for i in range(len(words))]
+
+    @staticmethod
+    def _touched(row: Dict) -> Optional[str]:
+        touched = row.get('page_touched')
+        if isinstance(touched, bytes):
+            touched = touched.decode('ascii', errors='ignore')
+        return touched
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def load(self, db) -> bool:
+        """Build the index from scratch"""
+        rows = db.get_page_titles()
+        if rows is None:
+            return False
+        with self.refresh_lock:
+            self._apply(rows, replace=True)
+        print(f"✓ Title index loaded ({len(self.pages)} pages)")
+        return True
+
+    def refresh(self, db) -> int:
+        """Apply pages touched since the last load or refresh
+
+        Deleted pages don't show up in page_touched, so a page count that
+        no longer matches triggers a full reload. Returns the number of
+        pages updated.
+        """
+        if self.watermark is None:
+            return len(self.pages) if self.load(db) else 0
+
+        # >= so pages touched in the same second as the watermark are not missed
+        rows = db.get_page_titles(touched_since=self.watermark)
+        total = db.count_pages()
+        if rows is None or total is None:
+            return 0
+
+        with self.refresh_lock:
+            changed = [row for row in rows
+                       if self._changed(self.pages.get(row['page_id']), row)]
+            if changed:
+                self._apply(changed)
+            # Plain edits don't change titles but still move the watermark
+            for row in rows:
+                touched = self._touched(row)
+                if touched and touched > self.watermark:
+                    self.watermark = touched
+            if len(self.pages) != total:
+                rows = db.get_page_titles()
+                if rows is None:
+                    return len(changed)
+                self._apply(rows, replace=True)
+                return total
+        return len(changed)
+
+    def _changed(self, entry: Optional[Dict], row: Dict) -> bool:
+        if entry is None:
+            return True
+        new = self._entry(row)
+        return new['title'] != entry['title'] or new['redirect'] != entry['redirect']
+
+    def _apply(self, rows: List[Dict], replace: bool = False):
+        """Build new structures with rows applied and swap them in
+
+        With replace the rows are the complete page list.
+        """
+        if replace:
+            pages = {}
+            by_title = {}
+            watermark = None
+        else:
+            pages = dict(self.pages)
+            by_title = dict(self.by_title)
+            watermark = self.watermark
+        # Sorted keys are patched in place for small updates, re-sorted otherwise
+        incremental = not replace and len(rows) <= self.MAX_INCREMENTAL
+        if incremental:
+            sorted_keys = list(self.sorted_keys)
+
+        for row in rows:
+            entry = self._entry(row)
+            page_id = entry['page_id']
+            old = pages.pop(page_id, None)
+            if old:
+                if by_title.get(old['key']) == page_id:
+                    del by_title[old['key']]
+                if incremental and self._suggestible(old):
+                    for item in self._sort_items(old):
+                        i = bisect.bisect_left(sorted_keys, item)
+                        if i < len(sorted_keys) and sorted_keys[i] == item:
+                            del sorted_keys[i]
+
+            pages[page_id] = entry
+            # Redirects resolve to other pages, so they are not exact-title hits
+            if not entry['redirect']:
+                by_title[entry['key']] = page_id
+            if incremental and self._suggestible(entry):
+                for item in self._sort_items(entry):
+                    bisect.insort(sorted_keys, item)
+
+            touched = self._touched(row)
+            if touched and (watermark is None or touched > watermark):
+                watermark = touched
+
+        if not incremental:
+            sorted_keys = sorted(
+                item
+                for entry in pages.values() if self._suggestible(entry)
+                for item in self._sort_items(entry)
+            )
+
+        # Readers pick up the new structures with plain attribute loads
+        self.pages = pages
+        self.by_title = by_title
+        self.sorted_keys = sorted_keys
+        self.max_title_words = max((e['key'].count(' ') + 1 for e in pages.values()), default=0)
+        self.watermark = watermark
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[Dict]:
+        """Ranked completions for a partial title
+
+        Titles starting with the prefix rank above titles with a later word
+        starting with it; shorter titles rank first within each group.
+        Redirects and expired pages are never suggested.
+        """
+        prefix = normalize_title(prefix)
+        if not prefix or limit <= 0:
+            return []
+
+        sorted_keys = self.sorted_keys
+        pages = self.pages
+        start = bisect.bisect_left(sorted_keys, (prefix,))
+        best = {}
+        for key, page_id, title_length in sorted_keys[start:start + self.MAX_SCAN]:
+            if not key.startswith(prefix):
+                break
+            # Title start (0) before later word (1), then shorter titles, then order
+            rank = (len(key) != title_length, title_length, key)
+            if page_id not in best or rank < best[page_id]:
+                best[page_id] = rank
+
+        ranked = sorted(best, key=best.get)[:limit]
+        return [{'page_id': page_id, 'title': pages[page_id]['title']} for page_id in ranked]
+
+    def lookup(self, title: str) -> Optional[Dict]:
+        """Page entry for an exact (normalized) title, or None"""
+        page_id = self.by_title.get(normalize_title(title))
+        return self.pages.get(page_id) if page_id is not None else None
+
+    def match_titles(self, text: str) -> List[int]:
+        """Ids of pages whose full title appears as a phrase in the text
+
+        Every word n-gram of the text up to the longest title is one dict
+        lookup; longer matches are listed first.
+        """
+        words = [w.strip(_PUNCTUATION) for w in normalize_title(text).split(' ')]
+        words = [w for w in words if w]
+        by_title = self.by_title
+
+        matches = []
+        for n in range(min(self.max_title_words, len(words)), 0, -1):
+            for i in range(len(words) - n + 1):
+                phrase = ' '.join(words[i:i + n])
+                if len(phrase) < self.MIN_MATCH_CHARS:
+                    continue
+                page_id = by_title.get(phrase)
+                if page_id is not None and page_id not in matches:
+                    matches.append(page_id)
+        return matches
+
+    def get_stats(self) -> Dict:
+        """Index size and refresh watermark"""
+        return {
+            'pages': len(self.pages),
+            'suggest_keys': len(self.sorted_keys),
+            'watermark': self.watermark
+        }
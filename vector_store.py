@@ -1,38 +1,74 @@
 import chromadb
 from chromadb.utils import embedding_functions
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Optional, Tuple
+from datetime import datetime, timezone
 import os
 import json
+from config import Config
+from circuit_breaker import CircuitOpenError
+import circuit_breaker
+import metrics
 
 class VectorStore:
-    """Vector database for semantic search of wiki content"""
+    """Vector database for semantic search of wiki content
     
-    def __init__(self, persist_directory: str = "./chroma_db"):
+    Index builds are blue/green: each build goes into a new wiki_pages_vN
+    collection, and a pointer file (active_collection.json) names the one
+    being served. Switching versions is an atomic rename of that file, so
+    running servers never see a half-built index.
+    
+    Queries and embeddings are bounded by VECTOR_TIMEOUT and go through
+    the shared 'vector_store' circuit breaker; failures raise, so callers
+    can fall back to keyword search.
+    """
+    
+    COLLECTION_PREFIX = "wiki_pages"
+    POINTER_FILE = "active_collection.json"
+    # Metadata values must be scalars, so each category is a boolean key
+    CATEGORY_KEY_PREFIX = "cat:"
+    
+    def __init__(self, persist_directory: str = "./chroma_db", embedding_function=None):
         self.persist_directory = persist_directory
         self.client = None
         self.collection = None
-        self.embedding_function = None
+        # Any chromadb embedding function; defaults to all-MiniLM-L6-v2
+        self.embedding_function = embedding_function
+        self.active_version = None
+        self.pointer_mtime = None
+        self.breaker = circuit_breaker.get('vector_store')
+        self.timeout = Config.VECTOR_TIMEOUT
+        # Chroma and the embedding model run in-process: calls are made on
+        # these workers so a caller can stop waiting for a hung one
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='vector')
         
     def initialize(self):
-        """Initialize ChromaDB client and collection"""
+        """Initialize ChromaDB client and collection
+        
+        Can be called again after a failure: a client that still answers and
+        the embedding function are kept, so only what failed is rebuilt.
+        """
         try:
             # Create persist directory if it doesn't exist
             os.makedirs(self.persist_directory, exist_ok=True)
             
-            # Initialize ChromaDB client with persistence
-            self.client = chromadb.PersistentClient(path=self.persist_directory)
+            if self.client is not None:
+                try:
+                    self.client.heartbeat()
+                except Exception:
+                    self.client = None
+            if self.client is None:
+                # Initialize ChromaDB client with persistence
+                self.client = chromadb.PersistentClient(path=self.persist_directory)
             
             # Use sentence-transformers for embeddings (all-MiniLM-L6-v2 is fast and good)
-            self.embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-                model_name="all-MiniLM-L6-v2"
-            )
+            if self.embedding_function is None:
+                self.embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
+                    model_name="all-MiniLM-L6-v2"
+                )
             
-            # Get or create collection
-            self.collection = self.client.get_or_create_collection(
-                name="wiki_pages",
-                embedding_function=self.embedding_function,
-                metadata={"description": "MediaWiki pages for semantic search"}
-            )
+            # Open the active index version
+            self.load_active()
             
             print(f"✓ Vector store initialized with {self.collection.count()} documents")
             return True
@@ -41,9 +77,152 @@ class VectorStore:
             print(f"Vector store initialization error: {e}")
             return False
     
-    def index_pages(self, pages: List[Dict], batch_size: int = 100):
-        """Index wiki pages into vector database"""
-        if not self.collection:
+    @property
+    def pointer_path(self) -> str:
+        return os.path.join(self.persist_directory, self.POINTER_FILE)
+    
+    def _read_pointer(self) -> Optional[Dict]:
+        """Read the active version pointer, None if there is none yet"""
+        try:
+            with open(self.pointer_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+    
+    def load_active(self):
+        """Open the collection named by the pointer file
+        
+        Without a pointer (indexes built before versioning) the legacy
+        wiki_pages collection is used.
+        """
+        pointer = self._read_pointer()
+        if pointer:
+            self.collection = self.client.get_collection(
+                name=pointer['collection'],
+                embedding_function=self.embedding_function
+            )
+            self.active_version = pointer['version']
+            self.pointer_mtime = os.stat(self.pointer_path).st_mtime
+        else:
+            self.collection = self.client.get_or_create_collection(
+                name=self.COLLECTION_PREFIX,
+                embedding_function=self.embedding_function,
+                metadata={"description": "MediaWiki pages for semantic search"}
+            )
+            self.active_version = None
+            self.pointer_mtime = None
+    
+    def reload_if_changed(self) -> bool:
+        """Switch to a newly activated version; True if the collection changed"""
+        try:
+            mtime = os.stat(self.pointer_path).st_mtime
+        except FileNotFoundError:
+            return False
+        if mtime == self.pointer_mtime:
+            return False
+        
+        previous_version = self.active_version
+        self.load_active()
+        if self.active_version != previous_version:
+            print(f"✓ Switched to index version {self.active_version} ({self.collection.count()} documents)")
+            return True
+        return False
+    
+    def _collection_names(self) -> List[str]:
+        # chromadb >= 0.6 returns names, older versions return Collection objects
+        return [c if isinstance(c, str) else c.name for c in self.client.list_collections()]
+    
+    def list_versions(self) -> List[int]:
+        """Versions of all wiki_pages_vN collections, ascending"""
+        prefix = f"{self.COLLECTION_PREFIX}_v"
+        versions = []
+        for name in self._collection_names():
+            if name.startswith(prefix) and name[len(prefix):].isdigit():
+                versions.append(int(name[len(prefix):]))
+        return sorted(versions)
+    
+    def create_version(self) -> Tuple[int, object]:
+        """Create an empty collection for the next index version"""
+        if not self.client:
+            raise Exception("Vector store not initialized")
+        versions = self.list_versions()
+        version = max(versions + [self.active_version or 0]) + 1
+        collection = self.client.create_collection(
+            name=f"{self.COLLECTION_PREFIX}_v{version}",
+            embedding_function=self.embedding_function,
+            metadata={"description": "MediaWiki pages for semantic search"}
+        )
+        return version, collection
+    
+    def validate_version(self, collection, expected_count: int, smoke_query: Optional[str] = None) -> bool:
+        """Check a freshly built collection before it is activated"""
+        count = collection.count()
+        if count != expected_count:
+            print(f"❌ Validation failed: {count} documents, expected {expected_count}")
+            return False
+        if smoke_query:
+            results = collection.query(query_texts=[smoke_query], n_results=1, include=['metadatas'])
+            if not results['ids'] or not results['ids'][0]:
+                print(f"❌ Validation failed: no results for smoke query '{smoke_query}'")
+                return False
+        return True
+    
+    def activate(self, version: int):
+        """Atomically point readers at an index version and switch to it"""
+        name = f"{self.COLLECTION_PREFIX}_v{version}"
+        collection = self.client.get_collection(name=name, embedding_function=self.embedding_function)
+        pointer = {
+            'version': version,
+            'collection': name,
+            'count': collection.count(),
+            'activated_at': datetime.now(timezone.utc).isoformat()
+        }
+        
+        # Write to a temporary file and rename over the pointer (atomic on POSIX)
+        tmp_path = f"{self.pointer_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(pointer, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.pointer_path)
+        
+        self.collection = collection
+        self.active_version = version
+        self.pointer_mtime = os.stat(self.pointer_path).st_mtime
+        print(f"✓ Activated index version {version} ({pointer['count']} documents)")
+    
+    def garbage_collect(self, keep: int = 2) -> List[str]:
+        """Delete old index versions, keeping the newest `keep` (always the active one)
+        
+        The legacy wiki_pages collection is dropped once a version is active.
+        """
+        versions = self.list_versions()
+        keep_versions = set(versions[-keep:]) if keep > 0 else set()
+        if self.active_version is not None:
+            keep_versions.add(self.active_version)
+        
+        deleted = []
+        for version in versions:
+            if version not in keep_versions:
+                name = f"{self.COLLECTION_PREFIX}_v{version}"
+                self.client.delete_collection(name)
+                deleted.append(name)
+        if self.active_version is not None and self.COLLECTION_PREFIX in self._collection_names():
+            self.client.delete_collection(self.COLLECTION_PREFIX)
+            deleted.append(self.COLLECTION_PREFIX)
+        
+        if deleted:
+            print(f"✓ Removed old index versions: {', '.join(deleted)}")
+        return deleted
+    
+    def index_pages(self, pages: List[Dict], batch_size: int = 100, collection=None):
+        """Index wiki pages into vector database
+        
+        Pages go into the active collection unless another one is given
+        (e.g. a new version from create_version()).
+        """
+        collection = collection or self.collection
+        if not collection:
             raise Exception("Vector store not initialized")
         
         total_pages = len(pages)
@@ -68,14 +247,24 @@ class VectorStore:
                 
                 ids.append(page_id)
                 documents.append(combined_text)
-                metadatas.append({
+                metadata = {
                     'page_id': page['page_id'],
                     'title': title,
-                    'content_length': len(content)
-                })
+                    'content_length': len(content),
+                    'namespace': page.get('namespace', 0),
+                    'categories': '|'.join(page.get('categories', []))
+                }
+                for category in page.get('categories', []):
+                    metadata[self.CATEGORY_KEY_PREFIX + category] = True
+                # Near-duplicate signature (see dedup.py)
+                if page.get('minhash'):
+                    metadata['minhash'] = page['minhash']
+                if page.get('rev_timestamp'):
+                    metadata['rev_timestamp'] = page['rev_timestamp']
+                metadatas.append(metadata)
             
             # Add to collection
-            self.collection.add(
+            collection.add(
                 ids=ids,
                 documents=documents,
                 metadatas=metadatas
@@ -83,45 +272,181 @@ class VectorStore:
             
             print(f"  Indexed {min(i + batch_size, total_pages)}/{total_pages} pages")
         
-        print(f"✓ Indexing complete! Total documents: {self.collection.count()}")
+        print(f"✓ Indexing complete! Total documents: {collection.count()}")
     
-    def search(self, query: str, top_k: int = 3) -> List[Dict]:
-        """Semantic search for relevant wiki pages"""
-        if not self.collection:
-            raise Exception("Vector store not initialized")
+    def _call(self, func, *args, **kwargs):
+        """Call func on a worker, failing with TimeoutError after VECTOR_TIMEOUT seconds
         
+        A call that times out can't be cancelled; it finishes in the
+        background. Failures count against the circuit breaker.
+        """
+        future = self.executor.submit(func, *args, **kwargs)
         try:
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=top_k,
-                include=['metadatas', 'distances']
-            )
-            
-            # Format results
-            formatted_results = []
-            if results['ids'] and results['ids'][0]:
-                for i, page_id in enumerate(results['ids'][0]):
-                    metadata = results['metadatas'][0][i]
-                    distance = results['distances'][0][i] if 'distances' in results else None
-                    
-                    formatted_results.append({
-                        'page_id': metadata['page_id'],
-                        'title': metadata['title'],
-                        'similarity_score': 1 - distance if distance else None  # Convert distance to similarity
-                    })
-            
-            return formatted_results
-            
+            return future.result(timeout=self.timeout if self.timeout > 0 else None)
+        except FutureTimeoutError:
+            error = TimeoutError(f"Vector store did not answer within {self.timeout}s")
+            self.breaker.record_failure(error)
+            raise error
         except Exception as e:
-            print(f"Vector search error: {e}")
+            self.breaker.record_failure(e)
+            raise
+    
+    def _guarded(self, func, *args, probe: bool = False, **kwargs):
+        """_call() through the circuit breaker (probe calls go through even while it is open)"""
+        if not self.breaker.allow(probe):
+            raise CircuitOpenError("Vector store is unavailable (circuit open)")
+        result = self._call(func, *args, **kwargs)
+        self.breaker.record_success()
+        return result
+    
+    def ping(self) -> bool:
+        """True if the active collection answers (tried even while the breaker is open)"""
+        collection = self.collection
+        if not collection:
+            return False
+        try:
+            with metrics.span('vector.ping'):
+                self._guarded(collection.count, probe=True)
+            return True
+        except Exception as e:
+            print(f"Vector store ping failed: {e}")
+            return False
+    
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts with the same model used for the collection"""
+        if not self.embedding_function:
+            raise Exception("Vector store not initialized")
+        # A working embedding model doesn't mean Chroma answers: embeddings
+        # count as failures but never close the breaker
+        if not self.breaker.available():
+            circuit_breaker.note_unavailable(self.breaker.name)
+            raise CircuitOpenError("Vector store is unavailable (circuit open)")
+        with metrics.span('vector.embed'):
+            embeddings = self._call(self.embedding_function, texts)
+            # Chroma's embedding functions return numpy arrays, and query()
+            # rejects lists of numpy scalars: hand out plain floats
+            return [embedding.tolist() if hasattr(embedding, 'tolist') else [float(value) for value in embedding]
+                    for embedding in embeddings]
+    
+    def search(self, query: str, top_k: int = 3, query_embedding: Optional[List[float]] = None,
+               categories: Optional[List[str]] = None, namespaces: Optional[List[int]] = None) -> List[Dict]:
+        """Semantic search for relevant wiki pages
+        
+        Pass query_embedding to reuse an embedding the caller already computed.
+        categories (cl_to names, any of them) and namespaces restrict the
+        search inside the index, so top_k results all come from that scope.
+        """
+        query_embeddings = [query_embedding] if query_embedding is not None else None
+        return self.search_batch([query], top_k, query_embeddings, categories, namespaces)[0]
+    
+    def build_filter(self, categories: Optional[List[str]] = None,
+                     namespaces: Optional[List[int]] = None) -> Optional[Dict]:
+        """Chroma where clause for pages in any of the categories and namespaces"""
+        clauses = []
+        if categories:
+            category_clauses = [{self.CATEGORY_KEY_PREFIX + category: True} for category in categories]
+            clauses.append(category_clauses[0] if len(category_clauses) == 1 else {'$or': category_clauses})
+        if namespaces:
+            clauses.append({'namespace': {'$in': list(namespaces)}})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {'$and': clauses}
+    
+    def search_batch(self, queries: List[str], top_k: int = 3,
+                     query_embeddings: Optional[List[List[float]]] = None,
+                     categories: Optional[List[str]] = None,
+                     namespaces: Optional[List[int]] = None) -> List[List[Dict]]:
+        """Semantic search for several queries in one collection query
+        
+        Returns one result list per query, in order. Pass query_embeddings
+        (one per query) to reuse embeddings the caller already computed.
+        Filters are the same as for search(). Raises if the vector store
+        fails, times out or its circuit breaker is open.
+        """
+        # Local reference: a version switch may replace self.collection mid-query
+        collection = self.collection
+        if not collection:
+            raise Exception("Vector store not initialized")
+        if not queries:
             return []
+        
+        # Filters go into the query, not applied to its results
+        where = self.build_filter(categories, namespaces)
+        extra = {'where': where} if where else {}
+        with metrics.span('vector.search'):
+            if query_embeddings is not None:
+                results = self._guarded(
+                    collection.query,
+                    query_embeddings=query_embeddings,
+                    n_results=top_k,
+                    include=['metadatas', 'distances'],
+                    **extra
+                )
+            else:
+                results = self._guarded(
+                    collection.query,
+                    query_texts=queries,
+                    n_results=top_k,
+                    include=['metadatas', 'distances'],
+                    **extra
+                )
+        
+        # Format results
+        formatted_results = []
+        for row, ids in enumerate(results['ids'] or []):
+            matches = []
+            for i, page_id in enumerate(ids):
+                metadata = results['metadatas'][row][i]
+                distance = results['distances'][row][i] if 'distances' in results else None
+                
+                matches.append({
+                    'page_id': metadata['page_id'],
+                    'title': metadata['title'],
+                    'similarity_score': 1 - distance if distance else None,  # Convert distance to similarity
+                    'minhash': metadata.get('minhash', ''),
+                    'rev_timestamp': metadata.get('rev_timestamp', '')
+                })
+            formatted_results.append(matches)
+        
+        # Pad in case the collection returned fewer rows than queries
+        formatted_results.extend([] for _ in range(len(queries) - len(formatted_results)))
+        return formatted_results
+    
+    def get_documents(self, page_ids: List[int]) -> Dict[int, Dict]:
+        """Indexed title, text and categories of pages, by page_id (for when the database is unavailable)
+        
+        The text is what was indexed: the page at the time of the last build.
+        """
+        collection = self.collection
+        if not collection or not page_ids:
+            return {}
+        with metrics.span('vector.get_documents'):
+            results = self._guarded(collection.get, ids=[str(page_id) for page_id in page_ids],
+                                    include=['documents', 'metadatas'])
+        
+        documents = {}
+        for document, metadata in zip(results['documents'] or [], results['metadatas'] or []):
+            title = metadata['title']
+            # Documents are stored as "{title}. {title}. {content}"
+            prefix = f"{title}. {title}. "
+            documents[metadata['page_id']] = {
+                'title': title,
+                'content': document[len(prefix):] if document.startswith(prefix) else document,
+                'categories': [c for c in metadata.get('categories', '').split('|') if c]
+            }
+        return documents
     
     def clear(self):
-        """Clear all documents from the collection"""
+        """Clear all documents from the active collection
+        
+        Readers see an empty index until it is refilled; prefer building a
+        new version with create_version() and activate().
+        """
         if self.collection:
-            self.client.delete_collection("wiki_pages")
+            name = self.collection.name
+            self.client.delete_collection(name)
             self.collection = self.client.create_collection(
-                name="wiki_pages",
+                name=name,
                 embedding_function=self.embedding_function
             )
             print("Vector store cleared")
@@ -134,11 +459,18 @@ class VectorStore:
         return {
             'status': 'ready',
             'total_documents': self.collection.count(),
-            'persist_directory': self.persist_directory
+            'persist_directory': self.persist_directory,
+            'collection': self.collection.name,
+            'active_version': self.active_version
         }
     
+    def count(self) -> int:
+        """Documents in the active collection (bounded by VECTOR_TIMEOUT, through the breaker)"""
+        collection = self.collection
+        if not collection:
+            return 0
+        return self._guarded(collection.count)
+    
     def is_empty(self) -> bool:
         """Check if vector store is empty"""
-        if not self.collection:
-            return True
-        return self.collection.count() == 0
+        return self.count() == 0
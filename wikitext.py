@@ -0,0 +1,240 @@
+"""
+MediaWiki wikitext to plain text converter
+
+A fixed chain of regular expression passes, like the cleaner it replaces in
+WikiChatbot.clean_wiki_text, so the work per character stays in the regex
+engine. Passes are skipped when their markup doesn't occur in the page, and
+related markup shares a pass (all tags; all line-start markup).
+Over the old chain it adds:
+- Nested templates ({{a|{{b}}}}) and template parameters ({{{p}}}) are
+  removed innermost first, a bounded number of passes
+- Tables become one line per row with cells separated by " | "
+- File and category links, <ref>, <gallery>, comments and similar blocks
+  are dropped; <nowiki> and <pre> bodies are kept verbatim
+- Lists become "- " items, headings "Heading:" lines, entities are decoded
+Character classes never span an unclosed link or template, so malformed
+pages still convert in linear time. With max_chars only a prefix of the page
+is converted, grown until the result no longer changes.
+"""
+
+import re
+from functools import partial
+from html import unescape
+from typing import List, Optional, Tuple
+
+# Comments; blocks with their body (raw blocks are kept verbatim, the others
+# dropped); any other tag. One left-to-right pass, so a tag inside a comment
+# or a block goes with it. A block body never spans another tag of the same
+# name, so unclosed blocks don't make the pass quadratic.
+_MARKUP = re.compile(r'<!--[^-]*(?:-(?!->)[^-]*)*(?:-->|\Z)'
+                     r'|<((?i:nowiki|pre|syntaxhighlight|source|ref|references|gallery|timeline|math|score'
+                     r'|templatedata|imagemap))\b[^<>]*(?<!/)>([^<]*(?:<(?!/?(?i:\1)\b)[^<]*)*)</(?i:\1)\s*>'
+                     r'|</?([a-zA-Z][a-zA-Z0-9]*)\b[^<>]*>(\n?)')
+_RAW_TAGS = {'nowiki', 'pre', 'syntaxhighlight', 'source'}
+# A line break tag takes the newline after it along, so <br/>\n is one break
+_LINE_BREAK_TAGS = {'br', 'p', 'div', 'li', 'tr'}
+_RAW_PLACEHOLDER = re.compile(r'\x00(\d+)\x00')
+
+# Innermost templates; {{{parameters}}} are tried first so they don't leave a brace behind
+_TEMPLATE = re.compile(r'\{\{(?:\{[^{}]*\}|[^{}]*)\}\}')
+# Nesting deeper than this is left as it is
+_MAX_TEMPLATE_DEPTH = 8
+_MAGIC_WORD = re.compile(r'__[A-Z]+__')
+
+# Innermost [[target#section|label]] (every part optional), or an external [url label]
+_LINK = re.compile(r'\[(?:\[(:?)([^\[\]|#]*)(?:#([^\[\]|]*))?(?:\|([^\[\]]*))?\]'
+                   r'|((?:https?|ftp|mailto|news):[^\s\]]+)(?: +([^\]\n]*))?)\]')
+# File, image and category links carry no readable text ([[:Category:X]] does)
+_DROP_LINK_TARGET = re.compile(r'[ \t]*(?:file|image|media|category)[ \t]*:', re.IGNORECASE)
+
+# Line-start passes run on the text with a newline added in front, so each
+# pattern begins with a literal \n.
+# Innermost table: from a {| line to the first |} line with no {| in between
+_TABLE = re.compile(r'\n[ \t:]*\{\|[^\n]*(?:\n(?![ \t]*\|\})(?![ \t:]*\{\|)[^\n]*)*\n[ \t]*\|\}[^\n]*')
+# Within a table, rows start at |- lines and captions (|+), cells at | and !
+# line starts and at || and !!; they are marked \x1e and \x1f
+_TABLE_ROW = re.compile(r'\n[ \t]*\|(?:-[^\n]*|\+)')
+_TABLE_CELL = re.compile(r'\n[ \t]*[|!]')
+# 'style="..." | text': the attributes go
+_TABLE_CELL_ATTRIBUTES = re.compile(r'\x1f[^\x1e\x1f|\n]*=[^\x1e\x1f|\n]*\|')
+# Headings, #REDIRECT, list and indent markers, horizontal rules
+_LINE_MARKUP = re.compile(r'\n(?=[=#*:;-])(?:=+([^\n]*[^=\n])=+[ \t]*(?=\n)'
+                          r'|(#[ \t]*(?i:redirect)\b)'
+                          r'|([*#:;]+)[ \t]*'
+                          r'|-{4,})')
+_EMPHASIS = re.compile(r"'''''|'''|''")
+# For wikitext_sections headings are marked \x01heading\x02 instead
+_SECTION_MARK = re.compile(r'\x01([^\x02]*)\x02')
+
+# wikitext_to_text(max_chars=...) converts this many source characters per
+# output character first (at least _MIN_PREFIX), doubling while needed
+_PREFIX_FACTOR = 8
+_MIN_PREFIX = 2048
+# A prefix with more openers than closers was cut inside that markup
+_BRACKETS = (('{{', '}}'), ('[[', ']]'), ('{|', '|}'), ('<!--', '-->'))
+
+
+def _normalize(text: str) -> str:
+    """Trim trailing spaces and collapse runs of blank lines"""
+    # Splitting on lines is much cheaper here than a [ \t]+\n substitution,
+    # which the regex engine has to attempt at every space in the text
+    lines = []
+    blank = False
+    for line in text.split('\n'):
+        line = line.rstrip()
+        if line:
+            lines.append(line)
+            blank = False
+        elif not blank:
+            lines.append('')
+            blank = True
+    return '\n'.join(lines).strip()
+
+
+def _link_text(match) -> str:
+    colon, target, section, label, url, url_label = match.groups()
+    if url is not None:
+        return url_label if url_label is not None else url
+    if not colon and ':' in target and _DROP_LINK_TARGET.match(target):
+        return ''
+    if label is not None:
+        return label
+    return target.strip() or (section or '').strip()
+
+
+def _line_markup_text(match, heading_format: str = '\n{}:') -> str:
+    heading, redirect, markers = match.group(1, 2, 3)
+    if heading is not None:
+        return heading_format.format(heading.strip())
+    if redirect is not None:
+        return '\nREDIRECT'
+    # "- " when the innermost list level is * or #, nothing for : and ; indents
+    if markers is not None and markers[-1] in '*#':
+        return '\n- '
+    return '\n'
+
+
+_section_markup_text = partial(_line_markup_text, heading_format='\n\x01{}\x02')
+
+
+def _table_text(match) -> str:
+    """One line per row, cells joined by " | ", caption on its own line"""
+    table = match.group()
+    # The lines between the {| line and the |} line (the match starts with a newline)
+    body = table[table.index('\n', 1):table.rindex('\n')]
+    body = _TABLE_CELL.sub('\x1f', _TABLE_ROW.sub('\x1e', body))
+    body = body.replace('||', '\x1f').replace('!!', '\x1f')
+    if '=' in body:
+        body = _TABLE_CELL_ATTRIBUTES.sub('\x1f', body)
+    # Cell contents spanning several lines stay on the row's line
+    body = body.replace('\n', ' ')
+    lines = []
+    for row in body.split('\x1e'):
+        cells = row.split('\x1f')
+        # Text before the first cell is a caption
+        caption = cells[0].strip()
+        if caption:
+            lines.append(caption)
+        cells = ' | '.join(filter(None, map(str.strip, cells[1:])))
+        if cells:
+            lines.append(cells)
+    return '\n\n' + '\n'.join(lines) + '\n'
+
+
+def _convert(text: str, mark_sections: bool = False) -> str:
+    """All passes except normalization; headings become \\x01heading\\x02 with mark_sections"""
+    # Single-character guards: the str search for them is much faster than
+    # the regex engine's, and than a search for a longer string
+    raw: List[str] = []
+    if '<' in text:
+        def markup_text(match):
+            block, body, tag, newline = match.groups()
+            if tag is not None:
+                return '\n' if tag.lower() in _LINE_BREAK_TAGS else newline
+            if block is None or block.lower() not in _RAW_TAGS:
+                # A comment or a dropped block
+                return ''
+            raw.append(body)
+            return f"\x00{len(raw) - 1}\x00"
+        text = _MARKUP.sub(markup_text, text)
+
+    if '{' in text:
+        for _ in range(_MAX_TEMPLATE_DEPTH):
+            text, removed = _TEMPLATE.subn('', text)
+            if not removed or '{' not in text:
+                break
+    if '}' in text and '}}' in text:
+        # Stray closing braces from unbalanced templates
+        text = text.replace('}}', '')
+    if '_' in text:
+        text = _MAGIC_WORD.sub('', text)
+
+    if '[' in text:
+        text = _LINK.sub(_link_text, text)
+        if '[' in text:
+            # A second round for links in link labels and file captions
+            text = _LINK.sub(_link_text, text)
+
+    text = '\n' + text + '\n'
+    if '{' in text:
+        for _ in range(_MAX_TEMPLATE_DEPTH):
+            text, converted = _TABLE.subn(_table_text, text)
+            if not converted or '{' not in text:
+                break
+    text = _LINE_MARKUP.sub(_section_markup_text if mark_sections else _line_markup_text, text)
+    if "'" in text:
+        text = _EMPHASIS.sub('', text)
+    if '&' in text:
+        text = unescape(text)
+    if raw:
+        text = _RAW_PLACEHOLDER.sub(lambda match: raw[int(match.group(1))], text)
+    return text
+
+
+def wikitext_to_text(text: str, max_chars: Optional[int] = None) -> str:
+    """Convert wikitext to plain text (cut to max_chars, if given)
+
+    With max_chars a prefix of the source is converted, and twice that
+    prefix; once both give the same max_chars characters, markup cut at the
+    end of the prefix has no effect on them and the rest of the page isn't
+    converted. Prefixes cut inside a template, link, table or comment are
+    skipped.
+    """
+    if not text:
+        return ""
+    if max_chars is not None:
+        size = max(_MIN_PREFIX, max_chars * _PREFIX_FACTOR)
+        previous = None
+        while size < len(text):
+            prefix = text[:size]
+            size *= 2
+            if any(prefix.count(opener) > prefix.count(closer) for opener, closer in _BRACKETS):
+                previous = None
+                continue
+            result = _normalize(_convert(prefix))[:max_chars]
+            if result == previous and len(result) == max_chars:
+                return result
+            previous = result
+    result = _normalize(_convert(text))
+    if max_chars is not None:
+        result = result[:max_chars]
+    return result
+
+
+def wikitext_sections(text: str) -> List[Tuple[str, str]]:
+    """Convert wikitext and split it into (heading, body) sections
+
+    Text before the first heading is returned with an empty heading.
+    """
+    if not text:
+        return []
+    parts = _SECTION_MARK.split(_convert(text, mark_sections=True))
+    # parts alternate body, heading, body, ...
+    sections = []
+    headings = [''] + parts[1::2]
+    for heading, body in zip(headings, parts[0::2]):
+        heading = _normalize(heading)
+        body = _normalize(body)
+        if body or heading:
+            sections.append((heading, body))
+    return sections